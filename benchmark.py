@@ -0,0 +1,894 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+效能測試程式 - 不需要 YouTube API 金鑰與網路
+用法：
+    python benchmark.py keywords [--videos 5000]
+    python benchmark.py scripts [--texts 5000]
+    python benchmark.py scoring [--sizes 30 300 3000]
+    python benchmark.py flex [--bubbles 1 10 12]
+    python benchmark.py startup [--runs 5]
+    python benchmark.py search [--videos 2000] [--latency 0.1]
+    python benchmark.py pipeline [--latency 0.1] [--output results.json] [--compare old.json]
+    python benchmark.py schedule [--days 7]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import line_bot_youtube as bot_module
+from line_bot_youtube import youtube_bot
+from fake_youtube import FakeYouTube, load_fixture, make_synthetic_items
+
+
+class LegacyFilters:
+    """改寫前的篩選實作（每次呼叫重建關鍵字清單並逐一比對），作為效能與結果比較基準"""
+
+    def _is_etf_related(self, video_info):
+        """檢查是否為ETF相關影片"""
+        title = video_info['title'].lower()
+        channel = video_info['channel_title'].lower()
+
+        etf_keywords = [
+            'etf', '0050', '0056', '台灣50', '高股息',
+            '元大', '富邦', '投資', '理財', '股市',
+            '台湾50', '投资', '理财', '股市', '基金'
+        ]
+
+        exclude_keywords = [
+            'poetry', 'music', 'dance', 'game', 'funny'
+        ]
+
+        # 檢查是否包含中文字符
+        def has_chinese(text):
+            return any('\u4e00' <= char <= '\u9fff' for char in text)
+
+        # 檢查是否包含日文字符
+        def has_japanese(text):
+            return any('\u3040' <= char <= '\u309f' or '\u30a0' <= char <= '\u30ff' for char in text)
+
+        # 檢查是否包含韓文字符
+        def has_korean(text):
+            return any('\uac00' <= char <= '\ud7af' for char in text)
+
+        # 排除特定頻道（用於ETF日均觀看排行）
+        exclude_etf_channels = [
+            '芝麻開門', '芝麻开门', 'sesame', 'zhima'
+        ]
+
+        has_etf = any(keyword in title for keyword in etf_keywords)
+        has_exclude = any(keyword in title or keyword in channel for keyword in exclude_keywords)
+        has_exclude_etf_channel = any(channel_name in channel.lower() or channel_name in title.lower()
+                                     for channel_name in exclude_etf_channels)
+        is_chinese = has_chinese(video_info['title']) or has_chinese(video_info['channel_title'])
+        is_japanese = has_japanese(video_info['title']) or has_japanese(video_info['channel_title'])
+        is_korean = has_korean(video_info['title']) or has_korean(video_info['channel_title'])
+
+        return (has_etf and not has_exclude and not has_exclude_etf_channel and
+                is_chinese and not is_japanese and not is_korean)
+
+    def _is_taiwan_chinese_content(self, video_info):
+        """篩選條件2：只要台灣地區的影片，排除日文、韓文、簡體中文、香港、新加坡地區影片"""
+        title = video_info['title']
+        channel = video_info['channel_title']
+
+        # 檢查是否包含中文字符
+        def has_chinese(text):
+            return any('\u4e00' <= char <= '\u9fff' for char in text)
+
+        # 檢查是否包含日文字符
+        def has_japanese(text):
+            return any('\u3040' <= char <= '\u309f' or '\u30a0' <= char <= '\u30ff' for char in text)
+
+        # 檢查是否包含韓文字符
+        def has_korean(text):
+            return any('\uac00' <= char <= '\ud7af' for char in text)
+
+        # 檢查是否包含簡體中文特有字符（與繁體明顯不同的簡化字）
+        def has_simplified_chinese(text):
+            simplified_chars = [
+                '国', '经', '济', '车', '电', '华', '时', '实', '现', '发', '业', '报',
+                '库', '团', '专', '从', '个', '为', '书', '会', '学', '应', '开', '关',
+                '机', '进', '还', '过', '运', '门', '头', '面', '问', '题', '间', '样',
+                '种', '动', '变', '须', '员', '让', '线', '听', '谈', '议', '记', '产',
+                '总', '条', '只', '处', '费', '积', '历', '确', '响', '区', '传', '调',
+                '证', '单', '亿', '万', '块', '钱', '价', '购', '买', '卖', '销', '贸',
+                '计', '设', '备', '术', '技', '息', '信', '网', '站', '页'
+            ]
+            return any(char in text for char in simplified_chars)
+
+        # 檢查是否包含非台灣地區特有詞彙
+        def has_non_taiwan_terms(text):
+            non_taiwan_terms = [
+                # 香港澳門
+                '港股', '恆指', '恆生', '港元', 'HKEX', '港交所', '澳門', '澳幣', '港幣',
+                '香港', '廣東話', '粵語', '係', '咁', '嘅', '佢', '唔', '乜', '點解',
+                '茶餐廳', '屋企', '返工', '收工', '巴士', '的士', '搭車',
+
+                # 新加坡馬來西亞
+                '新加坡', '馬來西亞', '星洲', '大馬', '新馬', '令吉', '新元', 'SGX', 'KLCI',
+                '組屋', 'HDB', '小販中心', '巴剎',
+
+                # 大陸用詞
+                '人民幣', '滬深', '上證', '深證', '沪深', '人民币', '央行', '中行',
+                '微信', '支付寶', '支付宝', '淘寶', '淘宝', '百度', '騰訊', '腾讯',
+                '中国', '内地', '內地', '大陸', '大陆', '央視', '央视', '公安', '城管',
+                '戶口', '户口', '身份證', '身份证', '居委會', '居委会'
+            ]
+            return any(term in text for term in non_taiwan_terms)
+
+        # 基本語言檢查
+        is_chinese = has_chinese(title) or has_chinese(channel)
+        has_japanese = has_japanese(title) or has_japanese(channel)
+        has_korean = has_korean(title) or has_korean(channel)
+        has_simplified = has_simplified_chinese(title) or has_simplified_chinese(channel)
+        has_non_taiwan = has_non_taiwan_terms(title) or has_non_taiwan_terms(channel)
+
+        # 排除的娛樂內容關鍵字
+        exclude_keywords = [
+            'poetry', 'music', 'dance', 'game', 'funny', 'song', 'cover',
+            '音樂', '歌曲', '舞蹈', '遊戲', '娛樂', '綜藝', '歌手', '演唱',
+            '翻唱', '直播', 'live', 'stream', '聊天', 'chat'
+        ]
+
+        # 排除特定YouTuber頻道（用於教育分類）
+        exclude_channels = [
+            'RagaFinance財經台', 'ragafinance財經台', 'ragafinance', 'raga finance'
+        ]
+
+        has_exclude = any(keyword in title.lower() or keyword in channel.lower()
+                         for keyword in exclude_keywords)
+
+        has_exclude_channel = any(channel_name in channel.lower() or channel_name in title.lower()
+                                 for channel_name in exclude_channels)
+
+        # 台灣地區影片判定：
+        # 1. 必須是中文內容
+        # 2. 不能包含日文字符
+        # 3. 不能包含韓文字符
+        # 4. 不能包含簡體中文字符
+        # 5. 不能包含非台灣地區詞彙
+        # 6. 不能是娛樂內容
+        # 7. 不能是被排除的特定頻道
+
+        return (is_chinese and
+                not has_japanese and
+                not has_korean and
+                not has_simplified and
+                not has_non_taiwan and
+                not has_exclude and
+                not has_exclude_channel)
+
+    def _matches_topic(self, video_info, topic):
+        """檢查影片是否符合特定主題"""
+        if not topic:
+            return True
+
+        title = video_info['title'].lower()
+        channel = video_info['channel_title'].lower()
+
+        topic_keywords = {
+            'active': ['主動式', '主動型', 'AI', '科技', '全球', '國際', '新興', '成長', '價值', '新創', '雲端', '5G', '電動車', '綠能', 'ESG'],
+            'allocation': ['資產配置', '平衡型', '多重資產', '多元資產', '安聯', '收益成長', '組合基金', '目標日期', '60/40', '策略配置', '混合型', '穩健型'],
+            'market_cap': ['006208', '0050', '大盤', '加權', '市值', '規模', '大型股', '中型股', '台積電', '市值型'],
+            'dividend': ['高股息', '0056', '配息', '00919', '00878', '00929', '00713', '00940', '高息'],
+            'china_stock': ['0061', '006205', '006206', '006207', '00625k', '00633l', '00634r', '00636', '00636k', '00637l', '00638r', '00639', '00643', '00643k', '00650l', '00651r', '00655l', '00656r', '00665l', '00666r', '00700', '00703', '00739', '00743', '00752', '00753l', '00783', '008201', '00877', '00882', '00887', '陸股', '中國', '滬深', 'a股', '港股', '恆生']
+        }
+
+        keywords = topic_keywords.get(topic, [])
+        return any(keyword in title or keyword in channel for keyword in keywords)
+
+
+# 組合測試語料用的文字片段：各種關鍵字、日文、韓文、簡體字與一般文字
+FILLER_WORDS = [
+    '今天', '聊聊', '最新', '分析', '怎麼買', '存股', '新手', '教學', '懶人包', '觀點',
+    '週報', '盤後', '解析', '退休', 'Q&A', 'vlog', 'LIVE', 'Music', '投資日記',
+    'おすすめ', 'ニュース', '주식', '투자', '经济', '为什么', '学习', '台股', '美股',
+]
+
+
+def make_video_corpus(count, seed=0):
+    """產生 count 筆隨機標題與頻道名稱的影片資料"""
+    rng = random.Random(seed)
+    keyword_pool = (
+        bot_module.ETF_KEYWORDS + bot_module.ETF_EXCLUDE_KEYWORDS + bot_module.ETF_EXCLUDE_CHANNELS +
+        bot_module.NON_TAIWAN_TERMS + bot_module.TAIWAN_EXCLUDE_KEYWORDS + bot_module.TAIWAN_EXCLUDE_CHANNELS +
+        [keyword for keywords in bot_module.TOPIC_KEYWORDS.values() for keyword in keywords]
+    )
+    videos = []
+    for i in range(count):
+        words = rng.sample(FILLER_WORDS, 3) + rng.sample(keyword_pool, rng.randint(0, 3))
+        rng.shuffle(words)
+        title = ' '.join(words) + f' #{i}'
+        channel = rng.choice(['理財頻道', '投資台', 'RagaFinance財經台', '芝麻開門', 'ETF小學堂', 'Music TV',
+                              rng.choice(FILLER_WORDS) + rng.choice(keyword_pool)])
+        videos.append({'title': title[:80], 'channel_title': channel[:30]})
+    return videos
+
+
+def run_filters(bot, videos):
+    """對每部影片執行所有篩選條件，回傳判定結果"""
+    topics = list(bot_module.TOPIC_KEYWORDS)
+    return [
+        (bot._is_etf_related(video), bot._is_taiwan_chinese_content(video)) +
+        tuple(bot._matches_topic(video, topic) for topic in topics)
+        for video in videos
+    ]
+
+
+def legacy_keyword_flags(video):
+    """原本篩選條件中的關鍵字比對部分（每個關鍵字各掃描一次文字）"""
+    title, channel = video['title'], video['channel_title']
+    title_lower, channel_lower = title.lower(), channel.lower()
+    return (
+        any(keyword in title_lower for keyword in bot_module.ETF_KEYWORDS),
+        any(keyword in title_lower or keyword in channel_lower for keyword in bot_module.ETF_EXCLUDE_KEYWORDS),
+        any(keyword in channel_lower or keyword in title_lower for keyword in bot_module.ETF_EXCLUDE_CHANNELS),
+        any(term in title for term in bot_module.NON_TAIWAN_TERMS) or
+        any(term in channel for term in bot_module.NON_TAIWAN_TERMS),
+        any(keyword in title_lower or keyword in channel_lower for keyword in bot_module.TAIWAN_EXCLUDE_KEYWORDS),
+        any(keyword in channel_lower or keyword in title_lower for keyword in bot_module.TAIWAN_EXCLUDE_CHANNELS),
+    ) + tuple(
+        any(keyword in title_lower or keyword in channel_lower for keyword in keywords)
+        for keywords in bot_module.TOPIC_KEYWORDS.values()
+    )
+
+
+def compiled_keyword_flags(video):
+    """同上，改用編譯後的 keyword_hits 單次掃描"""
+    hits = bot_module.keyword_hits(video['title']) | bot_module.keyword_hits(video['channel_title'])
+    return (
+        'etf' in bot_module.keyword_hits(video['title']),
+        'etf_exclude' in hits,
+        'etf_exclude_channel' in hits,
+        'non_taiwan' in hits,
+        'taiwan_exclude' in hits,
+        'taiwan_exclude_channel' in hits,
+    ) + tuple(f'topic:{topic}' in hits for topic in bot_module.TOPIC_KEYWORDS)
+
+
+def legacy_script_flags(text):
+    """原本的 has_chinese / has_japanese / has_korean / has_simplified_chinese（逐字元比較）"""
+    simplified_chars = list(bot_module.SIMPLIFIED_CHINESE_CHARS)
+    return (
+        any('\u4e00' <= char <= '\u9fff' for char in text),
+        any('\u3040' <= char <= '\u309f' or '\u30a0' <= char <= '\u30ff' for char in text),
+        any('\uac00' <= char <= '\ud7af' for char in text),
+        any(char in text for char in simplified_chars),
+    )
+
+
+def profile_script_flags(text):
+    """同上，改用 script_profile 單次掃描"""
+    profile = bot_module.script_profile(text)
+    return (
+        bool(profile & bot_module.SCRIPT_HAN),
+        bool(profile & bot_module.SCRIPT_KANA),
+        bool(profile & bot_module.SCRIPT_HANGUL),
+        bool(profile & bot_module.SCRIPT_SIMPLIFIED),
+    )
+
+
+def make_script_corpus(count, seed=0):
+    """隨機產生包含各文字系統邊界字元的字串，加上影片標題語料"""
+    rng = random.Random(seed)
+    boundaries = [0x3040, 0x309f, 0x30a0, 0x30ff, 0x4e00, 0x9fff, 0xac00, 0xd7af]
+    pools = [
+        lambda: chr(rng.choice(boundaries) + rng.choice([-1, 0, 1])),
+        lambda: chr(rng.randint(0x4e00, 0x9fff)),
+        lambda: chr(rng.randint(0x3000, 0x3100)),
+        lambda: chr(rng.randint(0xabf0, 0xd7c0)),
+        lambda: rng.choice(bot_module.SIMPLIFIED_CHINESE_CHARS),
+        lambda: rng.choice('abcXYZ 0123 ,.!?'),
+    ]
+    texts = [''.join(rng.choice(pools)() for _ in range(rng.randint(0, 40))) for _ in range(count)]
+    for video in make_video_corpus(count, seed):
+        texts += [video['title'], video['channel_title']]
+    return texts
+
+
+def bench_scripts(args):
+    texts = make_script_corpus(args.texts)
+
+    def run_profile():
+        bot_module.script_profile.cache_clear()
+        return [profile_script_flags(text) for text in texts]
+
+    legacy_time, legacy_result = best_time(lambda: [legacy_script_flags(text) for text in texts], args.repeat)
+    profile_time, profile_result = best_time(run_profile, args.repeat)
+    mismatches = [text for text, a, b in zip(texts, legacy_result, profile_result) if a != b]
+
+    print(f"🧪 文字系統判斷：{len(texts)} 段文字（中文 / 日文 / 韓文 / 簡體字）")
+    print(f"   原本逐字元比較: {legacy_time * 1000:8.1f} ms  ({legacy_time / len(texts) * 1e6:.1f} µs/段)")
+    print(f"   單次掃描分類: {profile_time * 1000:8.1f} ms  ({profile_time / len(texts) * 1e6:.1f} µs/段)")
+    print(f"   加速: {legacy_time / profile_time:.1f}x")
+    print(f"   判定結果不一致: {len(mismatches)} 段 {'✅' if not mismatches else '❌'}")
+    for text in mismatches[:5]:
+        print(f"     {text!r}: {legacy_script_flags(text)} != {profile_script_flags(text)}")
+    return not mismatches
+
+
+def make_candidates(count, seed=0):
+    """產生 count 筆已取得統計資料的候選影片"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    return [{
+        'video_id': f'v{i:06d}',
+        'published_at': (now - timedelta(minutes=rng.randint(1, 14 * 24 * 60))).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'view_count': str(rng.choice([0, rng.randint(0, 100), rng.randint(0, 5_000_000)])),
+        'like_count': str(rng.randint(0, 50_000)),
+        'comment_count': str(rng.randint(0, 5_000)),
+    } for i in range(count)]
+
+
+def legacy_score(bot, video):
+    """原本逐筆計算排序指標的方式"""
+    video['view_per_day'] = bot._calculate_view_per_day(video)
+    video['engagement_score'] = int(video['like_count']) + int(video['comment_count']) * 2
+    video['engagement_rate'] = video['engagement_score'] / max(int(video['view_count']), 1) * 100
+    video['engagement_ratio'] = bot._calculate_engagement_ratio(video)
+
+
+def bench_scoring(args):
+    metrics = ['view_per_day', 'engagement_score', 'engagement_rate', 'engagement_ratio']
+    print(f"🧪 排序指標計算（逐筆 vs 批次向量化）")
+    ok = True
+    for count in args.sizes:
+        legacy_videos = make_candidates(count)
+        batch_videos = [dict(video) for video in legacy_videos]
+
+        legacy_time, _ = best_time(lambda: [legacy_score(youtube_bot, video) for video in legacy_videos], args.repeat)
+        batch_time, _ = best_time(lambda: youtube_bot._score_videos(batch_videos), args.repeat)
+        mismatches = sum(1 for a, b in zip(legacy_videos, batch_videos)
+                         if any(a[metric] != b[metric] for metric in metrics))
+        order_matches = all(
+            [v['video_id'] for v in sorted(legacy_videos, key=lambda x: x[metric], reverse=True)] ==
+            [v['video_id'] for v in sorted(batch_videos, key=lambda x: x[metric], reverse=True)]
+            for metric in metrics
+        )
+        ok = ok and mismatches == 0 and order_matches
+
+        print(f"   {count:6d} 部: 逐筆 {legacy_time * 1000:8.2f} ms | 批次 {batch_time * 1000:8.2f} ms | "
+              f"加速 {legacy_time / batch_time:5.1f}x | 數值不一致 {mismatches} | "
+              f"排序{'相同 ✅' if order_matches else '不同 ❌'}")
+    return ok
+
+
+def make_ranking_videos(count, seed=0):
+    """產生 count 部已計算排序指標的排行影片（標題含引號、反斜線、換行與 emoji 等需要跳脫的字元）"""
+    rng = random.Random(seed)
+    special = ['"', '\\', '\n', '🔥', '<b>', '&', '　', 'é']
+    videos = make_candidates(count, seed)
+    for video in videos:
+        video_id = video['video_id']
+        video.update({
+            'title': f"{rng.choice(FILLER_WORDS)} {rng.choice(special)} 0050 ETF {video_id}",
+            'channel_title': f"{rng.choice(FILLER_WORDS)}{rng.choice(special)}頻道",
+            'thumbnail': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            'url': f"https://www.youtube.com/watch?v={video_id}",
+        })
+    youtube_bot._score_videos(videos)
+    return videos
+
+
+def bench_flex(args):
+    print(f"🧪 Flex 輪播訊息：模型建立 + to_dict() vs 預先編譯範本")
+    ok = True
+    # ETF 熱門影片最多10張卡片，要求更多時以實際產生的張數顯示
+    for label, model_func, template_func, limit in [
+        ('ETF 熱門影片', bot_module.create_etf_carousel, bot_module.render_etf_carousel, 10),
+        ('互動排行', bot_module.create_engagement_carousel, bot_module.render_engagement_carousel, 12),
+    ]:
+        print(f"\n📊 {label}")
+        for count in args.bubbles:
+            videos = make_ranking_videos(count, seed=count)
+            model_time, model_result = best_time(lambda: model_func(videos, label).to_dict(), args.repeat)
+            template_time, template_result = best_time(lambda: template_func(videos, label), args.repeat)
+            identical = json.dumps(model_result) == json.dumps(template_result)
+            ok = ok and identical
+            print(f"   {min(count, limit):3d} 張卡片: 模型 {model_time * 1000:7.3f} ms | 範本 {template_time * 1000:7.3f} ms | "
+                  f"加速 {model_time / template_time:5.1f}x | 輸出{'相同 ✅' if identical else '不同 ❌'}")
+    return ok
+
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import line_bot_youtube
+imported = time.perf_counter()
+deferred = [name for name in ('numpy', 'pandas', 'pytz', 'googleapiclient') if name not in sys.modules]
+line_bot_youtube.youtube_bot.youtube
+client_built = time.perf_counter()
+line_bot_youtube.youtube_bot.warm_up()
+warmed_up = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'client': client_built - imported,
+    'warm_up': warmed_up - client_built,
+    'deferred': deferred,
+}))
+"""
+
+
+def run_startup(extra_args=()):
+    """在新的 Python 行程中 import line_bot_youtube，回傳 (計時結果, stderr)"""
+    result = subprocess.run([sys.executable, *extra_args, '-c', STARTUP_SCRIPT],
+                            capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 輸出，回傳 line_bot_youtube 直接 import 的套件與累計時間（秒）"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        if depth == 1:
+            modules.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(modules, key=lambda item: item[1], reverse=True)
+
+
+def bench_startup(args):
+    runs = [run_startup()[0] for _ in range(args.runs)]
+    print(f"🧪 冷啟動：新行程 import line_bot_youtube（{args.runs} 次取中位數）")
+    for key, label in [('import', 'import 模組'), ('client', '建立 YouTube client'),
+                       ('warm_up', '背景預熱（numpy 等）')]:
+        print(f"   {label}: {statistics.median(run[key] for run in runs) * 1000:8.1f} ms")
+    print(f"   import 時延後載入: {', '.join(runs[0]['deferred']) or '無'}")
+
+    _, stderr = run_startup(['-X', 'importtime'])
+    print(f"\n📊 import 時間分布（-X importtime，前 {args.top} 名）")
+    for name, seconds in parse_importtime(stderr)[:args.top]:
+        print(f"   {name:40s} {seconds * 1000:8.1f} ms")
+    return True
+
+
+SEARCH_SCENARIOS = [
+    ('ETF 日均觀看排行', lambda bot: bot.get_etf_videos_by_engagement()),
+    ('教育分類日均排行', lambda bot: bot.get_etf_videos_by_special_categories()),
+    ('高股息主題排行', lambda bot: bot.get_etf_videos_by_category('dividend')),
+]
+
+
+def make_offline_bot(youtube, max_concurrency):
+    """建立連到離線 API 替身的 YouTubeETFBot（配額帳本與頻道登記表只存在記憶體，不寫入正式環境的檔案）"""
+    bot = bot_module.YouTubeETFBot('offline', max_concurrency=max_concurrency)
+    bot.quota = bot_module.QuotaLedger(path=None)
+    bot.channels = bot_module.ChannelRegistry(path=None)
+    bot.youtube = youtube
+    return bot
+
+
+def bench_search(args):
+    items = load_fixture(args.fixture) if args.fixture else make_synthetic_items(args.videos)
+    source = args.fixture or f"隨機產生 {len(items)} 部"
+    print(f"🧪 離線搜尋：{source}影片，每次 API 呼叫延遲 {args.latency * 1000:.0f} ms")
+
+    ok = True
+    for label, scenario in SEARCH_SCENARIOS:
+        print(f"\n📊 {label}")
+        results = {}
+        for concurrency in (1, args.concurrency):
+            youtube = FakeYouTube(items, latency=args.latency, jitter=args.jitter)
+            bot = make_offline_bot(youtube, concurrency)
+            start = time.perf_counter()
+            videos = scenario(bot)
+            elapsed = time.perf_counter() - start
+            results[concurrency] = [video['video_id'] for video in videos]
+            calls = ', '.join(f"{method} {count}" for method, count in sorted(youtube.calls.items()))
+            print(f"   並行 {concurrency:2d}: {elapsed * 1000:8.1f} ms  {len(videos)} 部  "
+                  f"呼叫 {calls}  配額 {bot.quota.used()} 單位")
+        same = results[1] == results[args.concurrency]
+        ok = ok and same and bool(results[1])
+        print(f"   結果與依序執行相同: {'✅' if same else '❌'}{'' if results[1] else '  ❌ 沒有結果'}")
+
+    # 第一次 search() 成功後配額用盡：搜尋不應拋出例外，且帳本要標記為用盡
+    youtube = FakeYouTube(items, quota_exceeded_after=1)
+    bot = make_offline_bot(youtube, args.concurrency)
+    try:
+        videos = SEARCH_SCENARIOS[0][1](bot)
+        exhausted = bot.quota.remaining() == 0
+    except Exception as e:
+        print(f"   ❌ 配額錯誤未被處理: {e}")
+        videos, exhausted = [], False
+    ok = ok and exhausted
+    print(f"\n📊 配額用盡（第 2 次呼叫起回傳 403 quotaExceeded）")
+    print(f"   {len(videos)} 部影片，錯誤 {sum(youtube.errors.values())} 次，"
+          f"帳本標記用盡: {'✅' if exhausted else '❌'}")
+
+    # 增量搜尋：完整搜尋 → 只更新統計資料（不呼叫 search）→ 超過搜尋間隔後只搜尋高水位之後的影片
+    youtube = FakeYouTube(items)
+    bot = make_offline_bot(youtube, args.concurrency)
+    bot.incremental = True
+    print(f"\n📊 增量搜尋（{SEARCH_SCENARIOS[0][0]}，每次更新都略過排行快取）")
+    runs = []
+    for label in ('完整搜尋', '只更新統計資料', '高水位之後的增量搜尋'):
+        if label == '高水位之後的增量搜尋':
+            for window in bot._search_windows.values():
+                window.searched_at -= (bot_module.ranking_refresh_interval(72)
+                                       * bot_module.YOUTUBE_INCREMENTAL_SEARCH_EVERY)
+        calls_before, quota_before = dict(youtube.calls), bot.quota.used()
+        videos = bot.get_etf_videos_by_engagement(refresh=True)
+        runs.append([video['video_id'] for video in videos])
+        calls = ', '.join(f"{method} {count - calls_before.get(method, 0)}"
+                          for method, count in sorted(youtube.calls.items()))
+        print(f"   {label:12s} {len(videos)} 部  呼叫 {calls}  配額 {bot.quota.used() - quota_before} 單位")
+    # 增量搜尋的候選影片是完整搜尋的超集，排行可能加入新影片，只檢查不呼叫 search 時結果不變
+    same = runs[0] == runs[1]
+    ok = ok and same
+    print(f"   只更新統計資料時結果與完整搜尋相同: {'✅' if same else '❌'}")
+
+    # 頻道輪詢：第一次以關鍵字搜尋並登記上榜頻道，之後改讀頻道上傳清單，關鍵字搜尋只補足其他頻道
+    youtube = FakeYouTube(items)
+    bot = make_offline_bot(youtube, args.concurrency)
+    bot.channel_polling = True
+    bot.channels = bot_module.ChannelRegistry(path=None, min_hits=1)
+    print(f"\n📊 頻道上傳清單輪詢（{SEARCH_SCENARIOS[0][0]}，每次更新都略過排行快取）")
+    runs = []
+    for label in ('關鍵字搜尋並登記頻道', '輪詢上榜頻道'):
+        calls_before, quota_before = dict(youtube.calls), bot.quota.used()
+        videos = bot.get_etf_videos_by_engagement(refresh=True)
+        runs.append([video['video_id'] for video in videos])
+        calls = ', '.join(f"{method} {count - calls_before.get(method, 0)}"
+                          for method, count in sorted(youtube.calls.items()))
+        print(f"   {label:12s} {len(videos)} 部  呼叫 {calls}  配額 {bot.quota.used() - quota_before} 單位"
+              f"  登記頻道 {len(bot.channels.channels())} 個")
+    # 輪詢的候選影片與關鍵字搜尋不同，排行可能加入新影片，檢查關鍵字搜尋的排行大部分仍在
+    kept = len(set(runs[0]) & set(runs[1]))
+    same = bool(runs[0]) and kept * 2 >= len(runs[0])
+    ok = ok and same
+    print(f"   關鍵字搜尋的排行仍在輪詢結果中 {kept}/{len(runs[0])} 部: {'✅' if same else '❌'}")
+    return ok
+
+
+SCHEDULE_MODES = [
+    ('逐排行搜尋', {}),
+    ('增量搜尋', {'incremental': True}),
+    ('共用候選影片池', {'universe': True}),
+]
+
+
+def simulate_schedule(items, args, modes):
+    """以模擬時鐘執行 RankingScheduler args.days 天（從沒有快照的重新啟動開始），回傳每天用掉的配額單位"""
+    youtube = FakeYouTube(items)
+    bot = make_offline_bot(youtube, args.concurrency)
+    # 帳本不設上限，只記錄用量（模擬的日期不會讓帳本歸零）
+    bot.quota = bot_module.QuotaLedger(path=None, daily_limit=10 ** 9)
+    for name, value in modes.items():
+        setattr(bot, name, value)
+    scheduler = bot_module.RankingScheduler(bot_module.RankingSnapshotStore(path=None), lock_path=None)
+
+    start = time.time()
+    clock = [start]
+    daily = []
+    with mock.patch.object(bot_module, 'youtube_bot', bot), \
+            mock.patch.object(bot_module.time, 'time', lambda: clock[0]):
+        for day in range(1, args.days + 1):
+            used_before = bot.quota.used()
+            while clock[0] < start + day * 86400:
+                next_due = scheduler.run_due_rankings()
+                clock[0] = max(next_due, clock[0] + 1)
+            daily.append(bot.quota.used() - used_before)
+    return daily
+
+
+def bench_schedule(args):
+    items = load_fixture(args.fixture) if args.fixture else make_synthetic_items(args.videos)
+    print(f"🧪 排程模擬：重新啟動後執行 {args.days} 天（3日排行每 "
+          f"{bot_module.RANKING_REFRESH_INTERVAL_SHORT / 3600:g} 小時、7日排行每 "
+          f"{bot_module.RANKING_REFRESH_INTERVAL_LONG / 3600:g} 小時更新），"
+          f"每日配額 {bot_module.YOUTUBE_DAILY_QUOTA} 單位")
+
+    steady = {}
+    for label, modes in SCHEDULE_MODES:
+        daily = simulate_schedule(items, args, modes)
+        steady[label] = statistics.mean(daily[1:] or daily)
+        print(f"\n📊 {label}")
+        print(f"   每日配額: {', '.join(str(units) for units in daily)}")
+        print(f"   第 2 天起平均 {steady[label]:.0f} 單位/日"
+              f"{'' if steady[label] <= bot_module.YOUTUBE_DAILY_QUOTA else '  ❌ 超過每日配額'}")
+
+    baseline = steady[SCHEDULE_MODES[0][0]]
+    ok = all(units <= bot_module.YOUTUBE_DAILY_QUOTA for units in steady.values())
+    for label, units in list(steady.items())[1:]:
+        saved = units < baseline
+        ok = ok and saved
+        print(f"\n💰 {label}比逐排行搜尋每日省下 {baseline - units:.0f} 單位"
+              f"（{(baseline - units) / baseline:.0%}）: {'✅' if saved else '❌'}")
+    return ok
+
+
+class StageProfiler:
+    """包裝 bot 實例上的方法，累計各階段的呼叫次數、經過時間與 CPU 時間（執行緒內）
+
+    並行執行時各階段的經過時間會重疊，總和可能大於整體經過時間。
+    """
+
+    STAGES = {
+        'extract': ['_extract_video_info'],
+        'filter': ['_is_etf_related', '_is_taiwan_chinese_content', '_matches_topic'],
+        'score': ['_score_videos'],
+    }
+
+    def __init__(self, bot):
+        self.stats = {}
+        self._lock = threading.Lock()
+        for stage, names in self.STAGES.items():
+            for name in names:
+                setattr(bot, name, self._wrap(self._constant(stage), getattr(bot, name)))
+        # API 呼叫依方法分成 api:search、api:videos（含等待回應的時間）
+        bot._execute = self._wrap(lambda api_request, method: f"api:{method}", bot._execute)
+
+    @staticmethod
+    def _constant(stage):
+        return lambda *args, **kwargs: stage
+
+    def _wrap(self, stage_of, func):
+        def wrapper(*args, **kwargs):
+            stage = stage_of(*args, **kwargs)
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._add(stage, time.perf_counter() - wall, time.thread_time() - cpu)
+        return wrapper
+
+    def _add(self, stage, wall, cpu):
+        with self._lock:
+            stats = self.stats.setdefault(stage, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+            stats['calls'] += 1
+            stats['wall'] += wall
+            stats['cpu'] += cpu
+
+
+def run_ranking(bot, spec):
+    """同 line_bot_youtube.fetch_ranking，但使用指定的 bot"""
+    if spec['kind'] == 'engagement':
+        return bot.get_etf_videos_by_engagement(hours_ago=spec['hours_ago'], max_results=12)
+    if spec['kind'] == 'special_categories':
+        return bot.get_etf_videos_by_special_categories(hours_ago=spec['hours_ago'], max_results=12)
+    return bot.get_etf_videos_by_category(spec['topic'], hours_ago=spec['hours_ago'], max_results=12)
+
+
+def make_pipeline_bot(items, args):
+    """建立沒有快取的 bot，回傳 (bot, 離線 API 替身, StageProfiler)"""
+    youtube = FakeYouTube(items, latency=args.latency, jitter=args.jitter, seed=args.seed)
+    bot = make_offline_bot(youtube, args.concurrency)
+    bot.universe = args.universe
+    return bot, youtube, StageProfiler(bot)
+
+
+def profile_ranking(pipeline, spec):
+    """執行一次排行，回傳整體與各階段的數據（只計算這次排行新增的 API 呼叫、配額與階段耗時）"""
+    bot, youtube, profiler = pipeline
+    calls_before, quota_before = dict(youtube.calls), bot.quota.used()
+    stages_before = {stage: dict(stats) for stage, stats in profiler.stats.items()}
+    wall, cpu = time.perf_counter(), time.process_time()
+    videos = run_ranking(bot, spec)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    stages = {}
+    for stage, stats in profiler.stats.items():
+        before = stages_before.get(stage, {})
+        delta = {key: value - before.get(key, 0) for key, value in stats.items()}
+        if delta['calls']:
+            stages[stage] = delta
+    return {
+        'wall': wall,
+        'cpu': cpu,
+        'videos': len(videos),
+        'video_ids': [video['video_id'] for video in videos],
+        'api_calls': {method: count - calls_before.get(method, 0) for method, count in youtube.calls.items()
+                      if count > calls_before.get(method, 0)},
+        'quota_units': bot.quota.used() - quota_before,
+        'stages': stages,
+    }
+
+
+def summarize_runs(runs):
+    """多次執行取中位數（各階段數據取平均）"""
+    stages = {}
+    for run in runs:
+        for stage, stats in run['stages'].items():
+            total = stages.setdefault(stage, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+            for key, value in stats.items():
+                total[key] += value / len(runs)
+    return {
+        'wall': statistics.median(run['wall'] for run in runs),
+        'cpu': statistics.median(run['cpu'] for run in runs),
+        'videos': runs[-1]['videos'],
+        'video_ids': runs[-1]['video_ids'],
+        'api_calls': runs[-1]['api_calls'],
+        'quota_units': runs[-1]['quota_units'],
+        'stages': dict(sorted(stages.items())),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def bench_pipeline(args):
+    items = load_fixture(args.fixture) if args.fixture else make_synthetic_items(args.videos, seed=args.seed)
+    print(f"🧪 排行流程端對端測試：{len(items)} 部影片，API 延遲 {args.latency * 1000:.0f} ms，"
+          f"並行 {args.concurrency}，每個排行執行 {args.repeat} 次"
+          f"{'，所有排行共用候選影片池' if args.universe else ''}")
+
+    # 使用共用候選影片池時，同一輪的所有排行共用一個 bot（第一個排行負責搜尋）
+    runs = {ranking_key: [] for ranking_key in bot_module.RANKINGS}
+    for _ in range(args.repeat):
+        shared = make_pipeline_bot(items, args) if args.universe else None
+        for ranking_key, spec in bot_module.RANKINGS.items():
+            runs[ranking_key].append(profile_ranking(shared or make_pipeline_bot(items, args), spec))
+
+    results = {}
+    for ranking_key, ranking_runs in runs.items():
+        result = results[ranking_key] = summarize_runs(ranking_runs)
+        calls = ', '.join(f"{method} {count}" for method, count in sorted(result['api_calls'].items()))
+        print(f"\n📊 {ranking_key}: {result['wall'] * 1000:8.1f} ms（CPU {result['cpu'] * 1000:.1f} ms）"
+              f"  {result['videos']} 部  呼叫 {calls}  配額 {result['quota_units']} 單位")
+        for stage, stats in result['stages'].items():
+            print(f"   {stage:12s} {stats['calls']:6.0f} 次  經過 {stats['wall'] * 1000:8.1f} ms"
+                  f"  CPU {stats['cpu'] * 1000:8.1f} ms")
+
+    report = {
+        'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'settings': {key: getattr(args, key) for key in
+                     ('videos', 'fixture', 'latency', 'jitter', 'concurrency', 'repeat', 'seed', 'universe')},
+        'total_quota_units': sum(result['quota_units'] for result in results.values()),
+        'rankings': results,
+    }
+    print(f"\n💰 所有排行更新一次共 {report['total_quota_units']} 單位配額")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 結果已儲存至 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\n📈 與 {args.compare}（{baseline.get('git_revision')}，{baseline.get('created_at')}）比較")
+        for ranking_key, result in results.items():
+            old = baseline['rankings'].get(ranking_key)
+            if old is None:
+                continue
+            # 排行內容的差異（例如共用候選影片池與逐排行搜尋比較）：先前結果中仍在排行內的影片數
+            same = ''
+            if 'video_ids' in old:
+                kept = len(set(old['video_ids']) & set(result['video_ids']))
+                same = f"  排行相同 {kept}/{len(old['video_ids'])} 部"
+            print(f"   {ranking_key:12s} 經過 {old['wall'] * 1000:8.1f} → {result['wall'] * 1000:8.1f} ms"
+                  f"  CPU {old['cpu'] * 1000:7.1f} → {result['cpu'] * 1000:7.1f} ms"
+                  f"  配額 {old['quota_units']} → {result['quota_units']}{same}")
+    return all(result['videos'] for result in results.values())
+
+
+def best_time(func, repeat):
+    """執行 repeat 次，回傳最短時間（秒）與最後一次的結果"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_keywords(args):
+    videos = make_video_corpus(args.videos)
+    legacy = LegacyFilters()
+
+    def run_compiled():
+        bot_module.keyword_hits.cache_clear()
+        return run_filters(youtube_bot, videos)
+
+    def run_compiled_keywords():
+        bot_module.keyword_hits.cache_clear()
+        return [compiled_keyword_flags(video) for video in videos]
+
+    print(f"🧪 關鍵字篩選：{len(videos)} 部影片 × (ETF + 台灣 + {len(bot_module.TOPIC_KEYWORDS)} 個主題)")
+    ok = True
+    for label, legacy_func, compiled_func in [
+        ('關鍵字比對', lambda: [legacy_keyword_flags(video) for video in videos], run_compiled_keywords),
+        ('完整篩選條件', lambda: run_filters(legacy, videos), run_compiled),
+    ]:
+        legacy_time, legacy_result = best_time(legacy_func, args.repeat)
+        compiled_time, compiled_result = best_time(compiled_func, args.repeat)
+        mismatches = sum(1 for a, b in zip(legacy_result, compiled_result) if a != b)
+        ok = ok and mismatches == 0
+
+        print(f"\n📊 {label}")
+        print(f"   原本逐一比對: {legacy_time * 1000:8.1f} ms  ({legacy_time / len(videos) * 1e6:.1f} µs/部)")
+        print(f"   編譯後單次掃描: {compiled_time * 1000:8.1f} ms  ({compiled_time / len(videos) * 1e6:.1f} µs/部)")
+        print(f"   加速: {legacy_time / compiled_time:.1f}x")
+        print(f"   判定結果不一致: {mismatches} 部 {'✅' if mismatches == 0 else '❌'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LINE Bot YouTube ETF 效能測試')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    keywords_parser = subparsers.add_parser('keywords', help='關鍵字篩選微基準測試')
+    keywords_parser.add_argument('--videos', type=int, default=5000, help='測試語料的影片數量')
+    keywords_parser.add_argument('--repeat', type=int, default=5, help='重複次數（取最短時間）')
+    keywords_parser.set_defaults(func=bench_keywords)
+
+    scripts_parser = subparsers.add_parser('scripts', help='文字系統判斷的結果比對與微基準測試')
+    scripts_parser.add_argument('--texts', type=int, default=5000, help='隨機字串數量')
+    scripts_parser.add_argument('--repeat', type=int, default=5, help='重複次數（取最短時間）')
+    scripts_parser.set_defaults(func=bench_scripts)
+
+    scoring_parser = subparsers.add_parser('scoring', help='排序指標逐筆與批次計算的比較')
+    scoring_parser.add_argument('--sizes', type=int, nargs='+', default=[30, 300, 3000, 30000],
+                                help='候選影片數量')
+    scoring_parser.add_argument('--repeat', type=int, default=5, help='重複次數（取最短時間）')
+    scoring_parser.set_defaults(func=bench_scoring)
+
+    flex_parser = subparsers.add_parser('flex', help='Flex 輪播訊息的模型與範本渲染比較')
+    flex_parser.add_argument('--bubbles', type=int, nargs='+', default=[1, 10, 12], help='卡片數量')
+    flex_parser.add_argument('--repeat', type=int, default=50, help='重複次數（取最短時間）')
+    flex_parser.set_defaults(func=bench_flex)
+
+    startup_parser = subparsers.add_parser('startup', help='冷啟動時間與 import 時間分布')
+    startup_parser.add_argument('--runs', type=int, default=5, help='啟動次數（取中位數）')
+    startup_parser.add_argument('--top', type=int, default=10, help='列出 import 時間最長的前幾個套件')
+    startup_parser.set_defaults(func=bench_startup)
+
+    search_parser = subparsers.add_parser('search', help='以離線 YouTube API 替身執行完整的排行搜尋')
+    search_parser.add_argument('--videos', type=int, default=2000, help='隨機產生的影片數量')
+    search_parser.add_argument('--fixture', help='改用錄製的 videos().list 影片資料（JSON）')
+    search_parser.add_argument('--latency', type=float, default=0.1, help='每次 API 呼叫的延遲（秒）')
+    search_parser.add_argument('--jitter', type=float, default=0.0, help='額外隨機延遲的上限（秒）')
+    search_parser.add_argument('--concurrency', type=int, default=bot_module.YOUTUBE_SEARCH_CONCURRENCY,
+                               help='與依序執行比較的並行查詢數量')
+    search_parser.set_defaults(func=bench_search)
+
+    pipeline_parser = subparsers.add_parser('pipeline', help='所有排行的端對端延遲、API 呼叫、配額與各階段 CPU 時間')
+    pipeline_parser.add_argument('--videos', type=int, default=2000, help='隨機產生的影片數量')
+    pipeline_parser.add_argument('--fixture', help='改用錄製的 videos().list 影片資料（JSON）')
+    pipeline_parser.add_argument('--latency', type=float, default=0.1, help='每次 API 呼叫的延遲（秒）')
+    pipeline_parser.add_argument('--jitter', type=float, default=0.0, help='額外隨機延遲的上限（秒）')
+    pipeline_parser.add_argument('--concurrency', type=int, default=bot_module.YOUTUBE_SEARCH_CONCURRENCY,
+                                 help='並行查詢數量')
+    pipeline_parser.add_argument('--repeat', type=int, default=3, help='每個排行的執行次數（取中位數）')
+    pipeline_parser.add_argument('--seed', type=int, default=0, help='隨機資料與延遲的種子')
+    pipeline_parser.add_argument('--universe', action='store_true', help='所有排行共用一次搜尋的候選影片池')
+    pipeline_parser.add_argument('--output', help='將結果存成 JSON 檔')
+    pipeline_parser.add_argument('--compare', help='與先前存下的 JSON 結果比較')
+    pipeline_parser.set_defaults(func=bench_pipeline)
+
+    schedule_parser = subparsers.add_parser('schedule', help='以模擬時鐘執行排程器，比較各搜尋模式的每日配額用量')
+    schedule_parser.add_argument('--videos', type=int, default=2000, help='隨機產生的影片數量')
+    schedule_parser.add_argument('--fixture', help='改用錄製的 videos().list 影片資料（JSON）')
+    schedule_parser.add_argument('--days', type=int, default=7, help='模擬的天數（第 1 天包含重新啟動後的完整更新）')
+    schedule_parser.add_argument('--concurrency', type=int, default=bot_module.YOUTUBE_SEARCH_CONCURRENCY,
+                                 help='並行查詢數量')
+    schedule_parser.set_defaults(func=bench_schedule)
+
+    args = parser.parse_args()
+    ok = args.func(args)
+    raise SystemExit(0 if ok is not False else 1)
+
+
+if __name__ == "__main__":
+    main()
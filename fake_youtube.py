@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+離線 YouTube Data API 替身 - 不需要 API 金鑰、網路與配額
+模擬 search().list、videos().list 與 playlistItems().list（頻道上傳清單），可使用錄製的影片資料或隨機產生的資料，
+並可加入延遲與配額錯誤。
+
+用法：
+    from fake_youtube import FakeYouTube, make_synthetic_items
+    youtube_bot.youtube = FakeYouTube(make_synthetic_items(2000), latency=0.1)
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+# search().list 的 maxResults 預設值與上限（同 YouTube Data API）
+SEARCH_DEFAULT_MAX_RESULTS = 5
+SEARCH_MAX_RESULTS_LIMIT = 50
+
+# 隨機影片使用的標題詞彙、頻道名稱與分類（新聞與政治 25、教育 27、娛樂 24、音樂 10）
+SYNTHETIC_WORDS = [
+    '台灣ETF', 'ETF投資', '元大0050', '高股息ETF', '0056', '00919', '006208', '主動式', 'AI', '科技',
+    '資產配置', '平衡型', '市值型', '配息', '陸股', '投資', '理財', '財經', '金融', '經濟', '教學',
+    '存股', '定期定額', '新手', '懶人包', '月配息', '美股', '台股', '股市', '基金', '分析', '2025',
+]
+SYNTHETIC_CHANNELS = ['理財頻道', '投資台', 'ETF小學堂', '財經新聞台', '存股日記', '小資理財', 'Music TV']
+SYNTHETIC_CATEGORIES = ['25', '27', '27', '22', '24', '10']
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+
+
+def make_synthetic_items(count, seed=0, now=None, max_age_hours=240):
+    """隨機產生 count 筆 videos().list 格式的影片資料（同一 seed 結果相同）"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc) if now is None else now
+    items = []
+    for i in range(count):
+        video_id = f"fake{i:07d}"
+        published = now - timedelta(seconds=rng.randint(0, max_age_hours * 3600))
+        views = int(rng.paretovariate(1.2) * 500)
+        channel = rng.randrange(len(SYNTHETIC_CHANNELS))
+        items.append({
+            'kind': 'youtube#video',
+            'id': video_id,
+            'snippet': {
+                'publishedAt': published.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'channelId': f"UC{channel:022d}",
+                'channelTitle': SYNTHETIC_CHANNELS[channel],
+                'title': ' '.join(rng.sample(SYNTHETIC_WORDS, rng.randint(2, 5))) + f' #{i}',
+                'description': ' '.join(rng.sample(SYNTHETIC_WORDS, 3)),
+                'categoryId': rng.choice(SYNTHETIC_CATEGORIES),
+                'thumbnails': {'high': {'url': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}},
+            },
+            'statistics': {
+                'viewCount': str(views),
+                'likeCount': str(int(views * rng.uniform(0, 0.08))),
+                'commentCount': str(int(views * rng.uniform(0, 0.01))),
+            },
+        })
+    return items
+
+
+def load_fixture(path):
+    """讀取錄製的影片資料：videos().list 回應（含 items）或 items 清單"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data['items'] if isinstance(data, dict) else data
+
+
+def save_fixture(path, items):
+    """將 videos().list 格式的影片資料存成之後可用 load_fixture 讀取的檔案"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'items': items}, f, ensure_ascii=False, indent=1)
+
+
+def quota_exceeded_error(uri=''):
+    """與 YouTube API 配額用盡時相同的 403 quotaExceeded 錯誤"""
+    content = json.dumps({'error': {
+        'code': 403,
+        'message': 'The request cannot be completed because you have exceeded your quota.',
+        'errors': [{'reason': 'quotaExceeded', 'domain': 'youtube.quota'}],
+    }}).encode('utf-8')
+    return HttpError(httplib2.Response({'status': 403, 'reason': 'Forbidden'}), content, uri=uri)
+
+
+class FakeRequest:
+    """同 googleapiclient 的 HttpRequest：execute() 時才產生回應"""
+
+    def __init__(self, service, method, params, handler):
+        self.service = service
+        self.method = method
+        self.params = params
+        self._handler = handler
+
+    def execute(self, http=None, num_retries=0):
+        return self.service._call(self.method, self.params, self._handler)
+
+
+class _Resource:
+    def __init__(self, list_method):
+        self.list = list_method
+
+
+class FakeYouTube:
+    """離線的 YouTube API client，可取代 YouTubeETFBot.youtube
+
+    latency / jitter：每次 execute() 的延遲秒數（jitter 為額外的隨機延遲上限）
+    quota_exceeded_after：成功執行這麼多次呼叫後，之後的呼叫都回傳 403 quotaExceeded
+    quota_error_rate：每次呼叫以此機率回傳 403 quotaExceeded
+    """
+
+    def __init__(self, items, latency=0.0, jitter=0.0, quota_exceeded_after=None,
+                 quota_error_rate=0.0, seed=0):
+        self.items = list(items)
+        self._items_by_id = {item['id']: item for item in self.items}
+        self._uploads = {}  # 上傳清單ID（UU...）-> 依發布時間由新到舊的影片
+        for item in sorted(self.items, key=lambda item: item['snippet']['publishedAt'], reverse=True):
+            channel_id = item['snippet'].get('channelId', '')
+            self._uploads.setdefault('UU' + channel_id[2:], []).append(item)
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_exceeded_after = quota_exceeded_after
+        self.quota_error_rate = quota_error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = Counter()
+
+    def search(self):
+        return _Resource(lambda **params: FakeRequest(self, 'search', params, self._search))
+
+    def videos(self):
+        return _Resource(lambda **params: FakeRequest(self, 'videos', params, self._videos))
+
+    def playlistItems(self):
+        return _Resource(lambda **params: FakeRequest(self, 'playlistItems', params, self._playlist_items))
+
+    def _call(self, method, params, handler):
+        with self._lock:
+            succeeded = sum(self.calls.values())
+            quota_error = ((self.quota_exceeded_after is not None and succeeded >= self.quota_exceeded_after) or
+                           self._rng.random() < self.quota_error_rate)
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            if quota_error:
+                self.errors[method] += 1
+            else:
+                self.calls[method] += 1
+        if delay > 0:
+            time.sleep(delay)
+        if quota_error:
+            raise quota_exceeded_error(f"fake://youtube/v3/{method}")
+        return handler(**params)
+
+    @staticmethod
+    def _matches_query(item, query):
+        """q 以 ' OR ' 分隔多個條件，任一條件的所有詞都出現在標題、說明或頻道名稱即符合"""
+        if not query:
+            return True
+        snippet = item['snippet']
+        text = ' '.join((snippet['title'], snippet.get('description', ''), snippet['channelTitle'])).lower()
+        return any(all(term in text for term in alternative.lower().split())
+                   for alternative in query.split(' OR '))
+
+    def _search(self, part='snippet', q=None, type=None, order='relevance', publishedAfter=None,
+                videoCategoryId=None, maxResults=SEARCH_DEFAULT_MAX_RESULTS, **params):
+        published_after = _parse_time(publishedAfter) if publishedAfter else None
+        matched = [
+            item for item in self.items
+            if self._matches_query(item, q)
+            and (published_after is None or _parse_time(item['snippet']['publishedAt']) >= published_after)
+            and (videoCategoryId is None or item['snippet'].get('categoryId') == str(videoCategoryId))
+        ]
+        if order == 'viewCount':
+            matched.sort(key=lambda item: int(item['statistics'].get('viewCount', 0)), reverse=True)
+        elif order == 'date':
+            matched.sort(key=lambda item: item['snippet']['publishedAt'], reverse=True)
+
+        limit = min(int(maxResults), SEARCH_MAX_RESULTS_LIMIT)
+        return {
+            'kind': 'youtube#searchListResponse',
+            'pageInfo': {'totalResults': len(matched), 'resultsPerPage': limit},
+            'items': [{
+                'kind': 'youtube#searchResult',
+                'id': {'kind': 'youtube#video', 'videoId': item['id']},
+                'snippet': {key: value for key, value in item['snippet'].items() if key != 'categoryId'},
+            } for item in matched[:limit]],
+        }
+
+    def _videos(self, part='snippet,statistics', id='', **params):
+        items = [self._items_by_id[video_id] for video_id in id.split(',') if video_id in self._items_by_id]
+        return {
+            'kind': 'youtube#videoListResponse',
+            'pageInfo': {'totalResults': len(items), 'resultsPerPage': len(items)},
+            'items': items,
+        }
+
+    def _playlist_items(self, part='contentDetails', playlistId='', maxResults=SEARCH_DEFAULT_MAX_RESULTS, **params):
+        items = self._uploads.get(playlistId, [])[:min(int(maxResults), SEARCH_MAX_RESULTS_LIMIT)]
+        return {
+            'kind': 'youtube#playlistItemListResponse',
+            'pageInfo': {'totalResults': len(self._uploads.get(playlistId, [])), 'resultsPerPage': len(items)},
+            'items': [{
+                'kind': 'youtube#playlistItem',
+                'contentDetails': {'videoId': item['id'], 'videoPublishedAt': item['snippet']['publishedAt']},
+            } for item in items],
+        }
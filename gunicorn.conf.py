@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+"""
+gunicorn 設定（Procfile: gunicorn -c gunicorn.conf.py line_bot_youtube:app）
+每個 worker 啟動後開啟背景服務，例如排行預先計算排程
+"""
+
+
+def post_worker_init(worker):
+    from line_bot_youtube import start_background_services
+    start_background_services()
@@ -10,15 +10,31 @@ LINE Bot YouTube ETF 搜尋機器人
 """
 
 import os
+import re
 import json
-import pandas as pd
-from datetime import datetime, timedelta
-import pytz
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+import asyncio
+import copy
+import heapq
+import queue
+import functools
+import tempfile
+import threading
+import time
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+# numpy、pandas、pytz 與 googleapiclient 載入較慢，改在第一次使用時才 import，
+# 讓 dyno 重啟與 gunicorn worker 啟動後能儘快回應 webhook（可用 benchmark.py startup 檢視載入時間）
+
+try:
+    import fcntl
+except ImportError:  # Windows 開發環境沒有 fcntl
+    fcntl = None
 
 from flask import Flask, request, abort
-from linebot.v3 import WebhookHandler
+from linebot.v3 import WebhookParser
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.messaging import (
     Configuration, ApiClient, MessagingApi,
@@ -36,21 +52,1008 @@ LINE_CHANNEL_ACCESS_TOKEN = os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', 'your_ac
 # YouTube API 設定
 YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY', 'your_youtube_api_key')
 
+# 同時執行的搜尋查詢數量上限（1 = 依序執行）
+YOUTUBE_SEARCH_CONCURRENCY = int(os.environ.get('YOUTUBE_SEARCH_CONCURRENCY', '4'))
+
+# YouTube API 的 keep-alive 連線池：連線數上限、每次請求的逾時秒數、是否改用 HTTP/2（需要 httpx 與 h2）
+YOUTUBE_HTTP_POOL_SIZE = int(os.environ.get('YOUTUBE_HTTP_POOL_SIZE', str(max(YOUTUBE_SEARCH_CONCURRENCY, 4))))
+YOUTUBE_HTTP_TIMEOUT = float(os.environ.get('YOUTUBE_HTTP_TIMEOUT', '30'))
+YOUTUBE_HTTP2 = os.environ.get('YOUTUBE_HTTP2', '0') == '1'
+
+# worker 啟動後是否在背景預先載入 numpy 並建立 YouTube client（不影響回應 webhook）
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', '1') == '1'
+
+# videos().list 每次呼叫最多可查詢的影片ID數量
+VIDEOS_LIST_BATCH_SIZE = 50
+
+# 排行結果快取：每筆的有效秒數、過期後仍可先回傳舊資料的秒數、最多保留筆數
+RANKING_CACHE_TTL = int(os.environ.get('RANKING_CACHE_TTL', '600'))
+RANKING_CACHE_STALE_TTL = int(os.environ.get('RANKING_CACHE_STALE_TTL', '3600'))
+RANKING_CACHE_MAX_ENTRIES = int(os.environ.get('RANKING_CACHE_MAX_ENTRIES', '64'))
+
+# publishedAfter 取整的時間區間（秒），讓同一區間內的查詢條件相同才能命中快取
+PUBLISHED_AFTER_BUCKET_SECONDS = int(os.environ.get('PUBLISHED_AFTER_BUCKET_SECONDS', '600'))
+
+# YouTube Data API 每日配額與帳本檔案（配額於太平洋時間午夜重置）
+# 帳本預設放在暫存目錄，只在同一台機器的 worker 之間共用，不會跨重新啟動保存（Heroku 每次重啟都會清空，
+# 帳本歸零後當天已用的配額不再計入）；需要跨重啟保存時請將 YOUTUBE_QUOTA_LEDGER_PATH 設為持久的路徑
+YOUTUBE_DAILY_QUOTA = int(os.environ.get('YOUTUBE_DAILY_QUOTA', '10000'))
+YOUTUBE_QUOTA_LEDGER_PATH = os.environ.get(
+    'YOUTUBE_QUOTA_LEDGER_PATH', os.path.join(tempfile.gettempdir(), 'line_bot_youtube_quota.json'))
+
+# 剩餘配額低於此值時進入節約模式：優先回傳快取，且每個排行最多只執行幾個搜尋查詢
+YOUTUBE_QUOTA_LOW_WATERMARK = int(os.environ.get('YOUTUBE_QUOTA_LOW_WATERMARK', '2000'))
+YOUTUBE_LOW_QUOTA_MAX_QUERIES = int(os.environ.get('YOUTUBE_LOW_QUOTA_MAX_QUERIES', '2'))
+
+# 相同排行同時被請求時，後到的請求等待第一個搜尋結果的最長秒數
+SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_WAIT_TIMEOUT', '30'))
+
+# 增量搜尋：每個查詢記住已看過的影片與最新發布時間（高水位），只搜尋高水位之後的新影片，
+# 並以 videos().list（每 50 部 1 單位）更新保留影片的統計資料。高水位搜尋與完整搜尋同樣是 100 單位，
+# 省下的配額只來自不呼叫 search().list 的更新，因此搜尋間隔以排程器更新該排行的間隔為單位：
+# 每 SEARCH_EVERY 次排程更新才搜尋一次（其餘只更新統計資料），每 FULL_EVERY 次搜尋改為搜尋完整時間範圍，
+# 讓後來才變熱門的舊影片也能被找到
+YOUTUBE_INCREMENTAL_SEARCH = os.environ.get('YOUTUBE_INCREMENTAL_SEARCH', '0') == '1'
+YOUTUBE_INCREMENTAL_SEARCH_EVERY = int(os.environ.get('YOUTUBE_INCREMENTAL_SEARCH_EVERY', '2'))
+YOUTUBE_INCREMENTAL_FULL_EVERY = int(os.environ.get('YOUTUBE_INCREMENTAL_FULL_EVERY', '2'))
+
+# 共用候選影片池（universe）：每個更新週期只搜尋一次 UNIVERSE_SEARCH_QUERIES（每個查詢取 50 部），
+# 各主題排行與 ETF 日均觀看排行都從同一份候選影片在本機篩選排序，不再各自呼叫 API；
+# 候選影片池的時間範圍（小時）需涵蓋所有使用它的排行，超過 YOUTUBE_UNIVERSE_TTL 秒後下一次排行才重新搜尋。
+# 排程器把所有使用候選影片池的排行排在同一個更新週期（取其中最短的更新間隔），一次搜尋供所有排行使用
+YOUTUBE_UNIVERSE_CRAWL = os.environ.get('YOUTUBE_UNIVERSE_CRAWL', '0') == '1'
+YOUTUBE_UNIVERSE_HOURS = int(os.environ.get('YOUTUBE_UNIVERSE_HOURS', '168'))
+YOUTUBE_UNIVERSE_MAX_RESULTS = 50
+
+# 頻道上傳清單輪詢：記錄排行結果中出現過的頻道，以 playlistItems().list（1 單位配額）
+# 讀取常上榜頻道的上傳清單，取代部分 search().list（100 單位）：輪詢到影片的頻道每 YOUTUBE_CHANNELS_PER_QUERY 個
+# 省略一個關鍵字搜尋查詢，至少保留前 YOUTUBE_CHANNEL_TAIL_QUERIES 個查詢補足其他頻道
+YOUTUBE_CHANNEL_POLLING = os.environ.get('YOUTUBE_CHANNEL_POLLING', '0') == '1'
+YOUTUBE_CHANNEL_POLL_MAX = int(os.environ.get('YOUTUBE_CHANNEL_POLL_MAX', '20'))
+YOUTUBE_CHANNEL_MIN_HITS = int(os.environ.get('YOUTUBE_CHANNEL_MIN_HITS', '2'))
+YOUTUBE_CHANNEL_MAX_IDLE_DAYS = int(os.environ.get('YOUTUBE_CHANNEL_MAX_IDLE_DAYS', '30'))
+YOUTUBE_CHANNEL_POLL_INTERVAL = int(os.environ.get('YOUTUBE_CHANNEL_POLL_INTERVAL', '1800'))
+YOUTUBE_CHANNEL_TAIL_QUERIES = int(os.environ.get('YOUTUBE_CHANNEL_TAIL_QUERIES', '2'))
+YOUTUBE_CHANNELS_PER_QUERY = int(os.environ.get('YOUTUBE_CHANNELS_PER_QUERY', '3'))
+CHANNEL_REGISTRY_PATH = os.environ.get(
+    'CHANNEL_REGISTRY_PATH', os.path.join(tempfile.gettempdir(), 'line_bot_youtube_channels.json'))
+
+# /metrics 各階段耗時直方圖的區間上限（秒）
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# 排行預先計算排程：3日排行與7日排行各自的更新間隔（秒）
+# 一次完整更新約需 3800 單位配額（3日排行共 1800、7日排行共 2000），預設值每日約 3 × 1800 + 2000 = 7400 單位
+# （啟用共用候選影片池時 6 個排行每 8 小時共用一次約 700 單位的搜尋，加上教育分類每日約 3 × (700 + 1000) = 5100 單位）；
+# 重新啟動後快照檔不存在時（預設放在暫存目錄，Heroku 每次重啟都會清空）所有排行都要重新計算，當天額外約 3800 單位，
+# 因此成為 leader 後的第一輪把已到期的排行分散在 RANKING_SCHEDULER_STARTUP_SPREAD 秒內，
+# 且每個排行執行前先確認帳本剩餘配額扣除預估成本後仍不低於節約模式門檻，否則保留現有快照稍後再試
+RANKING_SCHEDULER_ENABLED = os.environ.get('RANKING_SCHEDULER_ENABLED', '1') == '1'
+RANKING_REFRESH_INTERVAL_SHORT = int(os.environ.get('RANKING_REFRESH_INTERVAL_SHORT', str(8 * 3600)))
+RANKING_REFRESH_INTERVAL_LONG = int(os.environ.get('RANKING_REFRESH_INTERVAL_LONG', str(24 * 3600)))
+RANKING_SCHEDULER_RETRY_SECONDS = int(os.environ.get('RANKING_SCHEDULER_RETRY_SECONDS', '300'))
+RANKING_SCHEDULER_LEADER_RETRY = int(os.environ.get('RANKING_SCHEDULER_LEADER_RETRY', '30'))
+RANKING_SCHEDULER_STARTUP_SPREAD = int(os.environ.get('RANKING_SCHEDULER_STARTUP_SPREAD', '3600'))
+# 共用候選影片池重新搜尋的間隔（秒）：略短於 3日排行的更新間隔，每個排程週期搜尋一次，週期內的失敗重試不會重新搜尋
+YOUTUBE_UNIVERSE_TTL = int(os.environ.get(
+    'YOUTUBE_UNIVERSE_TTL', str(RANKING_REFRESH_INTERVAL_SHORT - RANKING_SCHEDULER_RETRY_SECONDS)))
+RANKING_SNAPSHOT_PATH = os.environ.get(
+    'RANKING_SNAPSHOT_PATH', os.path.join(tempfile.gettempdir(), 'line_bot_youtube_rankings.json'))
+
+# 渲染快取中同一快照版本的訊息最多重用的秒數（訊息含「N分鐘前」等相對發布時間，需定期重新渲染）
+RENDERED_MESSAGE_MAX_AGE = int(os.environ.get('RENDERED_MESSAGE_MAX_AGE', '300'))
+
+# webhook 背景處理：工作執行緒數量與佇列上限（佇列滿時回應 503）
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '4'))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', '100'))
+
+# 排行在此秒數內可取得（例如已有快照或快取）時，直接以 reply 送出結果，不再先回覆「搜尋中」後推送
+REPLY_FAST_PATH_DEADLINE = float(os.environ.get('REPLY_FAST_PATH_DEADLINE', '0.5'))
+
+# LINE 回覆與推送：是否以 asyncio 在背景送出（0 = 在工作執行緒中同步送出），以及共用的連線數上限
+LINE_ASYNC_DELIVERY = os.environ.get('LINE_ASYNC_DELIVERY', '1') == '1'
+LINE_DELIVERY_POOL_SIZE = int(os.environ.get('LINE_DELIVERY_POOL_SIZE', '20'))
+
+# 推送合併：同一排行在此秒數內（以及結果產生前）等待推送的使用者合併成 multicast 一次送出（0 = 逐一推送）
+PUSH_COALESCE_WINDOW = float(os.environ.get('PUSH_COALESCE_WINDOW', '1.0'))
+MULTICAST_MAX_RECIPIENTS = 500  # LINE multicast API 每次最多的收件人數
+
+# 內容篩選關鍵字（啟動時編譯成 KeywordMatcher，每段文字只掃描一次）
+# ETF相關關鍵字（只比對標題）
+ETF_KEYWORDS = [
+    'etf', '0050', '0056', '台灣50', '高股息',
+    '元大', '富邦', '投資', '理財', '股市',
+    '台湾50', '投资', '理财', '股市', '基金'
+]
+
+ETF_EXCLUDE_KEYWORDS = [
+    'poetry', 'music', 'dance', 'game', 'funny'
+]
+
+# 排除特定頻道（用於ETF日均觀看排行）
+ETF_EXCLUDE_CHANNELS = [
+    '芝麻開門', '芝麻开门', 'sesame', 'zhima'
+]
+
+# 非台灣地區特有詞彙（比對原文，區分大小寫）
+NON_TAIWAN_TERMS = [
+    # 香港澳門
+    '港股', '恆指', '恆生', '港元', 'HKEX', '港交所', '澳門', '澳幣', '港幣',
+    '香港', '廣東話', '粵語', '係', '咁', '嘅', '佢', '唔', '乜', '點解',
+    '茶餐廳', '屋企', '返工', '收工', '巴士', '的士', '搭車',
+
+    # 新加坡馬來西亞
+    '新加坡', '馬來西亞', '星洲', '大馬', '新馬', '令吉', '新元', 'SGX', 'KLCI',
+    '組屋', 'HDB', '小販中心', '巴剎',
+
+    # 大陸用詞
+    '人民幣', '滬深', '上證', '深證', '沪深', '人民币', '央行', '中行',
+    '微信', '支付寶', '支付宝', '淘寶', '淘宝', '百度', '騰訊', '腾讯',
+    '中国', '内地', '內地', '大陸', '大陆', '央視', '央视', '公安', '城管',
+    '戶口', '户口', '身份證', '身份证', '居委會', '居委会'
+]
+
+# 排除的娛樂內容關鍵字（用於教育分類）
+TAIWAN_EXCLUDE_KEYWORDS = [
+    'poetry', 'music', 'dance', 'game', 'funny', 'song', 'cover',
+    '音樂', '歌曲', '舞蹈', '遊戲', '娛樂', '綜藝', '歌手', '演唱',
+    '翻唱', '直播', 'live', 'stream', '聊天', 'chat'
+]
+
+# 排除特定YouTuber頻道（用於教育分類）
+TAIWAN_EXCLUDE_CHANNELS = [
+    'RagaFinance財經台', 'ragafinance財經台', 'ragafinance', 'raga finance'
+]
+
+TOPIC_KEYWORDS = {
+    'active': ['主動式', '主動型', 'AI', '科技', '全球', '國際', '新興', '成長', '價值', '新創', '雲端', '5G', '電動車', '綠能', 'ESG'],
+    'allocation': ['資產配置', '平衡型', '多重資產', '多元資產', '安聯', '收益成長', '組合基金', '目標日期', '60/40', '策略配置', '混合型', '穩健型'],
+    'market_cap': ['006208', '0050', '大盤', '加權', '市值', '規模', '大型股', '中型股', '台積電', '市值型'],
+    'dividend': ['高股息', '0056', '配息', '00919', '00878', '00929', '00713', '00940', '高息'],
+    'china_stock': ['0061', '006205', '006206', '006207', '00625k', '00633l', '00634r', '00636', '00636k', '00637l', '00638r', '00639', '00643', '00643k', '00650l', '00651r', '00655l', '00656r', '00665l', '00666r', '00700', '00703', '00739', '00743', '00752', '00753l', '00783', '008201', '00877', '00882', '00887', '陸股', '中國', '滬深', 'a股', '港股', '恆生']
+}
+
+# 各排行的搜尋查詢
+ETF_SEARCH_QUERIES = ["台灣ETF", "ETF投資", "元大0050", "高股息ETF", "ETF 教育", "ETF 財經", "投資 教學", "理財 教學"]
+TOPIC_SEARCH_QUERIES = {
+    'active': ["主動式 ETF", "AI ETF", "科技 ETF", "全球 ETF"],
+    'allocation': ["資產配置 ETF", "平衡型 ETF", "多重資產 ETF", "安聯 ETF"],
+    'market_cap': ["0050 ETF", "006208 ETF", "大盤 ETF", "市值型 ETF"],
+    'dividend': ["高股息 ETF", "0056 ETF", "配息 ETF", "00919 ETF"],
+    'china_stock': ["陸股 ETF", "中國 ETF", "滬深 ETF", "A股 ETF"]
+}
+EDUCATION_SEARCH_QUERIES = ["投資", "理財", "財經", "金融", "經濟"]
+
+# 共用候選影片池的查詢：以 OR 把一般 ETF 查詢（每 4 個一組）與每個主題的查詢合併成 7 個廣泛的查詢（約 700 單位），
+# 主題排行再以 TOPIC_KEYWORDS 篩選。每個查詢只取 YOUTUBE_UNIVERSE_HOURS 內依觀看次數的前 YOUTUBE_UNIVERSE_MAX_RESULTS 部，
+# 合併後的查詢共用這 50 部，不保證包含逐排行搜尋或較短時間範圍（例如 72 小時）內才會找到的影片
+UNIVERSE_SEARCH_QUERIES = (
+    [' OR '.join(ETF_SEARCH_QUERIES[i:i + 4]) for i in range(0, len(ETF_SEARCH_QUERIES), 4)]
+    + [' OR '.join(queries) for queries in TOPIC_SEARCH_QUERIES.values()]
+)
+
 app = Flask(__name__)
 
 # LINE Bot v3 配置
 configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
 api_client = ApiClient(configuration)
 line_bot_api = MessagingApi(api_client)
-handler = WebhookHandler(LINE_CHANNEL_SECRET)
+parser = WebhookParser(LINE_CHANNEL_SECRET)
+
+class KeywordMatcher:
+    """將多組關鍵字編譯成單一正規表示式，掃描一次就回傳文字命中的所有分類"""
+
+    def __init__(self, groups):
+        """groups: {分類名稱: [關鍵字, ...]}"""
+        categories = {}
+        for category, keywords in groups.items():
+            for keyword in keywords:
+                categories.setdefault(keyword, set()).add(category)
+
+        # 每個位置只會比對到最長的關鍵字，因此長關鍵字也要帶上它所包含的短關鍵字的分類
+        for keyword, keyword_categories in categories.items():
+            for other, other_categories in categories.items():
+                if other != keyword and other in keyword:
+                    keyword_categories |= other_categories
+
+        self._categories = {keyword: frozenset(cats) for keyword, cats in categories.items()}
+        # 以 lookahead 在每個位置比對，重疊的關鍵字也不會漏掉
+        self._pattern = re.compile(f'(?=({self._trie_pattern(categories)}))')
+
+    @staticmethod
+    def _trie_pattern(keywords):
+        """將關鍵字依共同字首組成樹狀的正規表示式，每個位置只需比對一條路徑（較長的優先）"""
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        def build(node):
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ''
+            if len(branches) == 1 and '' not in node:
+                return branches[0]
+            return '(?:' + '|'.join(branches) + ')' + ('?' if '' in node else '')
+
+        return build(trie)
+
+    def scan(self, text):
+        """回傳 text 命中的分類集合"""
+        hits = set()
+        for match in self._pattern.finditer(text):
+            hits |= self._categories[match.group(1)]
+        return hits
+
+# 以小寫文字比對的關鍵字分類
+LOWERCASE_KEYWORDS = KeywordMatcher(dict(
+    {
+        'etf': ETF_KEYWORDS,
+        'etf_exclude': ETF_EXCLUDE_KEYWORDS,
+        'etf_exclude_channel': ETF_EXCLUDE_CHANNELS,
+        'taiwan_exclude': TAIWAN_EXCLUDE_KEYWORDS,
+        'taiwan_exclude_channel': TAIWAN_EXCLUDE_CHANNELS,
+    },
+    **{f'topic:{topic}': keywords for topic, keywords in TOPIC_KEYWORDS.items()}
+))
+
+# 以原文（區分大小寫）比對的關鍵字分類
+CASE_SENSITIVE_KEYWORDS = KeywordMatcher({
+    'non_taiwan': NON_TAIWAN_TERMS,
+})
+
+@functools.lru_cache(maxsize=8192)
+def keyword_hits(text):
+    """回傳標題或頻道名稱命中的關鍵字分類（同一段文字在各篩選條件間共用掃描結果）"""
+    return frozenset(LOWERCASE_KEYWORDS.scan(text.lower()) | CASE_SENSITIVE_KEYWORDS.scan(text))
+
+# 文字系統旗標（script_profile 的回傳值，以位元運算組合）
+SCRIPT_HAN = 1          # 中日韓統一表意文字 U+4E00–U+9FFF
+SCRIPT_KANA = 2         # 日文平假名、片假名 U+3040–U+30FF
+SCRIPT_HANGUL = 4       # 韓文音節 U+AC00–U+D7AF
+SCRIPT_SIMPLIFIED = 8   # 簡體中文特有字（與繁體明顯不同的簡化字）
+SCRIPT_LATIN = 16       # 英文字母
+
+SIMPLIFIED_CHINESE_CHARS = (
+    '国经济车电华时实现发业报'
+    '库团专从个为书会学应开关'
+    '机进还过运门头面问题间样'
+    '种动变须员让线听谈议记产'
+    '总条只处费积历确响区传调'
+    '证单亿万块钱价购买卖销贸'
+    '计设备术技息信网站页'
+)
+
+def _char_class(start, end, exclude=''):
+    """產生 start–end 範圍（排除 exclude 中的字元）的正規表示式字元集合"""
+    excluded = sorted(ord(char) for char in set(exclude) if start <= char <= end)
+    ranges, low = [], ord(start)
+    for codepoint in excluded + [ord(end) + 1]:
+        if low <= codepoint - 1:
+            ranges.append(f'\\u{low:04x}-\\u{codepoint - 1:04x}')
+        low = codepoint + 1
+    return '[' + ''.join(ranges) + ']'
+
+# 每個分組比對同一文字系統的連續字元，一次掃描即可分類整段文字
+_SCRIPT_PATTERN = re.compile(
+    f'(?P<han>{_char_class(chr(0x4e00), chr(0x9fff), SIMPLIFIED_CHINESE_CHARS)}+)'
+    f'|(?P<simplified>[{SIMPLIFIED_CHINESE_CHARS}]+)'
+    '|(?P<kana>[\u3040-\u30ff]+)'
+    '|(?P<hangul>[\uac00-\ud7af]+)'
+    r'|(?P<latin>[A-Za-z]+)'
+)
+
+_SCRIPT_GROUP_FLAGS = {
+    'han': SCRIPT_HAN,
+    'simplified': SCRIPT_SIMPLIFIED | SCRIPT_HAN,
+    'kana': SCRIPT_KANA,
+    'hangul': SCRIPT_HANGUL,
+    'latin': SCRIPT_LATIN,
+}
+
+@functools.lru_cache(maxsize=8192)
+def script_profile(text):
+    """單次掃描回傳文字包含的文字系統旗標（SCRIPT_* 的組合）"""
+    profile = 0
+    for match in _SCRIPT_PATTERN.finditer(text):
+        profile |= _SCRIPT_GROUP_FLAGS[match.lastgroup]
+    return profile
+
+def _to_number_array(values):
+    """將 API 回傳的數字字串轉成 float 陣列；無法解析的值為 NaN"""
+    import numpy as np
+    try:
+        return np.fromiter(map(int, values), dtype=np.float64, count=len(values))
+    except (TypeError, ValueError):
+        import pandas as pd
+        return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+
+def _days_since(now, published_at_values):
+    """計算每個發布時間到 now 經過的完整天數（同 timedelta.days）；無法解析的值為 NaN"""
+    import numpy as np
+    try:
+        published = np.array([value[:-1] if value.endswith('Z') else value for value in published_at_values],
+                             dtype='datetime64[us]')
+        now64 = np.datetime64(now.astimezone(timezone.utc).replace(tzinfo=None), 'us')
+        return ((now64 - published) // np.timedelta64(1, 'D')).astype(np.float64)
+    except (TypeError, ValueError):
+        import pandas as pd
+        published = pd.to_datetime(pd.Series(published_at_values), utc=True, errors='coerce', format='ISO8601')
+        return (pd.Timestamp(now) - published).dt.days.to_numpy(dtype=np.float64)
+
+class TopKSelector:
+    """串流式前K名選取：加入時即以 video_id 去重，只用有上限的 heap 保留排序鍵最大的 K 部影片
+
+    同分時以第一次加入的順序為準（與穩定排序相同），隨時可以讀取目前的排行。
+    """
+
+    def __init__(self, k, sort_key):
+        self.k = k
+        self.sort_key = sort_key
+        self._heap = []       # (分數, -加入順序, video_id) 的 min-heap，可能含已被取代的舊項目
+        self._entries = {}    # video_id -> ((分數, -加入順序, video_id), video)，目前有效的前K名
+        self._order = {}      # video_id -> 第一次加入的順序
+        self._lock = threading.Lock()
+
+    def add(self, video):
+        """加入一部影片；相同 video_id 再次加入時以新的資料與分數取代目前保留的項目
+
+        已被淘汰的影片不會再補回，因此保留中的影片以較低分數重新加入時，
+        結果可能與「以每部影片最後的資料整批排序」不同（搜尋流程加入前已先去除重複的影片ID）。
+        """
+        with self._lock:
+            video_id = video['video_id']
+            order = self._order.setdefault(video_id, len(self._order))
+            entry = (self.sort_key(video), -order, video_id)
+            self._entries[video_id] = (entry, video)
+            heapq.heappush(self._heap, entry)
+            self._trim()
+
+    def extend(self, videos):
+        for video in videos:
+            self.add(video)
+
+    def _trim(self):
+        """移除已被取代的項目，並淘汰分數最低者直到只剩K部"""
+        while self._heap:
+            entry = self._heap[0]
+            current = self._entries.get(entry[2])
+            if current is None or current[0] != entry:
+                heapq.heappop(self._heap)
+            elif len(self._entries) > self.k:
+                heapq.heappop(self._heap)
+                del self._entries[entry[2]]
+            else:
+                break
+
+    def results(self):
+        """目前的前K名（依分數由高到低）"""
+        with self._lock:
+            ranked = sorted(self._entries.values(), key=lambda item: item[0], reverse=True)
+        return [video for _, video in ranked]
+
+class RankingCache:
+    """排行結果快取：每筆各自的 TTL、LRU 淘汰，過期資料在背景更新期間仍可回傳"""
+
+    def __init__(self, max_entries=RANKING_CACHE_MAX_ENTRIES, ttl=RANKING_CACHE_TTL,
+                 stale_ttl=RANKING_CACHE_STALE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()  # key -> (value, 寫入時間, ttl)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, allow_expired=False):
+        """回傳 (value, is_fresh)；沒有資料或已超過可用期限時回傳 (None, False)
+
+        allow_expired=True 時即使超過可用期限也回傳舊資料（配額不足時使用）。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            value, stored_at, ttl = entry
+            age = time.monotonic() - stored_at
+            if age > ttl + self.stale_ttl and not allow_expired:
+                return None, False
+            self._entries.move_to_end(key)
+            return value, age <= ttl
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic(), self.ttl if ttl is None else ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def try_begin_refresh(self, key):
+        """同一個 key 同時只允許一個背景更新，取得更新權時回傳 True"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class QuotaExhaustedError(Exception):
+    """剩餘配額不足以執行 API 呼叫"""
+
+def write_json_atomic(path, data):
+    """先寫入暫存檔再以 os.replace 替換，讀取端不會讀到寫到一半的檔案；失敗時拋出 OSError"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+@contextlib.contextmanager
+def file_lock(path):
+    """以 <path>.lock 的檔案鎖讓同一台機器的 worker 依序讀寫 path（沒有 fcntl 或 path 為 None 時不加鎖）"""
+    if not path or fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+class SharedJsonFile:
+    """以 JSON 檔案保存、讓各 worker 共用的狀態（QuotaLedger、ChannelRegistry 使用）
+
+    每次讀寫都在執行緒鎖與檔案鎖內重新讀取檔案，修改在複本上進行後以原子性替換寫回，
+    各 worker 的更新會合併而不會互相覆蓋。檔案不存在或無法解析時從目前記憶體中狀態的複本開始；
+    path 為 None 時只保存在記憶體。
+    """
+
+    def __init__(self, path, initial, label):
+        self.path = path
+        self.label = label
+        self._state = initial
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return copy.deepcopy(self._state)
+
+    def update(self, mutate=None, prepare=None):
+        """讀取最新狀態（prepare 可替換讀到的狀態），在複本上套用 mutate 後寫回，回傳目前狀態
+
+        mutate 回傳 False 時表示沒有變更，不寫回檔案。回傳的狀態不可修改。
+        """
+        with self._lock, file_lock(self.path):
+            state = self._load() if self.path else self._state
+            if prepare is not None:
+                state = prepare(state)
+
+            if mutate is not None:
+                updated = copy.deepcopy(state)
+                if mutate(updated) is not False:
+                    state = updated
+                    if self.path:
+                        try:
+                            write_json_atomic(self.path, state)
+                        except OSError as e:
+                            print(f"寫入{self.label}錯誤: {e}")
+
+            self._state = state
+            return state
+
+class QuotaLedger:
+    """YouTube API 配額帳本：記錄每次呼叫的成本並寫入檔案讓各 worker 共用（檔案路徑持久時也跨重新啟動），太平洋時間每日歸零"""
+
+    # 各 API 方法每次呼叫消耗的配額單位
+    COSTS = {
+        'search': 100,
+        'videos': 1,
+        'playlistItems': 1,
+    }
+
+    def __init__(self, path=YOUTUBE_QUOTA_LEDGER_PATH, daily_limit=YOUTUBE_DAILY_QUOTA,
+                 low_watermark=YOUTUBE_QUOTA_LOW_WATERMARK):
+        self.path = path
+        self.daily_limit = daily_limit
+        self.low_watermark = low_watermark
+        # 日期在第一次讀寫時才決定（_update 發現日期不同會重設），避免 import 時載入時區資料
+        self._file = SharedJsonFile(path, self._empty_state(None), '配額帳本')
+
+    @staticmethod
+    def _today():
+        import pytz
+        return datetime.now(pytz.timezone('America/Los_Angeles')).strftime('%Y-%m-%d')
+
+    @staticmethod
+    def _empty_state(date):
+        return {'date': date, 'used': 0, 'calls': {}}
+
+    def _update(self, mutate=None):
+        """讀取最新帳本（跨日則歸零），套用 mutate 後寫回，回傳目前狀態
+
+        mutate 回傳 False 時表示沒有變更，不寫回帳本。
+        """
+        def reset_on_new_day(state):
+            today = self._today()
+            return state if state.get('date') == today else self._empty_state(today)
+
+        return self._file.update(mutate, reset_on_new_day)
+
+    def reserve(self, method):
+        """剩餘配額足夠時記錄一次呼叫的消耗並回傳 True，否則回傳 False
+
+        檢查與記錄在同一次鎖定中完成，多個 worker 同時呼叫時不會一起通過檢查而超支。
+        """
+        units = self.COSTS.get(method, 1)
+        reserved = []
+
+        def take(state):
+            if self.daily_limit - state['used'] < units:
+                return False
+            state['used'] += units
+            state['calls'][method] = state['calls'].get(method, 0) + 1
+            reserved.append(method)
+
+        self._update(take)
+        return bool(reserved)
+
+    def mark_exhausted(self):
+        """API 回報 quotaExceeded 時，將今日用量設為上限"""
+        def exhaust(state):
+            state['used'] = max(state['used'], self.daily_limit)
+
+        self._update(exhaust)
+
+    def used(self):
+        return self._update()['used']
+
+    def remaining(self):
+        return max(self.daily_limit - self.used(), 0)
+
+    def is_low(self):
+        """剩餘配額是否低於節約模式門檻"""
+        return self.remaining() < self.low_watermark
+
+    def stats(self):
+        state = self._update()
+        return {
+            'date': state['date'],
+            'used': state['used'],
+            'remaining': max(self.daily_limit - state['used'], 0),
+            'daily_limit': self.daily_limit,
+            'calls': dict(state['calls']),
+        }
+
+class SingleFlight:
+    """合併相同 key 同時進行中的呼叫：第一個呼叫者執行，其他呼叫者等待並共用同一份結果"""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self, wait_timeout=SINGLE_FLIGHT_WAIT_TIMEOUT):
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0   # 實際執行的次數
+        self.saved = 0      # 共用結果而省下的呼叫次數
+        self.timeouts = 0   # 等待逾時的次數
+
+    def do(self, key, func):
+        """執行 func 或等待同一個 key 進行中的呼叫；等待超過 wait_timeout 秒時拋出 TimeoutError"""
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = self._Call()
+                self.executed += 1
+
+        if is_leader:
+            SINGLE_FLIGHT_CALLS.inc(result='executed')
+            try:
+                call.result = func()
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(self.wait_timeout):
+            with self._lock:
+                self.timeouts += 1
+            SINGLE_FLIGHT_CALLS.inc(result='timeout')
+            raise TimeoutError(f"等待進行中的搜尋逾時: {key}")
+        if call.error is not None:
+            raise call.error
+        with self._lock:
+            self.saved += 1
+        SINGLE_FLIGHT_CALLS.inc(result='saved')
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executed': self.executed,
+                'saved': self.saved,
+                'timeouts': self.timeouts,
+                'in_flight': len(self._calls),
+            }
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class CounterMetric:
+    """只增不減的計數器，依標籤分別計數"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(labels)} {value}" for labels, value in sorted(values.items())]
+
+class GaugeMetric:
+    """可增可減的數值，輸出時才呼叫 read 取得目前的值"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def samples(self):
+        return [f"{self.name} {self.read()}"]
+
+class HistogramMetric:
+    """耗時直方圖（秒），依標籤分別統計"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, buckets=METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # 標籤 -> [各區間次數..., 總和, 次數]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """記錄 with 區塊的經過時間（發生例外時同樣記錄）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(sorted(labels.items())))
+        return entry[-1] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            values = {labels: list(entry) for labels, entry in self._values.items()}
+        lines = []
+        for labels, entry in sorted(values.items()):
+            for bound, count in zip(self.buckets, entry):
+                lines.append(f"{self.name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels, [('le', '+Inf')])} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {entry[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """程序內的指標集合，以 Prometheus 文字格式輸出（每個 gunicorn worker 各自統計）"""
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+
+    def counter(self, name, help_text):
+        return self._metrics.setdefault(name, CounterMetric(name, help_text))
+
+    def gauge(self, name, help_text, read):
+        return self._metrics.setdefault(name, GaugeMetric(name, help_text, read))
+
+    def histogram(self, name, help_text, buckets=METRICS_LATENCY_BUCKETS):
+        return self._metrics.setdefault(name, HistogramMetric(name, help_text, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    'etf_bot_stage_seconds',
+    '各排行每個階段的耗時（channels、search、videos、filter、score、render、reply、push、multicast）')
+YOUTUBE_API_CALLS = metrics.counter(
+    'etf_bot_youtube_api_calls_total', 'YouTube Data API 呼叫次數（依方法與結果）')
+CACHE_LOOKUPS = metrics.counter(
+    'etf_bot_cache_lookups_total', '排行快取、排行快照、訊息渲染快取與 reply 快速路徑的查詢次數（依結果）')
+FILTER_REJECTIONS = metrics.counter(
+    'etf_bot_filter_rejections_total', '各篩選條件排除的影片數量')
+PUSH_RECIPIENTS = metrics.counter(
+    'etf_bot_push_recipients_total', '排行結果推送的收件人數（依 push 或 multicast）')
+SINGLE_FLIGHT_CALLS = metrics.counter(
+    'etf_bot_single_flight_calls_total', '相同搜尋合併的呼叫次數（executed 實際執行、saved 共用結果、timeout 等待逾時）')
+
+def ranking_label(topic, category_search):
+    """search_videos_unified 參數對應的排行名稱（同 RANKINGS 的 key），作為指標標籤"""
+    if category_search:
+        return 'education'
+    return topic or 'engagement'
+
+class Http2Transport:
+    """以 httpx（HTTP/2）實作 httplib2.Http 的 request 介面，可直接傳給 googleapiclient 的 execute(http=...)
+
+    httpx.Client 本身是執行緒安全的，多個 Http2Transport 可共用同一個 client 與其連線。
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        import httplib2
+        response = self.client.request(method, uri, content=body, headers=headers)
+        info = dict(response.headers)
+        info['status'] = str(response.status_code)
+        return httplib2.Response(info), response.content
+
+def make_http_factory(timeout=YOUTUBE_HTTP_TIMEOUT, http2=YOUTUBE_HTTP2, pool_size=YOUTUBE_HTTP_POOL_SIZE):
+    """回傳建立 YouTube API 連線的函式：預設為 httplib2，http2=True 且已安裝 httpx[http2] 時改用 HTTP/2"""
+    if http2:
+        try:
+            import httpx
+            client = httpx.Client(http2=True, timeout=timeout,
+                                  limits=httpx.Limits(max_connections=pool_size,
+                                                      max_keepalive_connections=pool_size))
+            return lambda: Http2Transport(client)
+        except ImportError as e:
+            print(f"無法使用 HTTP/2（{e}），改用 httplib2")
+
+    def build_httplib2():
+        from googleapiclient.http import build_http
+        http = build_http()
+        http.timeout = timeout
+        return http
+
+    return build_httplib2
+
+class HttpConnectionPool:
+    """執行緒安全的 keep-alive 連線池：每次請求借出一個連線，用完歸還讓下一個請求重用（不必重新 TLS 交握）
+
+    httplib2.Http 不是執行緒安全的，同一時間只會借給一個執行緒；連線在第一次需要時才建立，
+    最多 size 個，全部借出時等待歸還。沒有指定 factory 時，第一次建立連線才呼叫 make_http_factory
+    （避免 import 時載入 httpx 並開啟 client）。
+    """
+
+    def __init__(self, factory=None, size=YOUTUBE_HTTP_POOL_SIZE):
+        self.factory = factory
+        self.size = max(int(size), 1)
+        self._idle = queue.LifoQueue()  # 後進先出：優先重用最近用過、連線仍開著的 transport
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self):
+        http = self._acquire()
+        try:
+            yield http
+        finally:
+            self._idle.put(http)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()
+        try:
+            with self._lock:
+                if self.factory is None:
+                    self.factory = make_http_factory()
+            return self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def stats(self):
+        return {'size': self.size, 'created': self._created, 'idle': self._idle.qsize()}
+
+class ChannelRegistry:
+    """常上榜頻道登記表：記錄每個頻道在排行結果中出現的次數，寫入檔案讓重啟與其他 worker 沿用
+
+    以 SharedJsonFile 讀寫，各 worker 登記的次數會合併而不會互相覆蓋。
+    """
+
+    def __init__(self, path=CHANNEL_REGISTRY_PATH, max_channels=YOUTUBE_CHANNEL_POLL_MAX,
+                 min_hits=YOUTUBE_CHANNEL_MIN_HITS, max_idle_days=YOUTUBE_CHANNEL_MAX_IDLE_DAYS):
+        self.path = path
+        self.max_channels = max_channels
+        self.min_hits = min_hits
+        self.max_idle_days = max_idle_days
+        # channel_id -> {'title', 'hits', 'last_seen'}
+        self._file = SharedJsonFile(path, {}, '頻道登記表')
+
+    def _update(self, mutate=None):
+        """讀取最新登記表，套用 mutate 後寫回，回傳目前的登記表"""
+        return self._file.update(mutate)
+
+    def record(self, videos):
+        """登記一次排行結果中的頻道（同一次結果中每個頻道只計一次）"""
+        seen = {video['channel_id']: video['channel_title'] for video in videos if video.get('channel_id')}
+        if not seen:
+            return
+        now = time.time()
+
+        def add(channels):
+            for channel_id, title in seen.items():
+                entry = channels.setdefault(channel_id, {'title': title, 'hits': 0, 'last_seen': now})
+                entry['title'] = title
+                entry['hits'] += 1
+                entry['last_seen'] = now
+
+        self._update(add)
+
+    def channels(self):
+        """要輪詢的頻道ID：近期仍有上榜、出現次數達門檻，依出現次數取前 max_channels 個"""
+        cutoff = time.time() - self.max_idle_days * 86400
+        candidates = [(entry['hits'], channel_id) for channel_id, entry in self._update().items()
+                      if entry['hits'] >= self.min_hits and entry['last_seen'] >= cutoff]
+        return [channel_id for _, channel_id in sorted(candidates, reverse=True)[:self.max_channels]]
+
+def uploads_playlist_id(channel_id):
+    """頻道的上傳清單ID（UC... -> UU...），不必另外呼叫 channels().list"""
+    return 'UU' + channel_id[2:] if channel_id.startswith('UC') else None
+
+class SearchWindow:
+    """單一查詢的增量搜尋狀態：時間範圍內保留的影片（ID -> 發布時間）、高水位與上次搜尋時間"""
+
+    def __init__(self):
+        self.videos = {}
+        self.watermark = None
+        self.searched_at = 0
+        self.full_searched_at = 0
+        self.lock = threading.Lock()
+
+    def merge(self, results, full, searched_at):
+        """加入一次搜尋的 (影片ID, 發布時間) 結果；完整搜尋時先清空舊資料"""
+        if full:
+            self.videos = {}
+            self.full_searched_at = searched_at
+        for video_id, published_at in results:
+            self.videos[video_id] = published_at
+            if self.watermark is None or published_at > self.watermark:
+                self.watermark = published_at
+        self.searched_at = searched_at
+
+    def expire(self, published_after):
+        """移除發布時間早於搜尋範圍起點的影片"""
+        self.videos = {video_id: published_at for video_id, published_at in self.videos.items()
+                       if published_at >= published_after}
 
 class YouTubeETFBot:
-    def __init__(self, api_key):
+    def __init__(self, api_key, max_concurrency=YOUTUBE_SEARCH_CONCURRENCY, http_pool=None,
+                 incremental=YOUTUBE_INCREMENTAL_SEARCH, universe=YOUTUBE_UNIVERSE_CRAWL,
+                 channel_polling=YOUTUBE_CHANNEL_POLLING):
         self.api_key = api_key
-        self.youtube = build('youtube', 'v3', developerKey=api_key)
+        self._youtube = None
+        self._client_lock = threading.Lock()
+        self.max_concurrency = max(int(max_concurrency), 1)
+        # 所有執行緒共用的 keep-alive 連線池（執行緒池結束後連線仍保留給下一次排行使用）
+        self.http_pool = http_pool or HttpConnectionPool()
+        self.cache = RankingCache()
+        self.single_flight = SingleFlight()
+        self.quota = QuotaLedger()
+        self.incremental = incremental
+        self.universe = universe
+        self.channel_polling = channel_polling
+        self.channels = ChannelRegistry()
+        self._channel_uploads = {}  # channel_id -> (輪詢時間, [(影片ID, 發布時間), ...])
+        self._channel_uploads_lock = threading.Lock()
+        self._universe = None  # (搜尋時間, videos().list 影片資料)
+        self._search_windows = {}  # (查詢, 是否分類搜尋, hours_ago, maxResults) -> SearchWindow
+        self._search_windows_lock = threading.Lock()
+
+    @property
+    def youtube(self):
+        """YouTube API client：第一次使用時才建立（import googleapiclient 較慢）"""
+        if self._youtube is None:
+            with self._client_lock:
+                if self._youtube is None:
+                    from googleapiclient.discovery import build
+                    self._youtube = build('youtube', 'v3', developerKey=self.api_key)
+        return self._youtube
+
+    @youtube.setter
+    def youtube(self, client):
+        self._youtube = client
+
+    def warm_up(self):
+        """預先載入排行計算會用到的模組並建立 client"""
+        import numpy
+        self.youtube
+        with self.http_pool.connection():
+            pass
+
+    def _execute(self, api_request, method):
+        """從連線池借出 http 連線執行 API 請求，並記錄配額消耗
+
+        method 為配額帳本中的方法名稱（'search'、'videos'）。
+        """
+        # 先預留配額（失敗的請求同樣會消耗配額），剩餘配額不足時不呼叫
+        if not self.quota.reserve(method):
+            YOUTUBE_API_CALLS.inc(method=method, result='rejected')
+            raise QuotaExhaustedError(f"今日剩餘配額不足以呼叫 {method}")
+        try:
+            with self.http_pool.connection() as http:
+                response = api_request.execute(http=http)
+        except Exception as e:
+            # 只在發生錯誤時才載入 HttpError，成功的呼叫不必經過 import
+            from googleapiclient.errors import HttpError
+            if isinstance(e, HttpError) and e.resp.status == 403 and 'quotaExceeded' in str(e.content):
+                self.quota.mark_exhausted()
+                YOUTUBE_API_CALLS.inc(method=method, result='quota_exceeded')
+            else:
+                YOUTUBE_API_CALLS.inc(method=method, result='error')
+            raise
+        YOUTUBE_API_CALLS.inc(method=method, result='ok')
+        return response
         
         
-"""        
+    """
     def get_recent_etf_videos(self, hours_ago=168, max_results=10, sort_by='viewCount'):
         #獲取最近ETF相關影片
         try:
@@ -116,7 +1119,7 @@ class YouTubeETFBot:
             return []
 """
     
-    def get_etf_videos_by_engagement(self, hours_ago=72, max_results=12):
+    def get_etf_videos_by_engagement(self, hours_ago=72, max_results=12, refresh=False):
         """ETF日均觀看排行：篩選條件1+2，時間參數為3天，排序方式1的前12名影片"""
         return self.search_videos_unified(
             hours_ago=hours_ago,
@@ -125,10 +1128,11 @@ class YouTubeETFBot:
             filter_taiwan_chinese=True,
             topic=None,
             sort_by='view_per_day',
-            category_search=False
+            category_search=False,
+            refresh=refresh
         )
 
-    def get_etf_videos_by_special_categories(self, hours_ago=72, max_results=12):
+    def get_etf_videos_by_special_categories(self, hours_ago=72, max_results=12, refresh=False):
         """教育分類日均排行：youtube新聞及教育分類，篩選條件2，時間參數為3天，排序方式1的前12名影片"""
         return self.search_videos_unified(
             hours_ago=hours_ago,
@@ -137,7 +1141,8 @@ class YouTubeETFBot:
             filter_taiwan_chinese=True,
             topic=None,
             sort_by='view_per_day',
-            category_search=True
+            category_search=True,
+            refresh=refresh
         )
 
     def _calculate_view_per_day(self, video_info):
@@ -152,7 +1157,7 @@ class YouTubeETFBot:
         except:
             return 0
 
-    def get_etf_videos_by_category(self, category_type, hours_ago=168, max_results=12):
+    def get_etf_videos_by_category(self, category_type, hours_ago=168, max_results=12, refresh=False):
         """各分類ETF：篩選條件1+2，主題相關的影片，時間參數為7天，排序方式1的前12名"""
         return self.search_videos_unified(
             hours_ago=hours_ago,
@@ -161,7 +1166,8 @@ class YouTubeETFBot:
             filter_taiwan_chinese=True,
             topic=category_type,
             sort_by='view_per_day',
-            category_search=False
+            category_search=False,
+            refresh=refresh
         )
 
     def _extract_video_info(self, item):
@@ -173,6 +1179,7 @@ class YouTubeETFBot:
             'video_id': item['id'],
             'title': snippet['title'][:80] + '...' if len(snippet['title']) > 80 else snippet['title'],
             'channel_title': snippet['channelTitle'][:30],
+            'channel_id': snippet.get('channelId', ''),
             'published_at': snippet['publishedAt'],
             'view_count': statistics.get('viewCount', '0'),
             'like_count': statistics.get('likeCount', '0'),
@@ -183,43 +1190,16 @@ class YouTubeETFBot:
     
     def _is_etf_related(self, video_info):
         """檢查是否為ETF相關影片"""
-        title = video_info['title'].lower()
-        channel = video_info['channel_title'].lower()
-
-        etf_keywords = [
-            'etf', '0050', '0056', '台灣50', '高股息',
-            '元大', '富邦', '投資', '理財', '股市',
-            '台湾50', '投资', '理财', '股市', '基金'
-        ]
-
-        exclude_keywords = [
-            'poetry', 'music', 'dance', 'game', 'funny'
-        ]
-
-        # 檢查是否包含中文字符
-        def has_chinese(text):
-            return any('\u4e00' <= char <= '\u9fff' for char in text)
-
-        # 檢查是否包含日文字符
-        def has_japanese(text):
-            return any('\u3040' <= char <= '\u309f' or '\u30a0' <= char <= '\u30ff' for char in text)
-
-        # 檢查是否包含韓文字符
-        def has_korean(text):
-            return any('\uac00' <= char <= '\ud7af' for char in text)
+        title_hits = keyword_hits(video_info['title'])
+        channel_hits = keyword_hits(video_info['channel_title'])
+        scripts = script_profile(video_info['title']) | script_profile(video_info['channel_title'])
 
-        # 排除特定頻道（用於ETF日均觀看排行）
-        exclude_etf_channels = [
-            '芝麻開門', '芝麻开门', 'sesame', 'zhima'
-        ]
-
-        has_etf = any(keyword in title for keyword in etf_keywords)
-        has_exclude = any(keyword in title or keyword in channel for keyword in exclude_keywords)
-        has_exclude_etf_channel = any(channel_name in channel.lower() or channel_name in title.lower()
-                                     for channel_name in exclude_etf_channels)
-        is_chinese = has_chinese(video_info['title']) or has_chinese(video_info['channel_title'])
-        is_japanese = has_japanese(video_info['title']) or has_japanese(video_info['channel_title'])
-        is_korean = has_korean(video_info['title']) or has_korean(video_info['channel_title'])
+        has_etf = 'etf' in title_hits
+        has_exclude = 'etf_exclude' in title_hits or 'etf_exclude' in channel_hits
+        has_exclude_etf_channel = 'etf_exclude_channel' in title_hits or 'etf_exclude_channel' in channel_hits
+        is_chinese = bool(scripts & SCRIPT_HAN)
+        is_japanese = bool(scripts & SCRIPT_KANA)
+        is_korean = bool(scripts & SCRIPT_HANGUL)
 
         return (has_etf and not has_exclude and not has_exclude_etf_channel and
                 is_chinese and not is_japanese and not is_korean)
@@ -228,76 +1208,20 @@ class YouTubeETFBot:
         """篩選條件2：只要台灣地區的影片，排除日文、韓文、簡體中文、香港、新加坡地區影片"""
         title = video_info['title']
         channel = video_info['channel_title']
-
-        # 檢查是否包含中文字符
-        def has_chinese(text):
-            return any('\u4e00' <= char <= '\u9fff' for char in text)
-
-        # 檢查是否包含日文字符
-        def has_japanese(text):
-            return any('\u3040' <= char <= '\u309f' or '\u30a0' <= char <= '\u30ff' for char in text)
-
-        # 檢查是否包含韓文字符
-        def has_korean(text):
-            return any('\uac00' <= char <= '\ud7af' for char in text)
-
-        # 檢查是否包含簡體中文特有字符（與繁體明顯不同的簡化字）
-        def has_simplified_chinese(text):
-            simplified_chars = [
-                '国', '经', '济', '车', '电', '华', '时', '实', '现', '发', '业', '报',
-                '库', '团', '专', '从', '个', '为', '书', '会', '学', '应', '开', '关',
-                '机', '进', '还', '过', '运', '门', '头', '面', '问', '题', '间', '样',
-                '种', '动', '变', '须', '员', '让', '线', '听', '谈', '议', '记', '产',
-                '总', '条', '只', '处', '费', '积', '历', '确', '响', '区', '传', '调',
-                '证', '单', '亿', '万', '块', '钱', '价', '购', '买', '卖', '销', '贸',
-                '计', '设', '备', '术', '技', '息', '信', '网', '站', '页'
-            ]
-            return any(char in text for char in simplified_chars)
-
-        # 檢查是否包含非台灣地區特有詞彙
-        def has_non_taiwan_terms(text):
-            non_taiwan_terms = [
-                # 香港澳門
-                '港股', '恆指', '恆生', '港元', 'HKEX', '港交所', '澳門', '澳幣', '港幣',
-                '香港', '廣東話', '粵語', '係', '咁', '嘅', '佢', '唔', '乜', '點解',
-                '茶餐廳', '屋企', '返工', '收工', '巴士', '的士', '搭車',
-
-                # 新加坡馬來西亞
-                '新加坡', '馬來西亞', '星洲', '大馬', '新馬', '令吉', '新元', 'SGX', 'KLCI',
-                '組屋', 'HDB', '小販中心', '巴剎',
-
-                # 大陸用詞
-                '人民幣', '滬深', '上證', '深證', '沪深', '人民币', '央行', '中行',
-                '微信', '支付寶', '支付宝', '淘寶', '淘宝', '百度', '騰訊', '腾讯',
-                '中国', '内地', '內地', '大陸', '大陆', '央視', '央视', '公安', '城管',
-                '戶口', '户口', '身份證', '身份证', '居委會', '居委会'
-            ]
-            return any(term in text for term in non_taiwan_terms)
+        title_hits = keyword_hits(title)
+        channel_hits = keyword_hits(channel)
+        scripts = script_profile(title) | script_profile(channel)
 
         # 基本語言檢查
-        is_chinese = has_chinese(title) or has_chinese(channel)
-        has_japanese = has_japanese(title) or has_japanese(channel)
-        has_korean = has_korean(title) or has_korean(channel)
-        has_simplified = has_simplified_chinese(title) or has_simplified_chinese(channel)
-        has_non_taiwan = has_non_taiwan_terms(title) or has_non_taiwan_terms(channel)
-
-        # 排除的娛樂內容關鍵字
-        exclude_keywords = [
-            'poetry', 'music', 'dance', 'game', 'funny', 'song', 'cover',
-            '音樂', '歌曲', '舞蹈', '遊戲', '娛樂', '綜藝', '歌手', '演唱',
-            '翻唱', '直播', 'live', 'stream', '聊天', 'chat'
-        ]
+        is_chinese = bool(scripts & SCRIPT_HAN)
+        has_japanese = bool(scripts & SCRIPT_KANA)
+        has_korean = bool(scripts & SCRIPT_HANGUL)
+        has_simplified = bool(scripts & SCRIPT_SIMPLIFIED)
 
-        # 排除特定YouTuber頻道（用於教育分類）
-        exclude_channels = [
-            'RagaFinance財經台', 'ragafinance財經台', 'ragafinance', 'raga finance'
-        ]
-
-        has_exclude = any(keyword in title.lower() or keyword in channel.lower()
-                         for keyword in exclude_keywords)
-
-        has_exclude_channel = any(channel_name in channel.lower() or channel_name in title.lower()
-                                 for channel_name in exclude_channels)
+        # 非台灣地區詞彙、娛樂內容、被排除的特定頻道
+        has_non_taiwan = 'non_taiwan' in title_hits or 'non_taiwan' in channel_hits
+        has_exclude = 'taiwan_exclude' in title_hits or 'taiwan_exclude' in channel_hits
+        has_exclude_channel = 'taiwan_exclude_channel' in title_hits or 'taiwan_exclude_channel' in channel_hits
 
         # 台灣地區影片判定：
         # 1. 必須是中文內容
@@ -321,19 +1245,8 @@ class YouTubeETFBot:
         if not topic:
             return True
 
-        title = video_info['title'].lower()
-        channel = video_info['channel_title'].lower()
-
-        topic_keywords = {
-            'active': ['主動式', '主動型', 'AI', '科技', '全球', '國際', '新興', '成長', '價值', '新創', '雲端', '5G', '電動車', '綠能', 'ESG'],
-            'allocation': ['資產配置', '平衡型', '多重資產', '多元資產', '安聯', '收益成長', '組合基金', '目標日期', '60/40', '策略配置', '混合型', '穩健型'],
-            'market_cap': ['006208', '0050', '大盤', '加權', '市值', '規模', '大型股', '中型股', '台積電', '市值型'],
-            'dividend': ['高股息', '0056', '配息', '00919', '00878', '00929', '00713', '00940', '高息'],
-            'china_stock': ['0061', '006205', '006206', '006207', '00625k', '00633l', '00634r', '00636', '00636k', '00637l', '00638r', '00639', '00643', '00643k', '00650l', '00651r', '00655l', '00656r', '00665l', '00666r', '00700', '00703', '00739', '00743', '00752', '00753l', '00783', '008201', '00877', '00882', '00887', '陸股', '中國', '滬深', 'a股', '港股', '恆生']
-        }
-
-        keywords = topic_keywords.get(topic, [])
-        return any(keyword in title or keyword in channel for keyword in keywords)
+        category = f'topic:{topic}'
+        return category in keyword_hits(video_info['title']) or category in keyword_hits(video_info['channel_title'])
 
     def _calculate_engagement_ratio(self, video_info):
         """計算互動比率 = (按讚+留言)/觀看次數"""
@@ -351,8 +1264,9 @@ class YouTubeETFBot:
 
     def search_videos_unified(self, hours_ago=168, max_results=12,
                              filter_etf=True, filter_taiwan_chinese=True,
-                             topic=None, sort_by='view_per_day', category_search=False):
-        """統一的影片搜尋函數
+                             topic=None, sort_by='view_per_day', category_search=False,
+                             refresh=False):
+        """統一的影片搜尋函數（結果會快取，過期時先回傳舊資料並在背景更新）
 
         Args:
             hours_ago: 時間範圍（小時）
@@ -362,137 +1276,407 @@ class YouTubeETFBot:
             topic: 主題篩選 ('active', 'allocation', 'market_cap', 'dividend', 'china_stock')
             sort_by: 排序方式 ('view_per_day', 'engagement_ratio')
             category_search: 是否使用分類搜尋（新聞及教育）
+            refresh: 略過快取直接重新搜尋（結果仍會寫入快取）
         """
+        search_args = (hours_ago, max_results, filter_etf, filter_taiwan_chinese,
+                       topic, sort_by, category_search)
+        cache_key = (topic, filter_etf, filter_taiwan_chinese, category_search,
+                     sort_by, hours_ago, max_results)
+
+        # 配額不足時不強制更新，且即使快取已超過可用期限也先回傳
+        quota_low = self.quota.is_low()
+        ranking = ranking_label(topic, category_search)
+        if refresh and not quota_low:
+            cached, is_fresh = None, False
+        else:
+            cached, is_fresh = self.cache.get(cache_key, allow_expired=quota_low)
+            result = 'miss' if cached is None else 'fresh' if is_fresh else 'stale'
+            CACHE_LOOKUPS.inc(cache='ranking', ranking=ranking, result=result)
+        if cached is not None:
+            if not is_fresh and not quota_low and self.cache.try_begin_refresh(cache_key):
+                threading.Thread(
+                    target=self._refresh_cache_entry, args=(cache_key, search_args), daemon=True
+                ).start()
+            return list(cached)
+
+        try:
+            videos = self._search_and_cache(cache_key, search_args)
+        except TimeoutError as e:
+            print(f"統一搜尋 API錯誤: {e}")
+            return []
+        return list(videos)
+
+    def _search_and_cache(self, cache_key, search_args):
+        """同一個 key 同時只執行一次搜尋，其他呼叫者共用結果；成功的結果寫入快取"""
+        def search():
+            videos = self._search_videos_uncached(*search_args)
+            if videos:
+                self.cache.set(cache_key, videos)
+            return videos
+
+        return self.single_flight.do(cache_key, search)
+
+    def _refresh_cache_entry(self, cache_key, search_args):
+        """背景更新一筆過期的快取；搜尋失敗（空結果）時保留舊資料"""
+        try:
+            self._search_and_cache(cache_key, search_args)
+        except TimeoutError as e:
+            print(f"背景更新快取錯誤: {e}")
+        finally:
+            self.cache.end_refresh(cache_key)
+
+    def _published_after(self, hours_ago):
+        """計算搜尋起始時間，並以 PUBLISHED_AFTER_BUCKET_SECONDS 取整"""
+        import pytz
+        taiwan_tz = pytz.timezone('Asia/Taipei')
+        now = datetime.now(taiwan_tz)
+        if PUBLISHED_AFTER_BUCKET_SECONDS > 0:
+            bucket_start = int(now.timestamp()) // PUBLISHED_AFTER_BUCKET_SECONDS * PUBLISHED_AFTER_BUCKET_SECONDS
+            now = datetime.fromtimestamp(bucket_start, taiwan_tz)
+        time_ago = now - timedelta(hours=hours_ago)
+        return time_ago.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def _search_videos_uncached(self, hours_ago, max_results, filter_etf,
+                                filter_taiwan_chinese, topic, sort_by, category_search):
+        """實際呼叫 YouTube API 的搜尋流程，參數同 search_videos_unified"""
         try:
             # 計算時間範圍
-            taiwan_tz = pytz.timezone('Asia/Taipei')
-            now = datetime.now(taiwan_tz)
-            time_ago = now - timedelta(hours=hours_ago)
-            published_after = time_ago.strftime('%Y-%m-%dT%H:%M:%SZ')
+            published_after = self._published_after(hours_ago)
 
-            all_videos = []
+            ranking = ranking_label(topic, category_search)
 
-            if category_search:
-                # 教育分類搜尋：直接從 YouTube 新聞及教育分類搜尋，不使用特定關鍵字
-                search_queries = ["投資", "理財", "財經", "金融", "經濟"]
-            elif topic:
-                # 主題相關搜尋
-                topic_base_queries = {
-                    'active': ["主動式 ETF", "AI ETF", "科技 ETF", "全球 ETF"],
-                    'allocation': ["資產配置 ETF", "平衡型 ETF", "多重資產 ETF", "安聯 ETF"],
-                    'market_cap': ["0050 ETF", "006208 ETF", "大盤 ETF", "市值型 ETF"],
-                    'dividend': ["高股息 ETF", "0056 ETF", "配息 ETF", "00919 ETF"],
-                    'china_stock': ["陸股 ETF", "中國 ETF", "滬深 ETF", "A股 ETF"]
-                }
-                search_queries = topic_base_queries.get(topic, ["台灣ETF", "ETF投資"])
+            if self.uses_universe(hours_ago, category_search):
+                # 從共用候選影片池取出時間範圍內的影片，在本機篩選排序（不呼叫 API）
+                batches = [self._universe_items(published_after)]
             else:
-                # 一般ETF搜尋
-                search_queries = ["台灣ETF", "ETF投資", "元大0050", "高股息ETF", "ETF 教育", "ETF 財經", "投資 教學", "理財 教學"]
+                if category_search:
+                    # 教育分類搜尋：直接從 YouTube 新聞及教育分類搜尋，不使用特定關鍵字
+                    search_queries = EDUCATION_SEARCH_QUERIES
+                elif topic:
+                    # 主題相關搜尋
+                    search_queries = TOPIC_SEARCH_QUERIES.get(topic, ["台灣ETF", "ETF投資"])
+                else:
+                    # 一般ETF搜尋
+                    search_queries = ETF_SEARCH_QUERIES
+
+                video_ids = self._search_all(search_queries, published_after, hours_ago, category_search, ranking)
+                batches = self._iter_video_details(video_ids)
+
+            # 根據排序方式選出前N名（默認按日均觀看次數排序），每批影片資料取得後立即篩選並加入
+            sort_key = 'engagement_ratio' if sort_by == 'engagement_ratio' else 'view_per_day'
+            selector = TopKSelector(max_results, lambda video: video.get(sort_key, 0))
+            now = datetime.now(timezone.utc)
+
+            # 各階段在所有批次的累計耗時與篩選排除數量，整次搜尋結束後才寫入指標
+            stage_seconds = {'videos': 0.0, 'filter': 0.0, 'score': 0.0}
+            rejections = {'etf': 0, 'taiwan_chinese': 0, 'topic': 0}
+            stage_start = time.perf_counter()
+
+            for items in batches:
+                filter_start = time.perf_counter()
+                stage_seconds['videos'] += filter_start - stage_start
+
+                candidates = []
+                for item in items:
+                    video_info = self._extract_video_info(item)
+
+                    # 篩選條件檢查
+                    passes_filter = True
+
+                    if filter_etf and not self._is_etf_related(video_info):
+                        passes_filter = False
+                        rejections['etf'] += 1
+
+                    if filter_taiwan_chinese and not self._is_taiwan_chinese_content(video_info):
+                        passes_filter = False
+                        rejections['taiwan_chinese'] += 1
+
+                    if topic and not self._matches_topic(video_info, topic):
+                        passes_filter = False
+                        rejections['topic'] += 1
+
+                    if passes_filter:
+                        candidates.append(video_info)
+
+                # 計算排序所需的數據（整批一次計算）
+                score_start = time.perf_counter()
+                stage_seconds['filter'] += score_start - filter_start
+                self._score_videos(candidates, now)
+                selector.extend(candidates)
+                stage_start = time.perf_counter()
+                stage_seconds['score'] += stage_start - score_start
+
+            stage_seconds['videos'] += time.perf_counter() - stage_start
+            for stage, seconds in stage_seconds.items():
+                STAGE_SECONDS.observe(seconds, ranking=ranking, stage=stage)
+            for filter_name, count in rejections.items():
+                if count:
+                    FILTER_REJECTIONS.inc(count, ranking=ranking, filter=filter_name)
+
+            results = selector.results()
+            if self.channel_polling and not category_search:
+                self.channels.record(results)
+            return results
 
-            for query in search_queries:
-                try:
-                    if category_search:
-                        # 教育分類搜尋：使用新聞與政治分類 (ID: 25) 和教育分類 (ID: 27)
-                        search_request = self.youtube.search().list(
-                            part='snippet',
-                            q=query,
-                            type='video',
-                            order='viewCount',
-                            publishedAfter=published_after,
-                            regionCode='TW',
-                            videoCategoryId='25',  # 新聞與政治分類
-                            maxResults=5
-                        )
-                        search_response = search_request.execute()
-
-                        # 也搜尋教育分類
-                        search_request_edu = self.youtube.search().list(
-                            part='snippet',
-                            q=query,
-                            type='video',
-                            order='viewCount',
-                            publishedAfter=published_after,
-                            regionCode='TW',
-                            videoCategoryId='27',  # 教育分類
-                            maxResults=5
-                        )
-                        search_response_edu = search_request_edu.execute()
-
-                        # 合併兩個搜尋結果
-                        combined_items = search_response['items'] + search_response_edu['items']
-                        search_response['items'] = combined_items
-                    else:
-                        # 一般搜尋
-                        search_request = self.youtube.search().list(
-                            part='snippet',
-                            q=query,
-                            type='video',
-                            order='viewCount',
-                            publishedAfter=published_after,
-                            regionCode='TW',
-                            maxResults=10
-                        )
-                        search_response = search_request.execute()
+        except Exception as e:
+            print(f"統一搜尋 API錯誤: {e}")
+            return []
 
-                    video_ids = [item['id']['videoId'] for item in search_response['items']]
+    def uses_universe(self, hours_ago, category_search):
+        """這個時間範圍的排行是否從共用候選影片池篩選（教育分類搜尋不使用）"""
+        return self.universe and not category_search and hours_ago <= YOUTUBE_UNIVERSE_HOURS
 
-                    if video_ids:
-                        videos_request = self.youtube.videos().list(
-                            part='snippet,statistics',
-                            id=','.join(video_ids)
-                        )
-                        videos_response = videos_request.execute()
+    def _search_all(self, search_queries, published_after, hours_ago, category_search, ranking,
+                    max_results=None):
+        """並行執行所有搜尋查詢，回傳跨查詢去除重複後的影片ID（保留第一次出現的順序）
 
-                        for item in videos_response['items']:
-                            video_info = self._extract_video_info(item)
+        啟用頻道輪詢時，先加入常上榜頻道的新上傳影片；依實際輪詢到影片的頻道數量省略後面的關鍵字查詢
+        （輪詢失敗或沒有新影片的頻道不算）。
+        """
+        channel_video_ids = []
+        if self.channel_polling and not category_search:
+            channel_ids = self.channels.channels()
+            if channel_ids:
+                with STAGE_SECONDS.time(ranking=ranking, stage='channels'):
+                    uploads = self._channel_upload_ids(channel_ids, published_after)
+                channel_video_ids = [video_id for ids in uploads for video_id in ids]
+                skipped = sum(1 for ids in uploads if ids) // max(YOUTUBE_CHANNELS_PER_QUERY, 1)
+                search_queries = search_queries[:max(len(search_queries) - skipped, YOUTUBE_CHANNEL_TAIL_QUERIES)]
+
+        # 配額節約模式：只執行最前面（最主要）的幾個查詢
+        if self.quota.is_low():
+            search_queries = search_queries[:YOUTUBE_LOW_QUOTA_MAX_QUERIES]
+
+        def run_query(query):
+            if self.incremental:
+                return self._incremental_video_ids(query, published_after, hours_ago, category_search, max_results)
+            return self._search_video_ids(query, published_after, category_search, max_results)
+
+        # 各查詢彼此獨立，以有上限的執行緒池並行執行；map 保留查詢順序，去重與排序結果不變
+        with STAGE_SECONDS.time(ranking=ranking, stage='search'):
+            query_results = self._map_concurrent(run_query, search_queries)
+
+        return list(dict.fromkeys(
+            video_id for ids in [channel_video_ids] + query_results for video_id in ids
+        ))
+
+    def _channel_upload_ids(self, channel_ids, published_after):
+        """各頻道在 published_after 之後上傳的影片ID（每個頻道一個清單，依 channel_ids 順序）
+
+        同一頻道在 YOUTUBE_CHANNEL_POLL_INTERVAL 秒內只輪詢一次。
+        """
+        def uploads(channel_id):
+            with self._channel_uploads_lock:
+                cached = self._channel_uploads.get(channel_id)
+            if cached is None or time.time() - cached[0] > YOUTUBE_CHANNEL_POLL_INTERVAL:
+                try:
+                    cached = (time.time(), self._poll_uploads(channel_id))
+                except Exception as e:
+                    print(f"輪詢頻道 {channel_id} 上傳清單錯誤: {e}")
+                    if cached is None:
+                        return []
+                else:
+                    with self._channel_uploads_lock:
+                        self._channel_uploads[channel_id] = cached
+            return [video_id for video_id, published_at in cached[1] if published_at >= published_after]
+
+        return self._map_concurrent(uploads, channel_ids)
+
+    def _poll_uploads(self, channel_id):
+        """以 playlistItems().list 讀取頻道上傳清單最新的 50 部影片，回傳 (影片ID, 發布時間) 清單"""
+        playlist_id = uploads_playlist_id(channel_id)
+        if playlist_id is None:
+            return []
+        request = self.youtube.playlistItems().list(
+            part='contentDetails',
+            playlistId=playlist_id,
+            maxResults=50
+        )
+        return [(item['contentDetails']['videoId'], item['contentDetails']['videoPublishedAt'][:19] + 'Z')
+                for item in self._execute(request, 'playlistItems')['items']
+                if item['contentDetails'].get('videoPublishedAt')]
+
+    def _universe_items(self, published_after):
+        """共用候選影片池中 published_after 之後發布的影片資料；池子不存在或超過 TTL 時先重新搜尋"""
+        universe = self._universe
+        if universe is None or time.time() - universe[0] > YOUTUBE_UNIVERSE_TTL:
+            universe = self.single_flight.do(('universe',), self._crawl_universe)
+        if universe is None:
+            return []
+        return [item for item in universe[1] if item['snippet']['publishedAt'][:19] + 'Z' >= published_after]
 
-                            # 篩選條件檢查
-                            passes_filter = True
+    def _crawl_universe(self):
+        """搜尋所有 UNIVERSE_SEARCH_QUERIES 並取得影片資料，回傳 (搜尋時間, 影片資料)
 
-                            if filter_etf and not self._is_etf_related(video_info):
-                                passes_filter = False
+        沒有取得任何影片（例如配額用完）時保留原本的候選影片池。
+        """
+        published_after = self._published_after(YOUTUBE_UNIVERSE_HOURS)
+        video_ids = self._search_all(UNIVERSE_SEARCH_QUERIES, published_after, YOUTUBE_UNIVERSE_HOURS,
+                                     False, 'universe', max_results=YOUTUBE_UNIVERSE_MAX_RESULTS)
+        with STAGE_SECONDS.time(ranking='universe', stage='videos'):
+            items = self._fetch_video_details(video_ids)
+        if items:
+            self._universe = (time.time(), items)
+        return self._universe
+
+    def _map_concurrent(self, func, items):
+        """以有上限的執行緒池對每個項目執行 func，結果依輸入順序回傳"""
+        return list(self._imap_concurrent(func, items))
+
+    def _imap_concurrent(self, func, items):
+        """同 _map_concurrent，但每個結果完成（且前面的都已完成）時就依序產出"""
+        workers = min(self.max_concurrency, len(items))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                yield from executor.map(func, items)
+        else:
+            for item in items:
+                yield func(item)
 
-                            if filter_taiwan_chinese and not self._is_taiwan_chinese_content(video_info):
-                                passes_filter = False
+    def _score_videos(self, videos, now=None):
+        """以 NumPy 向量化一次計算所有影片的排序指標，所有影片使用同一個 now
 
-                            if topic and not self._matches_topic(video_info, topic):
-                                passes_filter = False
+        結果與 _calculate_view_per_day、_calculate_engagement_ratio 逐筆計算相同，
+        無法解析的數值視為 0。
+        """
+        if not videos:
+            return videos
+
+        import numpy as np
+        now = datetime.now(timezone.utc) if now is None else now
+        views = _to_number_array([video['view_count'] for video in videos])
+        likes = np.nan_to_num(_to_number_array([video['like_count'] for video in videos])).astype(np.int64)
+        comments = np.nan_to_num(_to_number_array([video['comment_count'] for video in videos])).astype(np.int64)
+        days = _days_since(now, [video['published_at'] for video in videos])
+
+        # 觀看次數/發布天數（至少1天避免除以0）
+        view_per_day = np.nan_to_num(views / np.maximum(days, 1))
+
+        # 互動分數、互動率(%)、互動比率 = (按讚+留言)/觀看次數
+        engagement_score = likes + comments * 2
+        engagement_rate = engagement_score / np.maximum(np.nan_to_num(views), 1) * 100
+        has_views = views > 0
+        engagement_ratio = np.divide(likes + comments, views, out=np.zeros(len(videos)), where=has_views)
+
+        for video, vpd, score, rate, ratio in zip(
+                videos, view_per_day.tolist(), engagement_score.tolist(),
+                engagement_rate.tolist(), engagement_ratio.tolist()):
+            video['view_per_day'] = vpd
+            video['engagement_score'] = score
+            video['engagement_rate'] = rate
+            video['engagement_ratio'] = ratio
+        return videos
+
+    def _search_video_ids(self, query, published_after, category_search, max_results=None):
+        """執行單一查詢的 search().list，只回傳影片ID"""
+        try:
+            return [video_id for video_id, _ in
+                    self._search_videos(query, published_after, category_search, max_results)]
+        except Exception as e:
+            print(f"搜尋查詢 '{query}' 錯誤: {e}")
+            return []
 
-                            if passes_filter:
-                                # 計算排序所需的數據
-                                video_info['view_per_day'] = self._calculate_view_per_day(video_info)
-                                video_info['engagement_score'] = int(video_info['like_count']) + int(video_info['comment_count']) * 2
-                                video_info['engagement_rate'] = video_info['engagement_score'] / max(int(video_info['view_count']), 1) * 100
-                                video_info['engagement_ratio'] = self._calculate_engagement_ratio(video_info)
-                                all_videos.append(video_info)
+    def _incremental_video_ids(self, query, published_after, hours_ago, category_search, max_results=None):
+        """增量搜尋：只搜尋高水位之後發布的影片並併入保留的影片，回傳時間範圍內所有保留的影片ID
 
+        搜尋間隔是排程器更新這個時間範圍的間隔乘上次數，再扣掉半個更新間隔，
+        排程執行時間略有誤差時仍在同一次排程更新搜尋。
+        """
+        key = (query, category_search, hours_ago, max_results)
+        with self._search_windows_lock:
+            window = self._search_windows.setdefault(key, SearchWindow())
+
+        refresh_interval = ranking_refresh_interval(hours_ago)
+        search_interval = refresh_interval * (YOUTUBE_INCREMENTAL_SEARCH_EVERY - 0.5)
+        full_interval = refresh_interval * (YOUTUBE_INCREMENTAL_SEARCH_EVERY * YOUTUBE_INCREMENTAL_FULL_EVERY - 0.5)
+
+        with window.lock:
+            now = time.time()
+            full = now - window.full_searched_at >= full_interval
+            if full or now - window.searched_at >= search_interval:
+                search_after = published_after if full else max(published_after, window.watermark or '')
+                try:
+                    window.merge(self._search_videos(query, search_after, category_search, max_results),
+                                 full, now)
                 except Exception as e:
+                    # 搜尋失敗時不移動高水位，先使用保留的影片，下次再試
                     print(f"搜尋查詢 '{query}' 錯誤: {e}")
-                    continue
+            window.expire(published_after)
+            return list(window.videos)
 
-            # 去重複（以video_id為鍵，確保沒有重複影片）
-            unique_videos = {v['video_id']: v for v in all_videos}
-            result_videos = list(unique_videos.values())
+    def _search_videos(self, query, published_after, category_search, max_results=None):
+        """執行單一查詢的 search().list，回傳 (影片ID, 發布時間) 清單；發生錯誤時拋出例外
 
-            # 根據排序方式排序
-            if sort_by == 'engagement_ratio':
-                result_videos.sort(key=lambda x: x.get('engagement_ratio', 0), reverse=True)
-            else:  # 默認按日均觀看次數排序
-                result_videos.sort(key=lambda x: x.get('view_per_day', 0), reverse=True)
+        max_results 為每次 search().list 取得的數量，預設為分類搜尋每個分類 5 部、一般搜尋 10 部。
+        """
+        if category_search:
+            # 教育分類搜尋：使用新聞與政治分類 (ID: 25) 和教育分類 (ID: 27)
+            search_request = self.youtube.search().list(
+                part='snippet',
+                q=query,
+                type='video',
+                order='viewCount',
+                publishedAfter=published_after,
+                regionCode='TW',
+                videoCategoryId='25',  # 新聞與政治分類
+                maxResults=max_results or 5
+            )
+            search_response = self._execute(search_request, 'search')
+
+            # 也搜尋教育分類
+            search_request_edu = self.youtube.search().list(
+                part='snippet',
+                q=query,
+                type='video',
+                order='viewCount',
+                publishedAfter=published_after,
+                regionCode='TW',
+                videoCategoryId='27',  # 教育分類
+                maxResults=max_results or 5
+            )
+            search_response_edu = self._execute(search_request_edu, 'search')
 
-            # 最終確認：再次檢查前N名是否有重複
-            seen_ids = set()
-            final_results = []
-            for video in result_videos:
-                if video['video_id'] not in seen_ids and len(final_results) < max_results:
-                    seen_ids.add(video['video_id'])
-                    final_results.append(video)
+            # 合併兩個搜尋結果
+            combined_items = search_response['items'] + search_response_edu['items']
+            search_response['items'] = combined_items
+        else:
+            # 一般搜尋
+            search_request = self.youtube.search().list(
+                part='snippet',
+                q=query,
+                type='video',
+                order='viewCount',
+                publishedAfter=published_after,
+                regionCode='TW',
+                maxResults=max_results or 10
+            )
+            search_response = self._execute(search_request, 'search')
 
-            return final_results
+        return [(item['id']['videoId'], item['snippet']['publishedAt'][:19] + 'Z')
+                for item in search_response['items']]
 
-        except Exception as e:
-            print(f"統一搜尋 API錯誤: {e}")
-            return []
+    def _fetch_video_details(self, video_ids):
+        """以每批最多50個ID呼叫 videos().list，依 video_ids 順序回傳影片資料"""
+        return [item for items in self._iter_video_details(video_ids) for item in items]
+
+    def _iter_video_details(self, video_ids):
+        """以每批最多50個ID呼叫 videos().list，每批完成時依 video_ids 順序產出該批影片資料"""
+        chunks = [video_ids[i:i + VIDEOS_LIST_BATCH_SIZE]
+                  for i in range(0, len(video_ids), VIDEOS_LIST_BATCH_SIZE)]
+
+        def fetch_chunk(chunk):
+            try:
+                videos_request = self.youtube.videos().list(
+                    part='snippet,statistics',
+                    id=','.join(chunk)
+                )
+                items_by_id = {item['id']: item for item in self._execute(videos_request, 'videos')['items']}
+                return [items_by_id[video_id] for video_id in chunk if video_id in items_by_id]
+            except Exception as e:
+                print(f"取得影片資料錯誤: {e}")
+                return []
+
+        yield from self._imap_concurrent(fetch_chunk, chunks)
 
     def _format_number(self, num):
         """格式化數字"""
@@ -540,228 +1724,720 @@ class YouTubeETFBot:
 
 # 初始化 YouTube Bot
 youtube_bot = YouTubeETFBot(YOUTUBE_API_KEY)
+YOUTUBE_QUOTA_REMAINING = metrics.gauge(
+    'etf_bot_youtube_quota_remaining', '配額帳本中今日（太平洋時間）剩餘的 YouTube API 配額單位',
+    lambda: youtube_bot.quota.remaining())
+
+def ranking_refresh_interval(hours_ago):
+    """排程器更新指定時間範圍排行的間隔：3日內的排行用 SHORT，其餘用 LONG"""
+    return RANKING_REFRESH_INTERVAL_SHORT if hours_ago <= 72 else RANKING_REFRESH_INTERVAL_LONG
+
+def _topic_ranking(topic, name):
+    """產生主題分類排行（7日內）的設定"""
+    return {
+        'kind': 'category',
+        'topic': topic,
+        'hours_ago': 168,
+        'refresh_interval': ranking_refresh_interval(168),
+        'searching_text': f"🔍 搜尋7日內{name}日均觀看排行中，請稍候...",
+        'carousel_title': f"{name} 7日日均觀看排行前12名",
+        'list_title': f"{name} 7日日均觀看排行前12名",
+        'extra_texts': [],
+        'empty_text': f"🔍 目前沒有找到符合條件的{name}影片，可能是：\n1. YouTube API配額已用完\n2. 近期沒有熱門{name}影片\n\n請稍後再試或選擇其他分類！",
+        'error_log': f"{name}搜尋錯誤",
+        'error_text': "⚠️ 搜尋時發生錯誤，請稍後再試或選擇其他分類！",
+    }
+
+# 快速回覆按鈕對應的排行榜（固定集合，可由排程器預先計算）
+RANKINGS = OrderedDict([
+    ('active', _topic_ranking('active', '主動式ETF')),
+    ('allocation', _topic_ranking('allocation', '資產配置ETF')),
+    ('market_cap', _topic_ranking('market_cap', '市值型ETF')),
+    ('dividend', _topic_ranking('dividend', '高股息ETF')),
+    ('china_stock', _topic_ranking('china_stock', '陸股ETF')),
+    ('engagement', {
+        'kind': 'engagement',
+        'hours_ago': 72,
+        'refresh_interval': ranking_refresh_interval(72),
+        'searching_text': "🔍 搜尋3日內ETF日均觀看排行中，請稍候...",
+        'carousel_title': "ETF 3日日均觀看排行前12名 (含互動比率)",
+        'list_title': "ETF 3日日均觀看排行前12名",
+        'extra_texts': ["🔍 已完成搜尋3日內ETF影片，按日均觀看次數排序"],
+        'empty_text': "🔍 目前沒有找到符合條件的ETF影片，可能是：\n1. YouTube API配額已用完\n2. 近期沒有熱門ETF影片\n\n請稍後再試或選擇其他分類！",
+        'error_log': "ETF日均觀看搜尋錯誤",
+        'error_text': "⚠️ 搜尋時發生錯誤，請稍後再試或選擇其他分類！",
+    }),
+    ('education', {
+        'kind': 'special_categories',
+        'hours_ago': 72,
+        'refresh_interval': ranking_refresh_interval(72),
+        'searching_text': "🔍 搜尋3日內教育分類日均觀看排行中，請稍候...",
+        'carousel_title': "教育分類 3日日均觀看排行前12名 (新聞+教育)",
+        'list_title': "教育分類 3日日均觀看排行前12名",
+        'extra_texts': [],
+        'empty_text': "🔍 目前沒有找到符合條件的教育頻道影片，可能是：\n1. YouTube API配額已用完\n2. 教育分類中近期沒有相關影片\n3. 地區限制問題\n\n請稍後再試或選擇其他分類！",
+        'error_log': "教育頻道搜尋錯誤",
+        'error_text': "⚠️ 教育頻道搜尋時發生錯誤，請稍後再試或選擇其他分類！",
+    }),
+])
+
+def fetch_ranking(ranking_key, refresh=False):
+    """呼叫 YouTubeETFBot 計算指定排行"""
+    spec = RANKINGS[ranking_key]
+    if spec['kind'] == 'engagement':
+        return youtube_bot.get_etf_videos_by_engagement(
+            hours_ago=spec['hours_ago'], max_results=12, refresh=refresh)
+    if spec['kind'] == 'special_categories':
+        return youtube_bot.get_etf_videos_by_special_categories(
+            hours_ago=spec['hours_ago'], max_results=12, refresh=refresh)
+    return youtube_bot.get_etf_videos_by_category(
+        spec['topic'], hours_ago=spec['hours_ago'], max_results=12, refresh=refresh)
+
+def estimate_ranking_cost(ranking_key):
+    """預估重新計算一個排行的配額單位：每個 search().list 100 單位，加上取得影片資料的 videos().list"""
+    spec = RANKINGS[ranking_key]
+    if youtube_bot.uses_universe(spec['hours_ago'], spec['kind'] == 'special_categories'):
+        # 候選影片池過期時由這個排行重新搜尋
+        searches, results = len(UNIVERSE_SEARCH_QUERIES), YOUTUBE_UNIVERSE_MAX_RESULTS
+    elif spec['kind'] == 'special_categories':
+        # 每個查詢分別搜尋新聞與教育兩個分類，各 5 部
+        searches, results = len(EDUCATION_SEARCH_QUERIES) * 2, 5
+    elif spec['kind'] == 'engagement':
+        searches, results = len(ETF_SEARCH_QUERIES), 10
+    else:
+        searches, results = len(TOPIC_SEARCH_QUERIES[spec['topic']]), 10
+    video_batches = -(-searches * results // VIDEOS_LIST_BATCH_SIZE)
+    return searches * QuotaLedger.COSTS['search'] + video_batches * QuotaLedger.COSTS['videos']
+
+class RankingSnapshotStore:
+    """排行快照：整份替換發布，讀取只看記憶體；透過檔案讓同一台機器的 gunicorn worker 共用"""
+
+    def __init__(self, path=RANKING_SNAPSHOT_PATH):
+        self.path = path
+        self._snapshot = {'version': 0, 'rankings': {}}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _reload_if_changed(self):
+        """其他 worker 發布新快照時（檔案修改時間改變）重新載入"""
+        if not self.path:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"讀取排行快照錯誤: {e}")
+                return
+            self._snapshot = snapshot
+            self._mtime = mtime
+
+    def get(self, ranking_key, max_age=None):
+        """取得單一排行 {'videos', 'updated_at', 'version'}；沒有或超過 max_age 秒時回傳 None"""
+        self._reload_if_changed()
+        entry = self._snapshot['rankings'].get(ranking_key)
+        if entry is None:
+            return None
+        if max_age is not None and time.time() - entry['updated_at'] > max_age:
+            return None
+        return entry
+
+    def publish(self, ranking_key, videos):
+        """發布一個排行的新結果，整份快照以 os.replace 原子性替換"""
+        with self._lock:
+            rankings = dict(self._snapshot['rankings'])
+            version = self._snapshot['version'] + 1
+            rankings[ranking_key] = {'videos': videos, 'updated_at': time.time(), 'version': version}
+            snapshot = {'version': version, 'rankings': rankings}
+
+            if self.path:
+                try:
+                    write_json_atomic(self.path, snapshot)
+                    self._mtime = os.stat(self.path).st_mtime_ns
+                except OSError as e:
+                    print(f"寫入排行快照錯誤: {e}")
+
+            self._snapshot = snapshot
+
+class RankingScheduler:
+    """背景排程：依各排行的更新間隔重新計算並發布快照
+
+    每個 gunicorn worker 都會啟動排程執行緒，但只有取得檔案鎖的那一個會實際計算，
+    其他 worker 持續嘗試接手（原本的 worker 結束時鎖會自動釋放）。
+    """
+
+    def __init__(self, store, rankings=RANKINGS, lock_path=None):
+        self.store = store
+        self.rankings = rankings
+        self.lock_path = lock_path or (f"{store.path}.lock" if store.path else None)
+        self._lock_file = None
+        self._retry_at = {}
+        self._staggered = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ranking-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _acquire_leadership(self):
+        """以非阻塞檔案鎖確保同一時間只有一個 worker 執行排程"""
+        if self._lock_file is not None:
+            return True
+        if fcntl is None or not self.lock_path:
+            # 無法跨程序加鎖（例如 Windows 開發環境），視為單一程序
+            self._lock_file = True
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._acquire_leadership():
+                self._stop.wait(RANKING_SCHEDULER_LEADER_RETRY)
+                continue
+            next_due = self.run_due_rankings()
+            self._stop.wait(max(next_due - time.time(), 1))
+
+    def _universe_group(self):
+        """使用共用候選影片池的排行：同一次搜尋供所有排行使用，因此排在同一個更新週期"""
+        return [ranking_key for ranking_key, spec in self.rankings.items()
+                if youtube_bot.uses_universe(spec['hours_ago'], spec['kind'] == 'special_categories')]
+
+    def _interval(self, ranking_key, group):
+        """排行的更新間隔；group 中的排行一起使用其中最短的間隔"""
+        keys = group if ranking_key in group else [ranking_key]
+        return min(self.rankings[key]['refresh_interval'] for key in keys)
+
+    def _dues(self, group):
+        """各排行的下一次到期時間（沒有快照時視為已到期）；group 中的排行以最早到期的一個為準一起更新"""
+        dues = {}
+        for ranking_key in self.rankings:
+            entry = self.store.get(ranking_key)
+            due = (entry['updated_at'] if entry else 0) + self._interval(ranking_key, group)
+            dues[ranking_key] = max(due, self._retry_at.get(ranking_key, 0))
+        if group:
+            group_due = min(dues[ranking_key] for ranking_key in group)
+            dues.update((ranking_key, group_due) for ranking_key in group)
+        return dues
+
+    def _stagger_overdue(self):
+        """成為 leader 後的第一輪：已到期的排行（最久沒更新的在前）依序間隔執行，不在同一時間全部重新計算
+
+        共用候選影片池的排行佔同一個時段。
+        """
+        now = time.time()
+        group = self._universe_group()
+        dues = self._dues(group)
+        overdue = sorted((key for key, due in dues.items() if due <= now), key=dues.get)
+        slots = list(dict.fromkeys('universe' if key in group else key for key in overdue))
+        step = RANKING_SCHEDULER_STARTUP_SPREAD / max(len(slots), 1)
+        for ranking_key in overdue:
+            self._retry_at[ranking_key] = now + slots.index('universe' if ranking_key in group else ranking_key) * step
+
+    def _can_afford(self, ranking_key):
+        """帳本剩餘配額扣除這個排行的預估成本後，是否仍不低於節約模式門檻"""
+        quota = youtube_bot.quota
+        return quota.remaining() - estimate_ranking_cost(ranking_key) >= quota.low_watermark
+
+    def run_due_rankings(self):
+        """重新計算所有到期的排行，回傳下一次到期的時間"""
+        if not self._staggered:
+            self._stagger_overdue()
+            self._staggered = True
+
+        group = self._universe_group()
+        dues = self._dues(group)
+        next_due = time.time() + 3600
+        for ranking_key, spec in self.rankings.items():
+            if self._stop.is_set():
+                break
+            due = dues[ranking_key]
+
+            if due <= time.time() and not self._can_afford(ranking_key):
+                # 配額不足時保留現有快照，等配額重置或有餘裕再更新
+                due = time.time() + RANKING_SCHEDULER_RETRY_SECONDS
+                self._retry_at[ranking_key] = due
+            elif due <= time.time():
+                try:
+                    videos = fetch_ranking(ranking_key, refresh=True)
+                except Exception as e:
+                    print(f"排程計算排行 {ranking_key} 錯誤: {e}")
+                    videos = []
 
-def create_etf_carousel(videos, title="ETF 熱門影片"):
-    """創建 LINE Carousel 訊息"""
-    if not videos:
-        return TextMessage(text="抱歉，沒有找到相關的ETF影片 😅")
+                if videos:
+                    self.store.publish(ranking_key, videos)
+                    due = time.time() + self._interval(ranking_key, group)
+                else:
+                    # 搜尋失敗或配額用完時稍後再試，保留舊快照
+                    due = time.time() + RANKING_SCHEDULER_RETRY_SECONDS
+                    self._retry_at[ranking_key] = due
+
+            next_due = min(next_due, due)
+        return next_due
+
+class WebhookWorkerPool:
+    """webhook 工作佇列：有上限的佇列加上固定數量的背景執行緒，讓 webhook 可以立即回應"""
+
+    def __init__(self, process, workers=WEBHOOK_WORKERS, max_queue=WEBHOOK_QUEUE_SIZE):
+        self.process = process
+        self.workers = max(workers, 1)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'webhook-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, item):
+        """放入佇列，佇列已滿時回傳 False（由呼叫端拒絕請求）"""
+        self.start()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
 
-    bubbles = []
-    for i, video in enumerate(videos[:10]):  # 最多10個
-        bubble = FlexBubble(
-            hero=FlexImage(
-                url=video['thumbnail'],
-                size="full",
-                aspect_ratio="16:9",
-                aspect_mode="cover"
-            ),
-            body=FlexBox(
-                layout="vertical",
-                spacing="sm",
-                contents=[
-                    FlexText(
-                        text=f"#{i+1}",
-                        weight="bold",
-                        size="sm",
-                        color="#1DB446"
-                    ),
-                    FlexText(
-                        text=video['title'],
-                        weight="bold",
-                        size="md",
-                        wrap=True,
-                        max_lines=2
-                    ),
-                    FlexText(
-                        text=video['channel_title'],
-                        size="sm",
-                        color="#666666",
-                        wrap=True
-                    ),
-                    FlexSeparator(margin="md"),
-                    FlexBox(
-                        layout="vertical",
-                        spacing="sm",
-                        margin="md",
-                        contents=[
-                            FlexBox(
-                                layout="baseline",
-                                spacing="sm",
-                                contents=[
-                                    FlexText(text="👀", size="sm", flex=1),
-                                    FlexText(
-                                        text=youtube_bot._format_number(video['view_count']),
-                                        size="sm", flex=4, color="#666666"
-                                    )
-                                ]
-                            ),
-                            FlexBox(
-                                layout="baseline",
-                                spacing="sm",
-                                contents=[
-                                    FlexText(text="👍", size="sm", flex=1),
-                                    FlexText(
-                                        text=youtube_bot._format_number(video['like_count']),
-                                        size="sm", flex=4, color="#666666"
-                                    )
-                                ]
-                            ),
-                            FlexBox(
-                                layout="baseline",
-                                spacing="sm",
-                                contents=[
-                                    FlexText(text="📅", size="sm", flex=1),
-                                    FlexText(
-                                        text=youtube_bot._format_publish_time(video['published_at']),
-                                        size="sm", flex=4, color="#666666"
-                                    )
-                                ]
-                            ),
-                            FlexBox(
-                                layout="baseline",
-                                spacing="sm",
-                                contents=[
-                                    FlexText(text="🔥", size="sm", flex=1),
-                                    FlexText(
-                                        text=youtube_bot._calculate_engagement_rate(video),
-                                        size="sm", flex=4, color="#666666"
-                                    )
-                                ]
-                            )
-                        ]
-                    )
-                ]
-            ),
-            footer=FlexBox(
-                layout="vertical",
-                spacing="sm",
-                contents=[
-                    FlexButton(
-                        text="觀看影片",
-                        action=URIAction(label="觀看影片", uri=video['url']),
-                        style="primary",
-                        color="#1DB446"
-                    )
-                ]
-            )
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self.process(item)
+            except Exception as e:
+                print(f"webhook 背景處理錯誤: {e}")
+            finally:
+                self._queue.task_done()
+
+def process_webhook(events):
+    """在工作執行緒中處理 webhook 事件（已在請求中驗證簽章並解析，這裡不再重複驗證）"""
+    for event in events:
+        if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+            handle_message(event)
+
+ranking_snapshots = RankingSnapshotStore()
+ranking_scheduler = RankingScheduler(ranking_snapshots)
+webhook_workers = WebhookWorkerPool(process_webhook)
+
+def start_background_services():
+    """啟動背景服務（由 gunicorn.conf.py 的 post_worker_init 在每個 worker 中呼叫）"""
+    webhook_workers.start()
+    line_delivery.start()
+    if RANKING_SCHEDULER_ENABLED:
+        ranking_scheduler.start()
+    if STARTUP_WARMUP:
+        threading.Thread(target=youtube_bot.warm_up, name='startup-warmup', daemon=True).start()
+
+def get_ranking_videos(ranking_key):
+    """取得排行結果 (videos, 快照版本)：優先讀取預先計算的快照，快照不存在或太舊時才即時搜尋（版本為 None）"""
+    spec = RANKINGS[ranking_key]
+    entry = ranking_snapshots.get(ranking_key, max_age=spec['refresh_interval'] * 2)
+    CACHE_LOOKUPS.inc(cache='snapshot', ranking=ranking_key, result='miss' if entry is None else 'hit')
+    if entry is not None:
+        return entry['videos'], entry['version']
+    return fetch_ranking(ranking_key), None
+
+class RenderedMessageCache:
+    """排行訊息的渲染快取：每個排行保存最新快照版本已序列化的訊息 JSON，版本與時間區段相同時直接重用
+
+    訊息中的發布時間是渲染當下的相對時間（「3小時前」），因此快取 key 另外加上
+    max_age 秒為一段的時間區段，同一份訊息最多沿用 max_age 秒。
+    """
+
+    def __init__(self, max_age=RENDERED_MESSAGE_MAX_AGE):
+        self.max_age = max(int(max_age), 1)
+        self._entries = {}  # ranking_key -> ((快照版本, 時間區段), 訊息 JSON 清單)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, ranking_key, version, render):
+        """取得 (ranking_key, version) 的訊息；沒有快照版本（即時搜尋結果）時每次都重新渲染"""
+        if version is not None:
+            version = (version, int(time.time()) // self.max_age)
+            with self._lock:
+                entry = self._entries.get(ranking_key)
+                if entry is not None and entry[0] == version:
+                    self.hits += 1
+                    CACHE_LOOKUPS.inc(cache='rendered', ranking=ranking_key, result='hit')
+                    return entry[1]
+
+        with STAGE_SECONDS.time(ranking=ranking_key, stage='render'):
+            messages = render()
+        CACHE_LOOKUPS.inc(cache='rendered', ranking=ranking_key, result='miss')
+
+        with self._lock:
+            self.misses += 1
+            if version is not None:
+                current = self._entries.get(ranking_key)
+                if current is None or current[0] < version:
+                    self._entries[ranking_key] = (version, messages)
+        return messages
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+rendered_messages = RenderedMessageCache()
+
+def _etf_bubble_fields(rank, video):
+    """ETF 熱門影片卡片的文字欄位"""
+    return {
+        'rank': f"#{rank}",
+        'thumbnail': video['thumbnail'],
+        'title': video['title'],
+        'channel_title': video['channel_title'],
+        'views': youtube_bot._format_number(video['view_count']),
+        'likes': youtube_bot._format_number(video['like_count']),
+        'published': youtube_bot._format_publish_time(video['published_at']),
+        'engagement_rate': youtube_bot._calculate_engagement_rate(video),
+        'url': video['url'],
+    }
+
+def _etf_bubble(fields):
+    """ETF 熱門影片卡片"""
+    return FlexBubble(
+        hero=FlexImage(
+            url=fields['thumbnail'],
+            size="full",
+            aspect_ratio="16:9",
+            aspect_mode="cover"
+        ),
+        body=FlexBox(
+            layout="vertical",
+            spacing="sm",
+            contents=[
+                FlexText(
+                    text=fields['rank'],
+                    weight="bold",
+                    size="sm",
+                    color="#1DB446"
+                ),
+                FlexText(
+                    text=fields['title'],
+                    weight="bold",
+                    size="md",
+                    wrap=True,
+                    max_lines=2
+                ),
+                FlexText(
+                    text=fields['channel_title'],
+                    size="sm",
+                    color="#666666",
+                    wrap=True
+                ),
+                FlexSeparator(margin="md"),
+                FlexBox(
+                    layout="vertical",
+                    spacing="sm",
+                    margin="md",
+                    contents=[
+                        FlexBox(
+                            layout="baseline",
+                            spacing="sm",
+                            contents=[
+                                FlexText(text="👀", size="sm", flex=1),
+                                FlexText(
+                                    text=fields['views'],
+                                    size="sm", flex=4, color="#666666"
+                                )
+                            ]
+                        ),
+                        FlexBox(
+                            layout="baseline",
+                            spacing="sm",
+                            contents=[
+                                FlexText(text="👍", size="sm", flex=1),
+                                FlexText(
+                                    text=fields['likes'],
+                                    size="sm", flex=4, color="#666666"
+                                )
+                            ]
+                        ),
+                        FlexBox(
+                            layout="baseline",
+                            spacing="sm",
+                            contents=[
+                                FlexText(text="📅", size="sm", flex=1),
+                                FlexText(
+                                    text=fields['published'],
+                                    size="sm", flex=4, color="#666666"
+                                )
+                            ]
+                        ),
+                        FlexBox(
+                            layout="baseline",
+                            spacing="sm",
+                            contents=[
+                                FlexText(text="🔥", size="sm", flex=1),
+                                FlexText(
+                                    text=fields['engagement_rate'],
+                                    size="sm", flex=4, color="#666666"
+                                )
+                            ]
+                        )
+                    ]
+                )
+            ]
+        ),
+        footer=FlexBox(
+            layout="vertical",
+            spacing="sm",
+            contents=[
+                FlexButton(
+                    text="觀看影片",
+                    action=URIAction(label="觀看影片", uri=fields['url']),
+                    style="primary",
+                    color="#1DB446"
+                )
+            ]
         )
-        bubbles.append(bubble)
+    )
 
+def _engagement_bubble_fields(rank, video):
+    """互動排行卡片的文字欄位"""
+    return {
+        'rank': f"#{rank}",
+        'thumbnail': video['thumbnail'],
+        'title': video['title'],
+        'channel_title': video['channel_title'],
+        'view_per_day': f"{video.get('view_per_day', 0):.0f} 次/天",
+        'engagement_rate': f"{video.get('engagement_rate', 0):.2f}%",
+        'views': youtube_bot._format_number(video['view_count']),
+        'published': youtube_bot._format_publish_time(video['published_at']),
+        'url': video['url'],
+    }
+
+def _engagement_bubble(fields):
+    """互動排行卡片（含日均觀看次數和互動比率）"""
+    return FlexBubble(
+        hero=FlexImage(
+            url=fields['thumbnail'],
+            size="full",
+            aspect_ratio="16:9",
+            aspect_mode="cover"
+        ),
+        body=FlexBox(
+            layout="vertical",
+            spacing="sm",
+            contents=[
+                FlexText(
+                    text=fields['rank'],
+                    weight="bold",
+                    size="sm",
+                    color="#FF4081"
+                ),
+                FlexText(
+                    text=fields['title'],
+                    weight="bold",
+                    size="md",
+                    wrap=True,
+                    max_lines=2
+                ),
+                FlexText(
+                    text=fields['channel_title'],
+                    size="sm",
+                    color="#666666",
+                    wrap=True
+                ),
+                FlexSeparator(margin="md"),
+                FlexBox(
+                    layout="vertical",
+                    spacing="sm",
+                    margin="md",
+                    contents=[
+                        FlexBox(
+                            layout="baseline",
+                            spacing="sm",
+                            contents=[
+                                FlexText(text="📊", size="sm", flex=1),
+                                FlexText(
+                                    text=fields['view_per_day'],
+                                    size="sm", flex=4, color="#FF4081", weight="bold"
+                                )
+                            ]
+                        ),
+                        FlexBox(
+                            layout="baseline",
+                            spacing="sm",
+                            contents=[
+                                FlexText(text="🔥", size="sm", flex=1),
+                                FlexText(
+                                    text=fields['engagement_rate'],
+                                    size="sm", flex=4, color="#FF4081", weight="bold"
+                                )
+                            ]
+                        ),
+                        FlexBox(
+                            layout="baseline",
+                            spacing="sm",
+                            contents=[
+                                FlexText(text="👀", size="sm", flex=1),
+                                FlexText(
+                                    text=fields['views'],
+                                    size="sm", flex=4, color="#666666"
+                                )
+                            ]
+                        ),
+                        FlexBox(
+                            layout="baseline",
+                            spacing="sm",
+                            contents=[
+                                FlexText(text="📅", size="sm", flex=1),
+                                FlexText(
+                                    text=fields['published'],
+                                    size="sm", flex=4, color="#666666"
+                                )
+                            ]
+                        )
+                    ]
+                )
+            ]
+        ),
+        footer=FlexBox(
+            layout="vertical",
+            spacing="sm",
+            contents=[
+                FlexButton(
+                    text="觀看影片",
+                    action=URIAction(label="觀看影片", uri=fields['url']),
+                    style="primary",
+                    color="#FF4081"
+                )
+            ]
+        )
+    )
+
+def _carousel_message(bubbles, title):
     return FlexMessage(
         alt_text=f"{title} Top {len(bubbles)}",
         contents=FlexCarousel(contents=bubbles)
     )
 
+def create_etf_carousel(videos, title="ETF 熱門影片"):
+    """創建 LINE Carousel 訊息"""
+    if not videos:
+        return TextMessage(text="抱歉，沒有找到相關的ETF影片 😅")
+
+    # 最多10個
+    bubbles = [_etf_bubble(_etf_bubble_fields(i, video)) for i, video in enumerate(videos[:10], 1)]
+    return _carousel_message(bubbles, title)
+
 def create_engagement_carousel(videos, title="ETF 互動排行"):
     """創建包含日均觀看次數和互動比率的 LINE Carousel 訊息"""
     if not videos:
         return TextMessage(text="抱歉，沒有找到相關的ETF影片 😅")
 
-    bubbles = []
-    for i, video in enumerate(videos[:12]):  # LINE限制最多12個項目
-        bubble = FlexBubble(
-            hero=FlexImage(
-                url=video['thumbnail'],
-                size="full",
-                aspect_ratio="16:9",
-                aspect_mode="cover"
-            ),
-            body=FlexBox(
-                layout="vertical",
-                spacing="sm",
-                contents=[
-                    FlexText(
-                        text=f"#{i+1}",
-                        weight="bold",
-                        size="sm",
-                        color="#FF4081"
-                    ),
-                    FlexText(
-                        text=video['title'],
-                        weight="bold",
-                        size="md",
-                        wrap=True,
-                        max_lines=2
-                    ),
-                    FlexText(
-                        text=video['channel_title'],
-                        size="sm",
-                        color="#666666",
-                        wrap=True
-                    ),
-                    FlexSeparator(margin="md"),
-                    FlexBox(
-                        layout="vertical",
-                        spacing="sm",
-                        margin="md",
-                        contents=[
-                            FlexBox(
-                                layout="baseline",
-                                spacing="sm",
-                                contents=[
-                                    FlexText(text="📊", size="sm", flex=1),
-                                    FlexText(
-                                        text=f"{video.get('view_per_day', 0):.0f} 次/天",
-                                        size="sm", flex=4, color="#FF4081", weight="bold"
-                                    )
-                                ]
-                            ),
-                            FlexBox(
-                                layout="baseline",
-                                spacing="sm",
-                                contents=[
-                                    FlexText(text="🔥", size="sm", flex=1),
-                                    FlexText(
-                                        text=f"{video.get('engagement_rate', 0):.2f}%",
-                                        size="sm", flex=4, color="#FF4081", weight="bold"
-                                    )
-                                ]
-                            ),
-                            FlexBox(
-                                layout="baseline",
-                                spacing="sm",
-                                contents=[
-                                    FlexText(text="👀", size="sm", flex=1),
-                                    FlexText(
-                                        text=youtube_bot._format_number(video['view_count']),
-                                        size="sm", flex=4, color="#666666"
-                                    )
-                                ]
-                            ),
-                            FlexBox(
-                                layout="baseline",
-                                spacing="sm",
-                                contents=[
-                                    FlexText(text="📅", size="sm", flex=1),
-                                    FlexText(
-                                        text=youtube_bot._format_publish_time(video['published_at']),
-                                        size="sm", flex=4, color="#666666"
-                                    )
-                                ]
-                            )
-                        ]
-                    )
-                ]
-            ),
-            footer=FlexBox(
-                layout="vertical",
-                spacing="sm",
-                contents=[
-                    FlexButton(
-                        text="觀看影片",
-                        action=URIAction(label="觀看影片", uri=video['url']),
-                        style="primary",
-                        color="#FF4081"
-                    )
-                ]
-            )
-        )
-        bubbles.append(bubble)
+    # LINE限制最多12個項目
+    bubbles = [_engagement_bubble(_engagement_bubble_fields(i, video)) for i, video in enumerate(videos[:12], 1)]
+    return _carousel_message(bubbles, title)
+
+class FlexTemplate:
+    """預先編譯的訊息 JSON 範本：由模型輸出一次產生，之後只填入欄位值，不再建立模型物件
+
+    範本中的文字欄位以 text_field(name) 標記，會以 JSON 字串跳脫後填入；
+    raw_field(name) 標記的整個字串值會直接替換成已序列化的 JSON 片段。
+    """
+
+    _FIELD_PATTERN = re.compile(r'"\\u0000(\w+)\\u0001"|\\u0000(\w+)\\u0000')
+
+    def __init__(self, message):
+        source = json.dumps(message.to_dict() if hasattr(message, 'to_dict') else message)
+        self._literals = []
+        self._fields = []  # (欄位名稱, 是否為 JSON 片段)
+        position = 0
+        for match in self._FIELD_PATTERN.finditer(source):
+            self._literals.append(source[position:match.start()])
+            raw_name, text_name = match.groups()
+            self._fields.append((raw_name, True) if raw_name else (text_name, False))
+            position = match.end()
+        self._literals.append(source[position:])
+
+    @staticmethod
+    def text_field(name):
+        return f"\x00{name}\x00"
+
+    @staticmethod
+    def raw_field(name):
+        return f"\x00{name}\x01"
+
+    @classmethod
+    def text_fields(cls, names):
+        return {name: cls.text_field(name) for name in names}
+
+    def render(self, values):
+        """填入欄位值，回傳 JSON 字串"""
+        parts = [self._literals[0]]
+        for (name, raw), literal in zip(self._fields, self._literals[1:]):
+            parts.append(values[name] if raw else json.dumps(values[name])[1:-1])
+            parts.append(literal)
+        return ''.join(parts)
+
+_ETF_BUBBLE_FIELDS = ('rank', 'thumbnail', 'title', 'channel_title', 'views', 'likes',
+                      'published', 'engagement_rate', 'url')
+_ENGAGEMENT_BUBBLE_FIELDS = ('rank', 'thumbnail', 'title', 'channel_title', 'view_per_day',
+                             'engagement_rate', 'views', 'published', 'url')
+
+@functools.lru_cache(maxsize=None)
+def _carousel_template():
+    message = _carousel_message([_etf_bubble(FlexTemplate.text_fields(_ETF_BUBBLE_FIELDS))], '').to_dict()
+    message['altText'] = FlexTemplate.text_field('alt_text')
+    message['contents']['contents'] = FlexTemplate.raw_field('bubbles')
+    return FlexTemplate(message)
+
+@functools.lru_cache(maxsize=None)
+def _bubble_template(bubble, field_names):
+    """範本在第一次渲染時才編譯"""
+    return FlexTemplate(bubble(FlexTemplate.text_fields(field_names)))
+
+NO_VIDEOS_MESSAGE = {'type': 'text', 'text': "抱歉，沒有找到相關的ETF影片 😅"}
+
+def _render_carousel(bubble_template, bubble_fields, videos, title):
+    bubbles = [bubble_template.render(bubble_fields(i, video)) for i, video in enumerate(videos, 1)]
+    return json.loads(_carousel_template().render({
+        'alt_text': f"{title} Top {len(bubbles)}",
+        'bubbles': '[' + ', '.join(bubbles) + ']',
+    }))
+
+def render_etf_carousel(videos, title="ETF 熱門影片"):
+    """同 create_etf_carousel，但以預先編譯的範本直接產生訊息 JSON dict（與模型的 to_dict() 相同）"""
+    if not videos:
+        return dict(NO_VIDEOS_MESSAGE)
+    template = _bubble_template(_etf_bubble, _ETF_BUBBLE_FIELDS)
+    return _render_carousel(template, _etf_bubble_fields, videos[:10], title)
 
-    return FlexMessage(
-        alt_text=f"{title} Top {len(bubbles)}",
-        contents=FlexCarousel(contents=bubbles)
-    )
+def render_engagement_carousel(videos, title="ETF 互動排行"):
+    """同 create_engagement_carousel，但以預先編譯的範本直接產生訊息 JSON dict（與模型的 to_dict() 相同）"""
+    if not videos:
+        return dict(NO_VIDEOS_MESSAGE)
+    template = _bubble_template(_engagement_bubble, _ENGAGEMENT_BUBBLE_FIELDS)
+    return _render_carousel(template, _engagement_bubble_fields, videos[:12], title)
 
 def create_text_list(videos, title="ETF 影片清單"):
     """創建文字清單格式的影片列表"""
@@ -835,354 +2511,276 @@ def create_quick_reply():
         ]
     )
 
-@app.route("/webhook", methods=['POST'])
-def callback():
-    signature = request.headers['X-Line-Signature']
-    body = request.get_data(as_text=True)
-    
-    try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        abort(400)
-    
-    return 'OK'
+def render_ranking_messages(ranking_key, videos):
+    """產生排行結果要推送的訊息（輪播、文字清單、額外說明與快速回覆），回傳可直接送出的 JSON dict"""
+    spec = RANKINGS[ranking_key]
+    text_list = create_text_list(videos, spec['list_title'])
+    extra_messages = [TextMessage(text=text) for text in spec['extra_texts']]
+    tip_message = TextMessage(text="💡 試試其他分類：", quick_reply=create_quick_reply())
+    messages = [TextMessage(text=text_list)] + extra_messages + [tip_message]
+    carousel = render_engagement_carousel(videos, spec['carousel_title'])
+    return [carousel] + [message.to_dict() for message in messages]
+
+def serialize_messages(messages):
+    """將 SDK 訊息模型轉成 JSON dict（已序列化的 dict 原樣保留）"""
+    return [message if isinstance(message, dict) else message.to_dict() for message in messages]
+
+class LineDelivery:
+    """LINE 回覆與推送：在背景執行緒的 asyncio 事件迴圈中以 AsyncMessagingApi 送出
+
+    所有送出共用同一個 AsyncApiClient（aiohttp 連線池，最多 pool_size 條連線），
+    工作執行緒只排入送出工作、不等待 LINE 回應，同一個 worker 可同時送出多位使用者的結果。
+    訊息直接以 JSON 呼叫 API，略過 SDK 的模型驗證與重新序列化。
+    送出在背景完成，handle_message 捕捉不到錯誤，因此失敗時由這裡重試一次（回覆失敗改用推送）。
+    enabled=False 時在呼叫端執行緒中以同步的 line_bot_api 送出。
+    """
+
+    def __init__(self, enabled=LINE_ASYNC_DELIVERY, pool_size=LINE_DELIVERY_POOL_SIZE):
+        self.enabled = enabled
+        self.pool_size = max(int(pool_size), 1)
+        self._loop = None
+        self._async_api = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name='line-delivery', daemon=True).start()
+
+    def reply(self, reply_token, messages, ranking='none', fallback_to=None):
+        """送出回覆訊息，回傳 concurrent.futures.Future
+
+        fallback_to 為使用者ID時，回覆失敗（例如 reply token 已過期）改以推送送出同一組訊息。
+        """
+        payload = serialize_messages(messages)
+        body = {'replyToken': reply_token, 'messages': payload, 'notificationDisabled': False}
+        fallback = None
+        if fallback_to is not None:
+            fallback = ('/v2/bot/message/push', {'to': fallback_to, 'messages': payload, 'notificationDisabled': False})
+        return self._submit('/v2/bot/message/reply', body, 'reply', ranking, fallback=fallback)
 
-@handler.add(MessageEvent, message=TextMessageContent)
-def handle_message(event):
-    user_message = event.message.text.lower()
-    
-    try:
-        if any(keyword in user_message for keyword in ['嗨', 'hi', 'hello', '你好', '開始']):
-            reply_text = """🤖 YouTube ETF 搜尋機器人
-我可以幫你搜尋最新的台灣ETF相關影片！
+    def push(self, to, messages, after=None, ranking='none'):
+        """送出推送訊息；after 為先前送出的 Future 時，等它完成（不論成功與否）後才推送，維持訊息順序
 
-📱 使用方式：
-• 「ETF日均觀看排行」- 2日內日均觀看次數最高的ETF影片
-• 各類ETF分類選項- 7日內日均觀看排行
-• 「教育分類」- 2日內教育頻道熱門影片
-• 「說明」- 查看詳細說明
-"""
-            
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text=reply_text, quick_reply=create_quick_reply())]
-                )
-            )
-            
+        推送失敗時重試一次。
+        """
+        body = {'to': to, 'messages': serialize_messages(messages), 'notificationDisabled': False}
+        return self._submit('/v2/bot/message/push', body, 'push', ranking, after,
+                            fallback=('/v2/bot/message/push', body))
 
-        elif '主動式' in user_message or '主動式etf' in user_message:
-            # 立即回覆用戶正在處理中
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text="🔍 搜尋7日內主動式ETF日均觀看排行中，請稍候...")]
-                )
-            )
+    def multicast(self, to, messages, after=(), ranking='none'):
+        """以 multicast 將同一組訊息送給多位使用者（每次最多 MULTICAST_MAX_RECIPIENTS 人），回傳各次送出的 Future
 
-            # 執行耗時的搜尋操作
+        訊息只序列化一次；after 為各收件人先前送出的 Future，全部完成後才送出。失敗時重試一次。
+        """
+        payload = serialize_messages(messages)
+        futures = []
+        for start in range(0, len(to), MULTICAST_MAX_RECIPIENTS):
+            body = {'to': to[start:start + MULTICAST_MAX_RECIPIENTS], 'messages': payload,
+                    'notificationDisabled': False}
+            futures.append(self._submit('/v2/bot/message/multicast', body, 'multicast', ranking, after,
+                                        fallback=('/v2/bot/message/multicast', body)))
+        return futures
+
+    def _submit(self, path, body, stage, ranking, after=None, fallback=None):
+        """fallback 為 (path, body)：第一次送出失敗時改送 fallback（重試或改用推送），再失敗才放棄"""
+        after = [] if after is None else [after] if isinstance(after, Future) else list(after)
+        if self.enabled:
+            self.start()
+            future = asyncio.run_coroutine_threadsafe(
+                self._send(path, body, stage, ranking, after, fallback), self._loop)
+        else:
+            future = Future()
             try:
-                videos = youtube_bot.get_etf_videos_by_category('active', hours_ago=168, max_results=12)
-                if videos:
-                    carousel = create_engagement_carousel(videos, "主動式ETF 7日日均觀看排行前12名")
-                    text_list = create_text_list(videos, "主動式ETF 7日日均觀看排行前12名")
-                    tip_message = TextMessage(text="💡 試試其他分類：", quick_reply=create_quick_reply())
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[carousel, TextMessage(text=text_list), tip_message]
-                        )
-                    )
-                else:
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[TextMessage(
-                                text="🔍 目前沒有找到符合條件的主動式ETF影片，可能是：\n1. YouTube API配額已用完\n2. 近期沒有熱門主動式ETF影片\n\n請稍後再試或選擇其他分類！",
-                                quick_reply=create_quick_reply()
-                            )]
-                        )
-                    )
+                for previous in after:
+                    previous.exception()
+                try:
+                    with STAGE_SECONDS.time(ranking=ranking, stage=stage):
+                        self._call_api(line_bot_api, path, body)
+                except Exception as e:
+                    if fallback is None:
+                        raise
+                    self._log_retry(path, fallback[0], e)
+                    with STAGE_SECONDS.time(ranking=ranking, stage=stage):
+                        self._call_api(line_bot_api, *fallback)
+                future.set_result(None)
             except Exception as e:
-                print(f"主動式ETF搜尋錯誤: {e}")
-                line_bot_api.push_message(
-                    PushMessageRequest(
-                        to=event.source.user_id,
-                        messages=[TextMessage(
-                            text="⚠️ 搜尋時發生錯誤，請稍後再試或選擇其他分類！",
-                            quick_reply=create_quick_reply()
-                        )]
-                    )
-                )
+                future.set_exception(e)
+        future.add_done_callback(functools.partial(self._log_failure, path))
+        return future
 
-        elif '資產配置' in user_message or '資產配置etf' in user_message:
-            # 立即回覆用戶正在處理中
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text="🔍 搜尋7日內資產配置ETF日均觀看排行中，請稍候...")]
-                )
-            )
+    async def _send(self, path, body, stage, ranking, after, fallback):
+        if after:
+            await asyncio.wait([asyncio.wrap_future(previous) for previous in after])
+        try:
+            with STAGE_SECONDS.time(ranking=ranking, stage=stage):
+                await self._call_api(self._get_async_api(), path, body)
+        except Exception as e:
+            if fallback is None:
+                raise
+            self._log_retry(path, fallback[0], e)
+            with STAGE_SECONDS.time(ranking=ranking, stage=stage):
+                await self._call_api(self._get_async_api(), *fallback)
+
+    def _get_async_api(self):
+        """AsyncApiClient 的 aiohttp session 綁定事件迴圈，只能在事件迴圈執行緒中建立"""
+        if self._async_api is None:
+            from linebot.v3.messaging import AsyncApiClient, AsyncMessagingApi
+            async_configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
+            async_configuration.connection_pool_maxsize = self.pool_size
+            self._async_api = AsyncMessagingApi(AsyncApiClient(async_configuration))
+        return self._async_api
+
+    @staticmethod
+    def _call_api(messaging_api, path, body):
+        return messaging_api.api_client.call_api(
+            path, 'POST',
+            header_params={'Accept': 'application/json', 'Content-Type': 'application/json'},
+            body=body,
+            response_types_map={},
+            auth_settings=['Bearer'],
+            _host=messaging_api.line_base_path
+        )
 
-            # 執行耗時的搜尋操作
-            try:
-                videos = youtube_bot.get_etf_videos_by_category('allocation', hours_ago=168, max_results=12)
-                if videos:
-                    carousel = create_engagement_carousel(videos, "資產配置ETF 7日日均觀看排行前12名")
-                    text_list = create_text_list(videos, "資產配置ETF 7日日均觀看排行前12名")
-                    tip_message = TextMessage(text="💡 試試其他分類：", quick_reply=create_quick_reply())
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[carousel, TextMessage(text=text_list), tip_message]
-                        )
-                    )
-                else:
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[TextMessage(
-                                text="🔍 目前沒有找到符合條件的資產配置ETF影片，可能是：\n1. YouTube API配額已用完\n2. 近期沒有熱門資產配置ETF影片\n\n請稍後再試或選擇其他分類！",
-                                quick_reply=create_quick_reply()
-                            )]
-                        )
-                    )
-            except Exception as e:
-                print(f"資產配置ETF搜尋錯誤: {e}")
-                line_bot_api.push_message(
-                    PushMessageRequest(
-                        to=event.source.user_id,
-                        messages=[TextMessage(
-                            text="⚠️ 搜尋時發生錯誤，請稍後再試或選擇其他分類！",
-                            quick_reply=create_quick_reply()
-                        )]
-                    )
-                )
+    @staticmethod
+    def _log_failure(path, future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"LINE 訊息送出錯誤（{path}）: {future.exception()}")
+
+    @staticmethod
+    def _log_retry(path, fallback_path, error):
+        print(f"LINE 訊息送出錯誤（{path}），改以 {fallback_path} 重新送出: {error}")
+
+line_delivery = LineDelivery()
+
+class PushCoalescer:
+    """合併同一排行等待中的推送：在 window 秒內以及結果產生前加入的使用者，取得結果後以 multicast 一次送出
+
+    同一批次共用第一位使用者的查詢結果，訊息只渲染與序列化一次；批次只有一位使用者時改用一般推送。
+    window <= 0 時不合併，直接等待結果後推送。
+    """
+
+    def __init__(self, delivery, window=PUSH_COALESCE_WINDOW):
+        self.delivery = delivery
+        self.window = window
+        self._pending = {}  # 排行 -> 等待中的批次
+        self._lock = threading.Lock()
+
+    def pending_lookup(self, ranking_key):
+        """同一排行等待中批次的查詢 Future（沒有時回傳 None），讓後來的使用者共用而不重複查詢"""
+        with self._lock:
+            batch = self._pending.get(ranking_key)
+            return batch['lookup'] if batch is not None else None
+
+    def push(self, ranking_key, to, lookup, after=None):
+        """排入推送：lookup 為產生訊息的 Future，after 為此使用者先前送出的 Future"""
+        if self.window <= 0:
+            PUSH_RECIPIENTS.inc(ranking=ranking_key, api='push')
+            self.delivery.push(to, lookup.result(), after=after, ranking=ranking_key)
+            return
+        with self._lock:
+            batch = self._pending.get(ranking_key)
+            if batch is None:
+                batch = self._pending[ranking_key] = {'lookup': lookup, 'recipients': OrderedDict()}
+                timer = threading.Timer(self.window, self._flush, (ranking_key, batch))
+                timer.daemon = True
+                timer.start()
+            batch['recipients'].setdefault(to, []).append(after)
+
+    def _flush(self, ranking_key, batch):
+        # 結果產生前批次保持開放，之後才停止接受新的使用者
+        messages = batch['lookup'].result()
+        with self._lock:
+            if self._pending.get(ranking_key) is batch:
+                del self._pending[ranking_key]
+        recipients = list(batch['recipients'])
+        after = [previous for afters in batch['recipients'].values() for previous in afters if previous is not None]
+        if len(recipients) == 1:
+            PUSH_RECIPIENTS.inc(ranking=ranking_key, api='push')
+            self.delivery.push(recipients[0], messages, after=after, ranking=ranking_key)
+        else:
+            PUSH_RECIPIENTS.inc(len(recipients), ranking=ranking_key, api='multicast')
+            self.delivery.multicast(recipients, messages, after=after, ranking=ranking_key)
 
-        elif '市值型' in user_message or '市值型etf' in user_message:
-            # 立即回覆用戶正在處理中
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text="🔍 搜尋7日內市值型ETF日均觀看排行中，請稍候...")]
-                )
-            )
+push_coalescer = PushCoalescer(line_delivery)
 
-            # 執行耗時的搜尋操作
-            try:
-                videos = youtube_bot.get_etf_videos_by_category('market_cap', hours_ago=168, max_results=12)
-                if videos:
-                    carousel = create_engagement_carousel(videos, "市值型ETF 7日日均觀看排行前12名")
-                    text_list = create_text_list(videos, "市值型ETF 7日日均觀看排行前12名")
-                    tip_message = TextMessage(text="💡 試試其他分類：", quick_reply=create_quick_reply())
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[carousel, TextMessage(text=text_list), tip_message]
-                        )
-                    )
-                else:
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[TextMessage(
-                                text="🔍 目前沒有找到符合條件的市值型ETF影片，可能是：\n1. YouTube API配額已用完\n2. 近期沒有熱門市值型ETF影片\n\n請稍後再試或選擇其他分類！",
-                                quick_reply=create_quick_reply()
-                            )]
-                        )
-                    )
-            except Exception as e:
-                print(f"市值型ETF搜尋錯誤: {e}")
-                line_bot_api.push_message(
-                    PushMessageRequest(
-                        to=event.source.user_id,
-                        messages=[TextMessage(
-                            text="⚠️ 搜尋時發生錯誤，請稍後再試或選擇其他分類！",
-                            quick_reply=create_quick_reply()
-                        )]
-                    )
-                )
+ranking_lookups = ThreadPoolExecutor(max_workers=WEBHOOK_WORKERS, thread_name_prefix='ranking-lookup')
 
-        elif '高股息' in user_message or '高股息etf' in user_message:
-            # 立即回覆用戶正在處理中
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text="🔍 搜尋7日內高股息ETF日均觀看排行中，請稍候...")]
-                )
-            )
+def build_ranking_messages(ranking_key):
+    """取得排行結果並產生要送出的訊息；沒有影片或發生錯誤時為對應的提示訊息"""
+    spec = RANKINGS[ranking_key]
 
-            # 執行耗時的搜尋操作
-            try:
-                videos = youtube_bot.get_etf_videos_by_category('dividend', hours_ago=168, max_results=12)
-                if videos:
-                    carousel = create_engagement_carousel(videos, "高股息ETF 7日日均觀看排行前12名")
-                    text_list = create_text_list(videos, "高股息ETF 7日日均觀看排行前12名")
-                    tip_message = TextMessage(text="💡 試試其他分類：", quick_reply=create_quick_reply())
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[carousel, TextMessage(text=text_list), tip_message]
-                        )
-                    )
-                else:
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[TextMessage(
-                                text="🔍 目前沒有找到符合條件的高股息ETF影片，可能是：\n1. YouTube API配額已用完\n2. 近期沒有熱門高股息ETF影片\n\n請稍後再試或選擇其他分類！",
-                                quick_reply=create_quick_reply()
-                            )]
-                        )
-                    )
-            except Exception as e:
-                print(f"高股息ETF搜尋錯誤: {e}")
-                line_bot_api.push_message(
-                    PushMessageRequest(
-                        to=event.source.user_id,
-                        messages=[TextMessage(
-                            text="⚠️ 搜尋時發生錯誤，請稍後再試或選擇其他分類！",
-                            quick_reply=create_quick_reply()
-                        )]
-                    )
-                )
+    # 優先使用預先計算的快照，同一快照版本的訊息只渲染一次
+    try:
+        videos, version = get_ranking_videos(ranking_key)
+        if videos:
+            return rendered_messages.get_or_render(
+                ranking_key, version, lambda: render_ranking_messages(ranking_key, videos))
+        return [TextMessage(text=spec['empty_text'], quick_reply=create_quick_reply())]
+    except Exception as e:
+        print(f"{spec['error_log']}: {e}")
+        return [TextMessage(text=spec['error_text'], quick_reply=create_quick_reply())]
+
+def send_ranking(event, ranking_key):
+    """送出排行結果（各分類共用）
+
+    排行在 REPLY_FAST_PATH_DEADLINE 秒內取得時直接以 reply 送出（不消耗 push 額度）；
+    否則先回覆搜尋中訊息，取得結果後再推送（同一排行同時等待的使用者合併成 multicast）。
+    """
+    spec = RANKINGS[ranking_key]
+    # 同一排行已有等待推送的批次時共用它的查詢，避免冷排行的大量請求塞滿 ranking_lookups
+    lookup = push_coalescer.pending_lookup(ranking_key) or ranking_lookups.submit(build_ranking_messages, ranking_key)
+    try:
+        messages = lookup.result(timeout=REPLY_FAST_PATH_DEADLINE)
+    except TimeoutError:
+        CACHE_LOOKUPS.inc(cache='reply_fast_path', ranking=ranking_key, result='miss')
+    else:
+        CACHE_LOOKUPS.inc(cache='reply_fast_path', ranking=ranking_key, result='hit')
+        line_delivery.reply(event.reply_token, messages, ranking=ranking_key, fallback_to=event.source.user_id)
+        return
+
+    # 回覆用戶正在處理中（在背景送出），結果排在搜尋中訊息之後推送
+    replied = line_delivery.reply(event.reply_token, [TextMessage(text=spec['searching_text'])],
+                                  ranking=ranking_key, fallback_to=event.source.user_id)
+    push_coalescer.push(ranking_key, event.source.user_id, lookup, after=replied)
 
-        elif '陸股' in user_message or '陸股etf' in user_message or '中國' in user_message:
-            # 立即回覆用戶正在處理中
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text="🔍 搜尋7日內陸股ETF日均觀看排行中，請稍候...")]
-                )
-            )
+@app.route("/webhook", methods=['POST'])
+def callback():
+    signature = request.headers['X-Line-Signature']
+    body = request.get_data(as_text=True)
 
-            # 執行耗時的搜尋操作
-            try:
-                videos = youtube_bot.get_etf_videos_by_category('china_stock', hours_ago=168, max_results=12)
-                if videos:
-                    carousel = create_engagement_carousel(videos, "陸股ETF 7日日均觀看排行前12名")
-                    text_list = create_text_list(videos, "陸股ETF 7日日均觀看排行前12名")
-                    tip_message = TextMessage(text="💡 試試其他分類：", quick_reply=create_quick_reply())
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[carousel, TextMessage(text=text_list), tip_message]
-                        )
-                    )
-                else:
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[TextMessage(
-                                text="🔍 目前沒有找到符合條件的陸股ETF影片，可能是：\n1. YouTube API配額已用完\n2. 近期沒有熱門陸股ETF影片\n\n請稍後再試或選擇其他分類！",
-                                quick_reply=create_quick_reply()
-                            )]
-                        )
-                    )
-            except Exception as e:
-                print(f"陸股ETF搜尋錯誤: {e}")
-                line_bot_api.push_message(
-                    PushMessageRequest(
-                        to=event.source.user_id,
-                        messages=[TextMessage(
-                            text="⚠️ 搜尋時發生錯誤，請稍後再試或選擇其他分類！",
-                            quick_reply=create_quick_reply()
-                        )]
-                    )
-                )
+    # 在請求中驗證簽章並解析事件，事件交給背景工作佇列處理後立即回應
+    try:
+        events = parser.parse(body, signature)
+    except InvalidSignatureError:
+        abort(400)
 
-        elif 'ETF日均觀看排行' in user_message or '互動' in user_message or 'engagement' in user_message:
-            # 立即回覆用戶正在處理中
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text="🔍 搜尋3日內ETF日均觀看排行中，請稍候...")]
-                )
-            )
+    if not webhook_workers.submit(events):
+        print(f"webhook 工作佇列已滿（{WEBHOOK_QUEUE_SIZE}），暫時拒絕請求")
+        abort(503)
 
-            # 執行耗時的搜尋操作
-            try:
-                videos = youtube_bot.get_etf_videos_by_engagement(hours_ago=72, max_results=12)
-                if videos:
-                    carousel = create_engagement_carousel(videos, "ETF 3日日均觀看排行前12名 (含互動比率)")
-                    text_list = create_text_list(videos, "ETF 3日日均觀看排行前12名")
-                    search_info = TextMessage(text="🔍 已完成搜尋3日內ETF影片，按日均觀看次數排序")
-                    tip_message = TextMessage(text="💡 試試其他分類：", quick_reply=create_quick_reply())
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[carousel, TextMessage(text=text_list), search_info, tip_message]
-                        )
-                    )
-                else:
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[TextMessage(
-                                text="🔍 目前沒有找到符合條件的ETF影片，可能是：\n1. YouTube API配額已用完\n2. 近期沒有熱門ETF影片\n\n請稍後再試或選擇其他分類！",
-                                quick_reply=create_quick_reply()
-                            )]
-                        )
-                    )
-            except Exception as e:
-                print(f"ETF日均觀看搜尋錯誤: {e}")
-                line_bot_api.push_message(
-                    PushMessageRequest(
-                        to=event.source.user_id,
-                        messages=[TextMessage(
-                            text="⚠️ 搜尋時發生錯誤，請稍後再試或選擇其他分類！",
-                            quick_reply=create_quick_reply()
-                        )]
-                    )
-                )
+    return 'OK'
 
+@app.route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 格式的指標（只包含回應這個請求的 worker）"""
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
-        elif '教育頻道' in user_message or '教育' in user_message:
-            # 立即回覆用戶正在處理中
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text="🔍 搜尋3日內教育分類日均觀看排行中，請稍候...")]
-                )
-            )
+GREETING_TEXT = """🤖 YouTube ETF 搜尋機器人
+我可以幫你搜尋最新的台灣ETF相關影片！
 
-            # 執行耗時的搜尋操作
-            try:
-                videos = youtube_bot.get_etf_videos_by_special_categories(hours_ago=72, max_results=12)
-                if videos:
-                    carousel = create_engagement_carousel(videos, "教育分類 3日日均觀看排行前12名 (新聞+教育)")
-                    text_list = create_text_list(videos, "教育分類 3日日均觀看排行前12名")
-                    tip_message = TextMessage(text="💡 試試其他分類：", quick_reply=create_quick_reply())
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[carousel, TextMessage(text=text_list), tip_message]
-                        )
-                    )
-                else:
-                    line_bot_api.push_message(
-                        PushMessageRequest(
-                            to=event.source.user_id,
-                            messages=[TextMessage(
-                                text="🔍 目前沒有找到符合條件的教育頻道影片，可能是：\n1. YouTube API配額已用完\n2. 教育分類中近期沒有相關影片\n3. 地區限制問題\n\n請稍後再試或選擇其他分類！",
-                                quick_reply=create_quick_reply()
-                            )]
-                        )
-                    )
-            except Exception as e:
-                print(f"教育頻道搜尋錯誤: {e}")
-                line_bot_api.push_message(
-                    PushMessageRequest(
-                        to=event.source.user_id,
-                        messages=[TextMessage(
-                            text="⚠️ 教育頻道搜尋時發生錯誤，請稍後再試或選擇其他分類！",
-                            quick_reply=create_quick_reply()
-                        )]
-                    )
-                )
+📱 使用方式：
+• 「ETF日均觀看排行」- 2日內日均觀看次數最高的ETF影片
+• 各類ETF分類選項- 7日內日均觀看排行
+• 「教育分類」- 2日內教育頻道熱門影片
+• 「說明」- 查看詳細說明
+"""
 
-        elif '說明' in user_message or 'help' in user_message:
-            help_text = """📖 功能說明
+HELP_TEXT = """📖 功能說明
 
 🔍 搜尋功能：
 • ETF日均觀看排行：按日均觀看次數排序
@@ -1198,25 +2796,42 @@ def handle_message(event):
 點擊下方按鈕或輸入「ETF日均觀看排行」即可快速搜尋！
 
 🤖 隨時輸入「嗨」重新開始！"""
-            
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text=help_text, quick_reply=create_quick_reply())]
-                )
-            )
 
+UNKNOWN_COMMAND_TEXT = "🤖 請選擇以下功能或輸入「說明」查看使用方式！"
+
+# 使用者訊息的意圖表：依序排列（同時命中多個意圖時取最前面的），關鍵字以小寫比對
+# 意圖帶 ranking 時送出該排行，帶 reply_text 時直接回覆文字；新增分類只需加一筆
+MESSAGE_INTENTS = OrderedDict([
+    ('greeting', {'keywords': ['嗨', 'hi', 'hello', '你好', '開始'], 'reply_text': GREETING_TEXT}),
+    ('active', {'keywords': ['主動式'], 'ranking': 'active'}),
+    ('allocation', {'keywords': ['資產配置'], 'ranking': 'allocation'}),
+    ('market_cap', {'keywords': ['市值型'], 'ranking': 'market_cap'}),
+    ('dividend', {'keywords': ['高股息'], 'ranking': 'dividend'}),
+    ('china_stock', {'keywords': ['陸股', '中國'], 'ranking': 'china_stock'}),
+    ('engagement', {'keywords': ['ETF日均觀看排行', '互動', 'engagement'], 'ranking': 'engagement'}),
+    ('education', {'keywords': ['教育'], 'ranking': 'education'}),
+    ('help', {'keywords': ['說明', 'help'], 'reply_text': HELP_TEXT}),
+])
+INTENT_PRIORITY = {intent: index for index, intent in enumerate(MESSAGE_INTENTS)}
+INTENT_KEYWORDS = KeywordMatcher({
+    intent: [keyword.lower() for keyword in spec['keywords']] for intent, spec in MESSAGE_INTENTS.items()
+})
+
+def resolve_intent(text):
+    """掃描一次訊息文字，回傳優先順序最高的意圖（沒有命中時為 None）"""
+    hits = INTENT_KEYWORDS.scan(text.lower())
+    return min(hits, key=INTENT_PRIORITY.__getitem__) if hits else None
+
+def handle_message(event):
+    intent = resolve_intent(event.message.text)
+    
+    try:
+        spec = MESSAGE_INTENTS.get(intent, {'reply_text': UNKNOWN_COMMAND_TEXT})
+        if 'ranking' in spec:
+            send_ranking(event, spec['ranking'])
         else:
-            # 未識別的指令，提示用戶
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(
-                        text="🤖 請選擇以下功能或輸入「說明」查看使用方式！",
-                        quick_reply=create_quick_reply()
-                    )]
-                )
-            )
+            line_delivery.reply(event.reply_token, [TextMessage(text=spec['reply_text'], quick_reply=create_quick_reply())],
+                                fallback_to=event.source.user_id)
 
     except Exception as e:
         print(f"處理訊息錯誤: {e}")
@@ -1248,6 +2863,7 @@ def handle_message(event):
 
 if __name__ == "__main__":
     # 開發環境
+    start_background_services()
     app.run(host="0.0.0.0", port=5000, debug=True)
     
     # 生產環境 (使用 gunicorn)
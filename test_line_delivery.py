@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+推送合併（PushCoalescer）與 LINE multicast 的單元測試
+以同步模式的 LineDelivery（enabled=False）加上替換掉的 _call_api 執行，不會呼叫 LINE API
+
+用法：
+    python -m pytest -q test_line_delivery.py
+"""
+
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+from types import SimpleNamespace
+from unittest import mock
+
+import line_bot_youtube as bot_module
+
+
+class RecordingDelivery(bot_module.LineDelivery):
+    """同步送出並記錄每次 API 呼叫的 (path, body)"""
+
+    def __init__(self):
+        super().__init__(enabled=False)
+        self.calls = []
+        self._calls_lock = threading.Lock()
+
+    def _call_api(self, messaging_api, path, body):
+        with self._calls_lock:
+            self.calls.append((path, body))
+
+    def wait_for_calls(self, count, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._calls_lock:
+                if len(self.calls) >= count:
+                    return list(self.calls)
+            time.sleep(0.005)
+        return list(self.calls)
+
+
+def done_future(result=None):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class PushCoalescerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.delivery = RecordingDelivery()
+        self.coalescer = bot_module.PushCoalescer(self.delivery, window=0.05)
+        self.messages = [bot_module.TextMessage(text='排行結果')]
+
+    def test_pending_users_share_one_multicast(self):
+        lookup = Future()
+        for user_id in ('U1', 'U2', 'U1', 'U3'):
+            self.coalescer.push('dividend', user_id, self.coalescer.pending_lookup('dividend') or lookup)
+        self.assertIs(self.coalescer.pending_lookup('dividend'), lookup)
+
+        # 查詢完成前批次保持開放，不會送出
+        time.sleep(0.1)
+        self.assertEqual(self.delivery.calls, [])
+
+        lookup.set_result(self.messages)
+        calls = self.delivery.wait_for_calls(1)
+        self.assertEqual(len(calls), 1)
+        path, body = calls[0]
+        self.assertEqual(path, '/v2/bot/message/multicast')
+        self.assertEqual(body['to'], ['U1', 'U2', 'U3'])
+        self.assertEqual(body['messages'], bot_module.serialize_messages(self.messages))
+        self.assertIsNone(self.coalescer.pending_lookup('dividend'))
+
+    def test_single_recipient_uses_push(self):
+        self.coalescer.push('active', 'U1', done_future(self.messages))
+        calls = self.delivery.wait_for_calls(1)
+        self.assertEqual([(path, body['to']) for path, body in calls], [('/v2/bot/message/push', 'U1')])
+
+    def test_rankings_are_batched_separately(self):
+        self.coalescer.push('active', 'U1', done_future(self.messages))
+        self.coalescer.push('education', 'U2', done_future(self.messages))
+        calls = self.delivery.wait_for_calls(2)
+        self.assertEqual(sorted(body['to'] for _, body in calls), ['U1', 'U2'])
+
+    def test_multicast_waits_for_every_previous_reply(self):
+        replied = [Future(), Future()]
+        self.coalescer.push('engagement', 'U1', done_future(self.messages), after=replied[0])
+        self.coalescer.push('engagement', 'U2', done_future(self.messages), after=replied[1])
+
+        replied[0].set_result(None)
+        time.sleep(0.1)
+        self.assertEqual(self.delivery.calls, [])
+
+        # 回覆失敗也不影響之後的推送
+        replied[1].set_exception(RuntimeError('reply failed'))
+        calls = self.delivery.wait_for_calls(1)
+        self.assertEqual([body['to'] for _, body in calls], [['U1', 'U2']])
+
+    def test_multicast_splits_recipients_into_chunks(self):
+        recipients = [f"U{i}" for i in range(bot_module.MULTICAST_MAX_RECIPIENTS * 2 + 1)]
+        futures = self.delivery.multicast(recipients, self.messages)
+        for future in futures:
+            future.result(timeout=1)
+
+        chunks = [body['to'] for _, body in self.delivery.calls]
+        self.assertEqual([len(chunk) for chunk in chunks],
+                         [bot_module.MULTICAST_MAX_RECIPIENTS, bot_module.MULTICAST_MAX_RECIPIENTS, 1])
+        self.assertEqual([user_id for chunk in chunks for user_id in chunk], recipients)
+        # 訊息只序列化一次，所有批次共用
+        payloads = {id(body['messages']) for _, body in self.delivery.calls}
+        self.assertEqual(len(payloads), 1)
+
+    def test_zero_window_pushes_each_user(self):
+        coalescer = bot_module.PushCoalescer(self.delivery, window=0)
+        coalescer.push('dividend', 'U1', done_future(self.messages))
+        coalescer.push('dividend', 'U2', done_future(self.messages))
+        self.assertEqual([(path, body['to']) for path, body in self.delivery.calls],
+                         [('/v2/bot/message/push', 'U1'), ('/v2/bot/message/push', 'U2')])
+
+
+class SendRankingTest(unittest.TestCase):
+
+    def test_joins_pending_batch_without_new_lookup(self):
+        delivery = RecordingDelivery()
+        coalescer = bot_module.PushCoalescer(delivery, window=0.05)
+        lookup = Future()
+        coalescer.push('dividend', 'U1', lookup)
+
+        event = SimpleNamespace(reply_token='token', source=SimpleNamespace(user_id='U2'))
+        with mock.patch.object(bot_module, 'push_coalescer', coalescer), \
+                mock.patch.object(bot_module, 'line_delivery', delivery), \
+                mock.patch.object(bot_module, 'REPLY_FAST_PATH_DEADLINE', 0.01), \
+                mock.patch.object(bot_module.ranking_lookups, 'submit') as submit:
+            bot_module.send_ranking(event, 'dividend')
+        submit.assert_not_called()
+
+        lookup.set_result([bot_module.TextMessage(text='排行結果')])
+        calls = delivery.wait_for_calls(2)
+        self.assertEqual([(path, body.get('to')) for path, body in calls],
+                         [('/v2/bot/message/reply', None), ('/v2/bot/message/multicast', ['U1', 'U2'])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+YouTube API 配額帳本（QuotaLedger）的單元測試：太平洋時間每日歸零、透過檔案共用與保存、預扣配額的原子性
+
+用法：
+    python -m pytest -q test_quota_ledger.py
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import line_bot_youtube as bot_module
+
+
+class QuotaLedgerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.day = '2024-06-01'
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'quota.json')
+
+    def make_ledger(self, path=None, daily_limit=1000):
+        ledger = bot_module.QuotaLedger(path=path, daily_limit=daily_limit, low_watermark=300)
+        # 以替換的 _today 代表目前的太平洋時間日期
+        ledger._today = lambda: self.day
+        return ledger
+
+    def test_reserve_until_limit(self):
+        ledger = self.make_ledger()
+        for _ in range(10):
+            self.assertTrue(ledger.reserve('search'))
+        self.assertFalse(ledger.reserve('search'))
+        self.assertFalse(ledger.reserve('videos'))
+        stats = ledger.stats()
+        self.assertEqual((stats['used'], stats['remaining']), (1000, 0))
+        self.assertEqual(stats['calls'], {'search': 10})
+
+    def test_resets_on_new_pacific_day(self):
+        ledger = self.make_ledger(self.path)
+        for _ in range(8):
+            ledger.reserve('search')
+        self.assertTrue(ledger.is_low())
+
+        self.day = '2024-06-02'
+        self.assertEqual(ledger.remaining(), 1000)
+        self.assertFalse(ledger.is_low())
+        self.assertEqual(ledger.stats()['date'], '2024-06-02')
+
+    def test_pacific_date_is_used_for_the_day(self):
+        with mock.patch.object(bot_module, 'datetime', wraps=bot_module.datetime) as fake_datetime:
+            bot_module.QuotaLedger._today()
+        self.assertEqual(str(fake_datetime.now.call_args[0][0]), 'America/Los_Angeles')
+
+    def test_state_persists_through_file(self):
+        ledger = self.make_ledger(self.path)
+        ledger.reserve('search')
+        ledger.reserve('videos')
+
+        # 另一個 worker（或重新啟動後）以同一個檔案建立的帳本看到相同用量
+        other = self.make_ledger(self.path)
+        self.assertEqual(other.used(), 101)
+        other.mark_exhausted()
+        self.assertEqual(ledger.remaining(), 0)
+
+    def test_corrupt_file_starts_from_current_state(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{not json')
+        ledger = self.make_ledger(self.path)
+        self.assertTrue(ledger.reserve('search'))
+        self.assertEqual(self.make_ledger(self.path).used(), 100)
+
+    def test_reserve_is_atomic_across_ledgers(self):
+        ledgers = [self.make_ledger(self.path) for _ in range(2)]
+        results = []
+        results_lock = threading.Lock()
+
+        def worker(ledger):
+            for _ in range(10):
+                reserved = ledger.reserve('search')
+                with results_lock:
+                    results.append(reserved)
+
+        threads = [threading.Thread(target=worker, args=(ledgers[i % 2],)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 10)
+        self.assertEqual(self.make_ledger(self.path).used(), 1000)
+
+    def test_remaining_gauge_on_metrics(self):
+        ledger = self.make_ledger()
+        ledger.reserve('search')
+        with mock.patch.object(bot_module.youtube_bot, 'quota', ledger):
+            rendered = bot_module.metrics.render()
+        self.assertIn('# TYPE etf_bot_youtube_quota_remaining gauge', rendered)
+        self.assertIn('etf_bot_youtube_quota_remaining 900\n', rendered)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+排行結果快取（RankingCache）的單元測試：每筆的 TTL、LRU 淘汰、過期資料的可用期限與背景更新權
+
+用法：
+    python -m pytest -q test_ranking_cache.py
+"""
+
+import unittest
+from unittest import mock
+
+import line_bot_youtube as bot_module
+
+
+class FakeClock:
+    """取代 time.monotonic 的可調整時鐘"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class RankingCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(bot_module.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = bot_module.RankingCache(max_entries=2, ttl=60, stale_ttl=300)
+
+    def test_fresh_within_ttl(self):
+        self.cache.set('dividend', ['v1'])
+        self.clock.now += 60
+        self.assertEqual(self.cache.get('dividend'), (['v1'], True))
+
+    def test_expired_entry_is_served_during_stale_window(self):
+        self.cache.set('dividend', ['v1'])
+        self.clock.now += 61
+        self.assertEqual(self.cache.get('dividend'), (['v1'], False))
+        self.clock.now += 299
+        self.assertEqual(self.cache.get('dividend'), (['v1'], False))
+
+    def test_entry_past_stale_window_is_dropped_unless_allowed(self):
+        self.cache.set('dividend', ['v1'])
+        self.clock.now += 361
+        self.assertEqual(self.cache.get('dividend'), (None, False))
+        # 配額不足時仍回傳舊資料
+        self.assertEqual(self.cache.get('dividend', allow_expired=True), (['v1'], False))
+
+    def test_per_key_ttl(self):
+        self.cache.set('short', ['v1'], ttl=10)
+        self.cache.set('default', ['v2'])
+        self.clock.now += 30
+        self.assertEqual(self.cache.get('short'), (['v1'], False))
+        self.assertEqual(self.cache.get('default'), (['v2'], True))
+
+    def test_missing_key(self):
+        self.assertEqual(self.cache.get('missing'), (None, False))
+
+    def test_lru_eviction_keeps_recently_read_entries(self):
+        self.cache.set('a', ['a'])
+        self.cache.set('b', ['b'])
+        self.cache.get('a')  # a 變成最近使用
+        self.cache.set('c', ['c'])
+        self.assertEqual(self.cache.get('b'), (None, False))
+        self.assertEqual(self.cache.get('a'), (['a'], True))
+        self.assertEqual(self.cache.get('c'), (['c'], True))
+
+    def test_set_replaces_value_and_restarts_ttl(self):
+        self.cache.set('dividend', ['old'])
+        self.clock.now += 100
+        self.cache.set('dividend', ['new'])
+        self.assertEqual(self.cache.get('dividend'), (['new'], True))
+
+    def test_one_background_refresh_per_key(self):
+        self.assertTrue(self.cache.try_begin_refresh('dividend'))
+        self.assertFalse(self.cache.try_begin_refresh('dividend'))
+        self.assertTrue(self.cache.try_begin_refresh('active'))
+        self.cache.end_refresh('dividend')
+        self.assertTrue(self.cache.try_begin_refresh('dividend'))
+
+    def test_clear(self):
+        self.cache.set('dividend', ['v1'])
+        self.cache.clear()
+        self.assertEqual(self.cache.get('dividend'), (None, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
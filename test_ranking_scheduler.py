@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+排行排程（RankingScheduler）的單元測試：重新啟動後第一輪的分散執行與執行前的配額檢查
+以替換掉的 fetch_ranking 與不寫檔的快照、配額帳本執行，不會呼叫 YouTube API
+
+用法：
+    python -m pytest -q test_ranking_scheduler.py
+"""
+
+import unittest
+from unittest import mock
+
+import line_bot_youtube as bot_module
+
+
+class RankingSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1_700_000_000.0
+        self.fetched = []
+        self.quota = bot_module.QuotaLedger(path=None, daily_limit=10000, low_watermark=2000)
+
+        def fetch_ranking(ranking_key, refresh=False):
+            self.fetched.append(ranking_key)
+            return [{'video_id': ranking_key}]
+
+        for patcher in (
+                mock.patch.object(bot_module.time, 'time', lambda: self.now),
+                mock.patch.object(bot_module, 'fetch_ranking', fetch_ranking),
+                mock.patch.object(bot_module.youtube_bot, 'quota', self.quota)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.store = bot_module.RankingSnapshotStore(path=None)
+        self.scheduler = bot_module.RankingScheduler(self.store, lock_path=None)
+
+    def test_first_cycle_is_spread_over_startup_window(self):
+        rankings = list(bot_module.RANKINGS)
+        step = bot_module.RANKING_SCHEDULER_STARTUP_SPREAD / len(rankings)
+
+        next_due = self.scheduler.run_due_rankings()
+        # 沒有快照時更新間隔較短的 3日排行最先到期
+        self.assertEqual(self.fetched, ['engagement'])
+        self.assertAlmostEqual(next_due, self.now + step)
+
+        for _ in range(len(rankings) - 1):
+            self.now = next_due
+            next_due = self.scheduler.run_due_rankings()
+        self.assertEqual(sorted(self.fetched), sorted(rankings))
+        self.assertEqual(self.fetched[:2], ['engagement', 'education'])
+
+    def test_skips_rankings_the_quota_cannot_cover(self):
+        # 剩餘 2500 單位：扣除 3日排行的預估成本會低於門檻，7日主題排行（約 400 單位）仍可執行
+        self.quota.daily_limit = 2500
+        with mock.patch.object(bot_module, 'RANKING_SCHEDULER_STARTUP_SPREAD', 0):
+            self.scheduler.run_due_rankings()
+        self.assertEqual(self.fetched, ['active', 'allocation', 'market_cap', 'dividend', 'china_stock'])
+        self.assertIsNone(self.store.get('engagement'))
+
+    def test_universe_rankings_share_one_schedule(self):
+        group = ['active', 'allocation', 'market_cap', 'dividend', 'china_stock', 'engagement']
+        with mock.patch.object(bot_module.youtube_bot, 'universe', True), \
+                mock.patch.object(bot_module, 'RANKING_SCHEDULER_STARTUP_SPREAD', 0):
+            self.scheduler.run_due_rankings()
+            self.assertEqual(sorted(self.fetched), sorted(bot_module.RANKINGS))
+
+            # 7日主題排行跟著 3日排行的更新間隔，與 ETF 日均觀看排行一起更新
+            self.fetched.clear()
+            self.now += bot_module.RANKING_REFRESH_INTERVAL_SHORT
+            self.scheduler.run_due_rankings()
+            self.assertEqual(self.fetched, group + ['education'])
+            self.fetched.clear()
+            self.now += bot_module.RANKING_REFRESH_INTERVAL_SHORT - 60
+            self.scheduler.run_due_rankings()
+            self.assertEqual(self.fetched, [])
+
+            # 其中一個排行到期時（例如手動清除快照），其他共用候選影片池的排行一起更新
+            self.fetched.clear()
+            self.store._snapshot['rankings'].pop('dividend')
+            self.scheduler.run_due_rankings()
+            self.assertEqual(self.fetched, group)
+
+    def test_estimated_full_refresh_cost(self):
+        costs = {key: bot_module.estimate_ranking_cost(key) for key in bot_module.RANKINGS}
+        self.assertEqual(costs['engagement'], 802)
+        self.assertEqual(costs['education'], 1001)
+        self.assertEqual(costs['dividend'], 401)
+        self.assertEqual(sum(costs.values()), 3808)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+增量搜尋（SearchWindow 與 YouTubeETFBot._incremental_video_ids）的單元測試：高水位合併、過期影片移除與搜尋間隔
+
+用法：
+    python -m pytest -q test_search_window.py
+"""
+
+import unittest
+from unittest import mock
+
+import line_bot_youtube as bot_module
+
+
+class SearchWindowTest(unittest.TestCase):
+
+    def test_full_merge_sets_watermark_and_times(self):
+        window = bot_module.SearchWindow()
+        window.merge([('a', '2024-06-01T01:00:00Z'), ('b', '2024-06-01T03:00:00Z')], True, 100)
+        self.assertEqual(window.videos, {'a': '2024-06-01T01:00:00Z', 'b': '2024-06-01T03:00:00Z'})
+        self.assertEqual(window.watermark, '2024-06-01T03:00:00Z')
+        self.assertEqual((window.searched_at, window.full_searched_at), (100, 100))
+
+    def test_incremental_merge_keeps_previous_videos(self):
+        window = bot_module.SearchWindow()
+        window.merge([('a', '2024-06-01T01:00:00Z'), ('b', '2024-06-01T03:00:00Z')], True, 100)
+        window.merge([('c', '2024-06-01T05:00:00Z'), ('b', '2024-06-01T03:00:00Z')], False, 200)
+        self.assertEqual(list(window.videos), ['a', 'b', 'c'])
+        self.assertEqual(window.watermark, '2024-06-01T05:00:00Z')
+        # 高水位搜尋不更新完整搜尋時間
+        self.assertEqual((window.searched_at, window.full_searched_at), (200, 100))
+
+    def test_watermark_never_moves_back(self):
+        window = bot_module.SearchWindow()
+        window.merge([('b', '2024-06-01T03:00:00Z')], True, 100)
+        window.merge([('a', '2024-06-01T01:00:00Z')], False, 200)
+        self.assertEqual(window.watermark, '2024-06-01T03:00:00Z')
+        window.merge([], False, 300)
+        self.assertEqual(window.watermark, '2024-06-01T03:00:00Z')
+        self.assertEqual(window.searched_at, 300)
+
+    def test_full_merge_replaces_videos(self):
+        window = bot_module.SearchWindow()
+        window.merge([('a', '2024-06-01T01:00:00Z')], True, 100)
+        window.merge([('b', '2024-06-01T02:00:00Z')], True, 200)
+        self.assertEqual(list(window.videos), ['b'])
+        self.assertEqual(window.full_searched_at, 200)
+
+    def test_expire_drops_videos_before_window(self):
+        window = bot_module.SearchWindow()
+        window.merge([('a', '2024-06-01T01:00:00Z'), ('b', '2024-06-01T03:00:00Z'),
+                      ('c', '2024-06-01T05:00:00Z')], True, 100)
+        window.expire('2024-06-01T03:00:00Z')
+        self.assertEqual(list(window.videos), ['b', 'c'])
+        window.expire('2024-06-02T00:00:00Z')
+        self.assertEqual(window.videos, {})
+        # 過期不影響高水位，下一次增量搜尋仍從最新的發布時間開始
+        self.assertEqual(window.watermark, '2024-06-01T05:00:00Z')
+
+
+class IncrementalSearchTest(unittest.TestCase):
+    """以替換的 _search_videos 與時鐘檢查每次排程更新是否呼叫 search().list"""
+
+    def setUp(self):
+        self.now = 1_700_000_000.0
+        self.searches = []
+        patcher = mock.patch.object(bot_module.time, 'time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.bot = bot_module.YouTubeETFBot('offline', incremental=True)
+
+        def search_videos(query, published_after, category_search, max_results=None):
+            self.searches.append(published_after)
+            return [(f"v{len(self.searches)}", '2024-06-01T0%d:00:00Z' % len(self.searches))]
+
+        self.bot._search_videos = search_videos
+
+    def refresh(self, hours_ago=72):
+        return self.bot._incremental_video_ids('ETF', '2024-06-01T00:00:00Z', hours_ago, False)
+
+    def test_searches_every_n_scheduler_refreshes(self):
+        interval = bot_module.ranking_refresh_interval(72)
+        every = bot_module.YOUTUBE_INCREMENTAL_SEARCH_EVERY
+        full_every = bot_module.YOUTUBE_INCREMENTAL_FULL_EVERY
+        refreshes = every * full_every + 1
+
+        searched = []
+        for _ in range(refreshes):
+            before = len(self.searches)
+            video_ids = self.refresh()
+            searched.append(len(self.searches) > before)
+            # 排程器在上一次更新完成後（這裡多 60 秒的執行時間）經過更新間隔再執行
+            self.now += interval + 60
+
+        self.assertEqual(searched, [i % every == 0 for i in range(refreshes)])
+        # 第 every 次更新是高水位搜尋，之後第 every * full_every 次更新重新搜尋完整範圍
+        self.assertEqual(self.searches[0], '2024-06-01T00:00:00Z')
+        self.assertEqual(self.searches[1], '2024-06-01T01:00:00Z')
+        self.assertEqual(self.searches[full_every], '2024-06-01T00:00:00Z')
+        self.assertEqual(video_ids, [f"v{len(self.searches)}"])
+
+    def test_long_rankings_use_the_long_interval(self):
+        self.refresh(hours_ago=168)
+        self.now += bot_module.ranking_refresh_interval(72) * bot_module.YOUTUBE_INCREMENTAL_SEARCH_EVERY
+        self.refresh(hours_ago=168)
+        self.assertEqual(len(self.searches), 1)
+        self.now += bot_module.ranking_refresh_interval(168) * bot_module.YOUTUBE_INCREMENTAL_SEARCH_EVERY
+        self.refresh(hours_ago=168)
+        self.assertEqual(len(self.searches), 2)
+
+    def test_failed_search_keeps_window(self):
+        self.refresh()
+        self.now += bot_module.ranking_refresh_interval(72) * bot_module.YOUTUBE_INCREMENTAL_SEARCH_EVERY
+
+        def failing_search(*args, **kwargs):
+            raise RuntimeError('quota')
+
+        self.bot._search_videos = failing_search
+        self.assertEqual(self.refresh(), ['v1'])
+        self.assertEqual(self.bot._search_windows[('ETF', False, 72, None)].watermark, '2024-06-01T01:00:00Z')
+
+
+if __name__ == '__main__':
+    unittest.main()
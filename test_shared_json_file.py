@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+跨 worker 共用的 JSON 檔案狀態（SharedJsonFile 與使用它的 ChannelRegistry）的單元測試
+
+用法：
+    python -m pytest -q test_shared_json_file.py
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+import line_bot_youtube as bot_module
+
+
+class SharedJsonFileTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'state.json')
+
+    def test_updates_from_two_instances_are_merged(self):
+        first = bot_module.SharedJsonFile(self.path, {}, '測試狀態')
+        second = bot_module.SharedJsonFile(self.path, {}, '測試狀態')
+        first.update(lambda state: state.update(a=1))
+        second.update(lambda state: state.update(b=2))
+        self.assertEqual(first.update(), {'a': 1, 'b': 2})
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'a': 1, 'b': 2})
+
+    def test_mutation_returning_false_is_discarded(self):
+        shared = bot_module.SharedJsonFile(self.path, {'count': 0}, '測試狀態')
+
+        def rejected(state):
+            state['count'] = 99
+            return False
+
+        self.assertEqual(shared.update(rejected), {'count': 0})
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_unreadable_file_starts_from_a_copy(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{not json')
+        shared = bot_module.SharedJsonFile(self.path, {'nested': {'hits': 1}}, '測試狀態')
+        before = shared.update()
+
+        def rejected(state):
+            state['nested']['hits'] += 1
+            return False
+
+        shared.update(rejected)
+        # 讀取失敗時使用的記憶體狀態不會被修改
+        self.assertEqual(before, {'nested': {'hits': 1}})
+        self.assertEqual(shared.update(), {'nested': {'hits': 1}})
+
+    def test_in_memory_without_path(self):
+        shared = bot_module.SharedJsonFile(None, {}, '測試狀態')
+        shared.update(lambda state: state.update(a=1))
+        self.assertEqual(shared.update(), {'a': 1})
+
+    def test_prepare_replaces_loaded_state(self):
+        shared = bot_module.SharedJsonFile(self.path, {'version': 1}, '測試狀態')
+        shared.update(lambda state: state.update(value='old'))
+        state = shared.update(prepare=lambda state: {'version': 2})
+        self.assertEqual(state, {'version': 2})
+
+
+class ChannelRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'channels.json')
+
+    def test_hits_from_workers_are_merged(self):
+        workers = [bot_module.ChannelRegistry(self.path, min_hits=2) for _ in range(2)]
+        video = {'channel_id': 'UC1', 'channel_title': '頻道'}
+        workers[0].record([video])
+        self.assertEqual(workers[1].channels(), [])
+        workers[1].record([video, video])
+        self.assertEqual(workers[0].channels(), ['UC1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
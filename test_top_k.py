@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+串流式前K名選取（TopKSelector）的單元測試：同分順序、video_id 去重與淘汰
+
+用法：
+    python -m pytest -q test_top_k.py
+"""
+
+import unittest
+
+import line_bot_youtube as bot_module
+
+
+def video(video_id, score):
+    return {'video_id': video_id, 'view_per_day': score}
+
+
+def ids(videos):
+    return [v['video_id'] for v in videos]
+
+
+class TopKSelectorTest(unittest.TestCase):
+
+    def make_selector(self, k):
+        return bot_module.TopKSelector(k, lambda v: v['view_per_day'])
+
+    def test_matches_stable_sort(self):
+        videos = [video(f"v{i}", score) for i, score in enumerate([5, 1, 9, 5, 3, 9, 0, 7])]
+        selector = self.make_selector(4)
+        selector.extend(videos)
+        expected = sorted(videos, key=lambda v: v['view_per_day'], reverse=True)[:4]
+        self.assertEqual(selector.results(), expected)
+
+    def test_ties_keep_first_added_order(self):
+        selector = self.make_selector(3)
+        selector.extend([video('a', 1), video('b', 2), video('c', 2), video('d', 2)])
+        self.assertEqual(ids(selector.results()), ['b', 'c', 'd'])
+
+    def test_tie_does_not_evict_earlier_video(self):
+        selector = self.make_selector(2)
+        selector.extend([video('a', 2), video('b', 2), video('c', 2)])
+        self.assertEqual(ids(selector.results()), ['a', 'b'])
+
+    def test_duplicate_video_id_is_kept_once_with_latest_data(self):
+        selector = self.make_selector(3)
+        selector.extend([video('a', 1), video('b', 2), video('a', 5)])
+        results = selector.results()
+        self.assertEqual(ids(results), ['a', 'b'])
+        self.assertEqual(results[0]['view_per_day'], 5)
+
+    def test_readded_video_keeps_first_added_order_for_ties(self):
+        selector = self.make_selector(3)
+        selector.extend([video('a', 1), video('b', 3), video('a', 3)])
+        self.assertEqual(ids(selector.results()), ['a', 'b'])
+
+    def test_evicts_lowest_scores(self):
+        selector = self.make_selector(2)
+        for i, score in enumerate([3, 1, 4, 1, 5]):
+            selector.add(video(f"v{i}", score))
+            self.assertLessEqual(len(selector.results()), 2)
+        self.assertEqual(ids(selector.results()), ['v4', 'v2'])
+
+    def test_evicted_video_can_reenter_with_higher_score(self):
+        selector = self.make_selector(2)
+        selector.extend([video('a', 1), video('b', 2), video('c', 3), video('a', 10)])
+        self.assertEqual(ids(selector.results()), ['a', 'c'])
+
+    def test_lower_readd_does_not_restore_evicted_video(self):
+        # 文件說明的限制：b 已被淘汰，a 以較低分數重新加入後不會把 b 補回
+        selector = self.make_selector(2)
+        selector.extend([video('a', 10), video('b', 5), video('c', 6), video('a', 1)])
+        self.assertEqual(ids(selector.results()), ['c', 'a'])
+
+    def test_fewer_videos_than_k(self):
+        selector = self.make_selector(5)
+        selector.extend([video('a', 1)])
+        self.assertEqual(ids(selector.results()), ['a'])
+        self.assertEqual(self.make_selector(5).results(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()